@@ -28,6 +28,10 @@ module FunctionalProfileUtil {
       data_epistemology - how was data acquired. one of: measured, asserted, predicted
       epistemology_method - method/program to be used to acquired data. e.g. FAPROTAX, PICRUSt2
       description - description for the profile
+      include_timings - return per-stage timings of the import. default: False
+      storage_mode - one of json (values inline in the object) or columnar (values in a Parquet
+                     file referenced by a handle). default: json, objects too large for JSON are
+                     saved in columnar mode
     */
     typedef structure {
       int workspace_id;
@@ -42,14 +46,141 @@ module FunctionalProfileUtil {
       string data_epistemology;
       string epistemology_method;
       string description;
+      bool include_timings;
+      string storage_mode;
     } ImportFuncProfileParams;
 
+    /*
+      timing of one import stage
+
+      stage - stage name. e.g. download, parse, check_ids, serialize, save, report
+      wall_time - elapsed time in seconds
+      cpu_time - CPU time in seconds of the import process and its finished child processes
+      peak_rss_delta - growth of the peak resident set size in bytes during the stage
+      bytes_in - bytes read by the stage
+      bytes_out - bytes produced by the stage
+
+      @optional bytes_in bytes_out
+    */
+    typedef structure {
+      string stage;
+      float wall_time;
+      float cpu_time;
+      int peak_rss_delta;
+      int bytes_in;
+      int bytes_out;
+    } StageTiming;
+
+    /*
+      timings - stage timings in execution order, only returned if include_timings is set
+
+      @optional timings
+    */
     typedef structure {
       WSRef func_profile_ref;
       string report_name;
       WSRef report_ref;
+      list<StageTiming> timings;
     } ImportFuncProfileResults;
 
     funcdef import_func_profile(ImportFuncProfileParams params) returns (ImportFuncProfileResults returnVal) authentication required;
 
+    /*
+      workspace_id - workspace all FunctionalProfile objects are saved in
+      profiles - profiles to import, see ImportFuncProfileParams. workspace_id, build_report
+                 and include_timings of each profile are ignored
+
+      optional arguments:
+      build_report - build one report for all imported profiles. default: False
+    */
+    typedef structure {
+      int workspace_id;
+      list<ImportFuncProfileParams> profiles;
+
+      bool build_report;
+    } ImportFuncProfilesParams;
+
+    /*
+      func_profile_obj_name - FunctionalProfile object name of the profile
+      func_profile_ref - saved FunctionalProfile object, missing if the import failed
+      error - error message if the import failed
+    */
+    typedef structure {
+      string func_profile_obj_name;
+      WSRef func_profile_ref;
+      string error;
+    } ImportFuncProfileResult;
+
+    /*
+      results - one result per profile, in the order of ImportFuncProfilesParams.profiles
+    */
+    typedef structure {
+      list<ImportFuncProfileResult> results;
+      string report_name;
+      WSRef report_ref;
+    } ImportFuncProfilesResults;
+
+    funcdef import_func_profiles(ImportFuncProfilesParams params) returns (ImportFuncProfilesResults returnVal) authentication required;
+
+    /*
+      func_profile_ref - FunctionalProfile object to export
+      file_format - format of the exported file. one of tsv, parquet or biom (BIOM 2.1 HDF5)
+
+      optional arguments:
+      gzip - gzip compress the exported file. default: False
+    */
+    typedef structure {
+      WSRef func_profile_ref;
+      string file_format;
+
+      bool gzip;
+    } ExportFuncProfileParams;
+
+    /*
+      shock_id - Shock node of the exported file
+      file_name - name of the exported file
+      size - size of the exported file in bytes
+    */
+    typedef structure {
+      string shock_id;
+      string file_name;
+      int size;
+    } ExportFuncProfileOutput;
+
+    funcdef export_func_profile(ExportFuncProfileParams params) returns (ExportFuncProfileOutput returnVal) authentication required;
+
+
+    /*
+      func_profile_ref - FunctionalProfile object to read
+
+      optional arguments, at most one selector per axis. an axis without selector is returned whole:
+      row_ids, col_ids - ids of the rows/columns to return, in the given order
+      row_regex, col_regex - return rows/columns whose id matches the regular expression
+      row_range, col_range - [start, end) 0-based positions of the rows/columns to return
+    */
+    typedef structure {
+      WSRef func_profile_ref;
+
+      list<string> row_ids;
+      list<string> col_ids;
+      string row_regex;
+      string col_regex;
+      list<int> row_range;
+      list<int> col_range;
+    } GetFuncProfileSubsetParams;
+
+    /*
+      row_ids, col_ids, values - the selected matrix, null cells are null
+      row_indices, col_indices - positions of the selected rows/columns in the whole matrix
+    */
+    typedef structure {
+      list<string> row_ids;
+      list<string> col_ids;
+      list<list<float>> values;
+      list<int> row_indices;
+      list<int> col_indices;
+    } FuncProfileSubset;
+
+    funcdef get_func_profile_subset(GetFuncProfileSubsetParams params) returns (FuncProfileSubset returnVal) authentication required;
+
 };
@@ -14,15 +14,57 @@ module KBaseProfile {
     */
     typedef string WSRef;
 
+    /* Ref to a handle of a file stored in Shock
+      @id handle
+    */
+    typedef string HandleRef;
+
+    /*
+      Sparse values of a FloatMatrix2D in compressed sparse row (CSR) layout.
+      Cells not listed are 0, null cells are listed with a null value.
+
+      indptr - row offsets, values of row i are stored at positions indptr[i] to indptr[i + 1] - 1
+               of indices and values. length(indptr) is the number of rows + 1
+      indices - column index of each stored value
+      values - stored values
+    */
+    typedef structure {
+      list<int> indptr;
+      list<int> indices;
+      list<float> values;
+    } SparseValues;
+
+    /*
+      Values of a FloatMatrix2D stored outside the object in a columnar file.
+      The file holds one float64 column per matrix column, named by col_ids, with rows in the
+      order of row_ids. Null cells are stored as nulls.
+
+      values_handle - handle of the file
+      file_format - format of the file, parquet
+      compression - compression codec of the file, e.g. zstd
+    */
+    typedef structure {
+      HandleRef values_handle;
+      string file_format;
+      string compression;
+    } ColumnarValues;
+
     /*
       A simple 2D matrix of values with labels/ids for rows and
       columns.  The matrix is stored as a list of lists, with the outer list
       containing rows, and the inner lists containing values for each column of
       that row.  Row/Col ids should be unique.
 
+      Mostly zero matrices may be stored in sparse_values instead, large matrices in
+      columnar_values. Exactly one of values, sparse_values and columnar_values is set.
+
       row_ids - unique ids for rows.
       col_ids - unique ids for columns.
       values - two dimensional array indexed as: values[row][col]
+      sparse_values - CSR encoding of values
+      columnar_values - reference to values stored in a columnar file
+
+      @optional values sparse_values columnar_values
 
       @metadata ws length(row_ids) as n_rows
       @metadata ws length(col_ids) as n_cols
@@ -31,8 +73,53 @@ module KBaseProfile {
       list<string> row_ids;
       list<string> col_ids;
       list<list<float>> values;
+      SparseValues sparse_values;
+      ColumnarValues columnar_values;
     } FloatMatrix2D;
 
+    /*
+      Statistics of each row or each column of a FloatMatrix2D, null cells are skipped.
+      Lists are in the order of row_ids/col_ids, statistics without values to compute them
+      from are null.
+
+      count - number of non-null values
+      sum - sum of the values
+      mean - mean of the values
+      std - sample standard deviation of the values
+      min, max - smallest and largest value
+      q1, median, q3 - 25%, 50% and 75% quantiles, linearly interpolated
+      nonzero_count - number of non-null values other than 0
+      approximate_quantiles - q1, median and q3 are estimated with quantile sketches, with a
+                              rank error of about 1%
+
+      @optional q1 median q3 approximate_quantiles
+    */
+    typedef structure {
+      list<int> count;
+      list<float> sum;
+      list<float> mean;
+      list<float> std;
+      list<float> min;
+      list<float> q1;
+      list<float> median;
+      list<float> q3;
+      list<float> max;
+      list<int> nonzero_count;
+      bool approximate_quantiles;
+    } AxisSummary;
+
+    /*
+      Statistics of a FloatMatrix2D computed when it is imported
+
+      rows - statistics of each row
+      cols - statistics of each column. profiles imported in row chunks and large profiles have
+             approximate column quantiles
+    */
+    typedef structure {
+      AxisSummary rows;
+      AxisSummary cols;
+    } ProfileSummary;
+
     /*
       A structure that captures an understanding of the functional capabilities of
       organisms and communities
@@ -46,8 +133,10 @@ module KBaseProfile {
       profile_type - type of profile. e.g. amplicon, MG
       profile_category - category of profile. one of community or organism
 
+      summary - precomputed row and column statistics of data
+
       @optional col_attributemapping_ref row_attributemapping_ref
-      @optional data_epistemology epistemology_method description
+      @optional data_epistemology epistemology_method description summary
 
       @metadata ws base_object_ref as base_object
       @metadata ws col_attributemapping_ref as col_attribute_mapping
@@ -63,6 +152,7 @@ module KBaseProfile {
     typedef structure {
       WSRef base_object_ref;
       FloatMatrix2D data;
+      ProfileSummary summary;
 
       WSRef col_attributemapping_ref;
       WSRef row_attributemapping_ref;
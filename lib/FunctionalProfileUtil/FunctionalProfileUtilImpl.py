@@ -2,8 +2,6 @@
 #BEGIN_HEADER
 import logging
 import os
-
-from FunctionalProfileUtil.Utils.ProfileImporter import ProfileImporter
 #END_HEADER
 
 
@@ -22,11 +20,32 @@ class FunctionalProfileUtil:
     # state. A method could easily clobber the state set by another while
     # the latter method is running.
     ######################################### noqa
-    VERSION = "1.0.1"
+    VERSION = "1.1.0"
     GIT_URL = "https://github.com/Tianhao-Gu/FunctionalProfileUtil.git"
     GIT_COMMIT_HASH = "7d481ee8028b43ccfea1e71277e5ab25400ee6e0"
 
     #BEGIN_CLASS_HEADER
+    @property
+    def profile_importer(self):
+        # ProfileImporter loads numpy and pandas, only pay for them on the first import call
+        if self._profile_importer is None:
+            from FunctionalProfileUtil.Utils.ProfileImporter import ProfileImporter
+            self._profile_importer = ProfileImporter(self.config)
+        return self._profile_importer
+
+    @property
+    def profile_exporter(self):
+        if self._profile_exporter is None:
+            from FunctionalProfileUtil.Utils.ProfileExporter import ProfileExporter
+            self._profile_exporter = ProfileExporter(self.config)
+        return self._profile_exporter
+
+    @property
+    def profile_subsetter(self):
+        if self._profile_subsetter is None:
+            from FunctionalProfileUtil.Utils.ProfileSubsetter import ProfileSubsetter
+            self._profile_subsetter = ProfileSubsetter(self.config)
+        return self._profile_subsetter
     #END_CLASS_HEADER
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -38,7 +57,9 @@ class FunctionalProfileUtil:
         self.config['KB_AUTH_TOKEN'] = os.environ['KB_AUTH_TOKEN']
         self.scratch = config['scratch']
 
-        self.profile_importer = ProfileImporter(self.config)
+        self._profile_importer = None
+        self._profile_exporter = None
+        self._profile_subsetter = None
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
                             level=logging.INFO)
         #END_CONSTRUCTOR
@@ -59,7 +80,11 @@ class FunctionalProfileUtil:
            data_epistemology - how was data acquired. one of: measured,
            asserted, predicted epistemology_method - method/program to be
            used to acquired data. e.g. FAPROTAX, PICRUSt2 description -
-           description for the profile) -> structure: parameter
+           description for the profile include_timings - return per-stage
+           timings of the import. default: False storage_mode - one of json
+           (values inline in the object) or columnar (values in a Parquet
+           file referenced by a handle). default: json, objects too large for
+           JSON are saved in columnar mode) -> structure: parameter
            "workspace_id" of Long, parameter "func_profile_obj_name" of
            String, parameter "base_object_ref" of type "WSRef" (Ref to a WS
            object @id ws), parameter "profile_file_path" of String, parameter
@@ -68,11 +93,26 @@ class FunctionalProfileUtil:
            1 for true. @range (0, 1)), parameter "build_report" of type
            "bool" (A boolean - 0 for false, 1 for true. @range (0, 1)),
            parameter "data_epistemology" of String, parameter
-           "epistemology_method" of String, parameter "description" of String
-        :returns: instance of type "ImportFuncProfileResults" -> structure:
-           parameter "func_profile_ref" of type "WSRef" (Ref to a WS object
-           @id ws), parameter "report_name" of String, parameter "report_ref"
-           of type "WSRef" (Ref to a WS object @id ws)
+           "epistemology_method" of String, parameter "description" of
+           String, parameter "include_timings" of type "bool" (A boolean - 0
+           for false, 1 for true. @range (0, 1)), parameter "storage_mode" of
+           String
+        :returns: instance of type "ImportFuncProfileResults" (timings -
+           stage timings in execution order, only returned if include_timings
+           is set) -> structure: parameter "func_profile_ref" of type "WSRef"
+           (Ref to a WS object @id ws), parameter "report_name" of String,
+           parameter "report_ref" of type "WSRef" (Ref to a WS object @id
+           ws), parameter "timings" of list of type "StageTiming" (timing of
+           one import stage stage - stage name. e.g. download, parse,
+           check_ids, serialize, save, report wall_time - elapsed time in
+           seconds cpu_time - CPU time in seconds of the import process and
+           its finished child processes peak_rss_delta - growth of the peak
+           resident set size in bytes during the stage bytes_in - bytes read
+           by the stage bytes_out - bytes produced by the stage) ->
+           structure: parameter "stage" of String, parameter "wall_time" of
+           Double, parameter "cpu_time" of Double, parameter "peak_rss_delta"
+           of Long, parameter "bytes_in" of Long, parameter "bytes_out" of
+           Long
         """
         # ctx is the context object
         # return variables are: returnVal
@@ -86,6 +126,134 @@ class FunctionalProfileUtil:
                              'returnVal is not type dict as required.')
         # return the results
         return [returnVal]
+
+    def import_func_profiles(self, ctx, params):
+        """
+        :param params: instance of type "ImportFuncProfilesParams"
+           (workspace_id - workspace all FunctionalProfile objects are saved
+           in profiles - profiles to import, see ImportFuncProfileParams.
+           workspace_id, build_report and include_timings of each profile are
+           ignored optional arguments: build_report - build one report for
+           all imported profiles. default: False) -> structure: parameter
+           "workspace_id" of Long, parameter "profiles" of list of type
+           "ImportFuncProfileParams" (func_profile_obj_name - result
+           FunctionalProfile object name base_object_ref - base object
+           associated with this functional profile object profile_file_path -
+           either a local file path or staging file path profile_type - type
+           of profile. e.g. amplicon, MG profile_category - category of
+           profile. one of community or organism optional arguments:
+           staging_file - profile_file_path provided in ProfileTable is a
+           staging file path. default: False build_report - build report for
+           narrative. default: False data_epistemology - how was data
+           acquired. one of: measured, asserted, predicted
+           epistemology_method - method/program to be used to acquired data.
+           e.g. FAPROTAX, PICRUSt2 description - description for the profile
+           include_timings - return per-stage timings of the import. default:
+           False storage_mode - one of json (values inline in the object) or
+           columnar (values in a Parquet file referenced by a handle).
+           default: json, objects too large for JSON are saved in columnar
+           mode) -> structure: parameter "workspace_id" of Long, parameter
+           "func_profile_obj_name" of String, parameter "base_object_ref" of
+           type "WSRef" (Ref to a WS object @id ws), parameter
+           "profile_file_path" of String, parameter "profile_type" of String,
+           parameter "profile_category" of String, parameter "staging_file"
+           of type "bool" (A boolean - 0 for false, 1 for true. @range (0,
+           1)), parameter "build_report" of type "bool" (A boolean - 0 for
+           false, 1 for true. @range (0, 1)), parameter "data_epistemology"
+           of String, parameter "epistemology_method" of String, parameter
+           "description" of String, parameter "include_timings" of type
+           "bool" (A boolean - 0 for false, 1 for true. @range (0, 1)),
+           parameter "storage_mode" of String, parameter "build_report" of
+           type "bool" (A boolean - 0 for false, 1 for true. @range (0, 1))
+        :returns: instance of type "ImportFuncProfilesResults" (results - one
+           result per profile, in the order of
+           ImportFuncProfilesParams.profiles) -> structure: parameter
+           "results" of list of type "ImportFuncProfileResult"
+           (func_profile_obj_name - FunctionalProfile object name of the
+           profile func_profile_ref - saved FunctionalProfile object, missing
+           if the import failed error - error message if the import failed)
+           -> structure: parameter "func_profile_obj_name" of String,
+           parameter "func_profile_ref" of type "WSRef" (Ref to a WS object
+           @id ws), parameter "error" of String, parameter "report_name" of
+           String, parameter "report_ref" of type "WSRef" (Ref to a WS object
+           @id ws)
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN import_func_profiles
+        returnVal = self.profile_importer.import_func_profiles(params)
+        #END import_func_profiles
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method import_func_profiles return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
+    def export_func_profile(self, ctx, params):
+        """
+        :param params: instance of type "ExportFuncProfileParams"
+           (func_profile_ref - FunctionalProfile object to export file_format
+           - format of the exported file. one of tsv, parquet or biom (BIOM
+           2.1 HDF5) optional arguments: gzip - gzip compress the exported
+           file. default: False) -> structure: parameter "func_profile_ref"
+           of type "WSRef" (Ref to a WS object @id ws), parameter
+           "file_format" of String, parameter "gzip" of type "bool" (A
+           boolean - 0 for false, 1 for true. @range (0, 1))
+        :returns: instance of type "ExportFuncProfileOutput" (shock_id -
+           Shock node of the exported file file_name - name of the exported
+           file size - size of the exported file in bytes) -> structure:
+           parameter "shock_id" of String, parameter "file_name" of String,
+           parameter "size" of Long
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN export_func_profile
+        returnVal = self.profile_exporter.export_func_profile(params)
+        #END export_func_profile
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method export_func_profile return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
+    def get_func_profile_subset(self, ctx, params):
+        """
+        :param params: instance of type "GetFuncProfileSubsetParams"
+           (func_profile_ref - FunctionalProfile object to read optional
+           arguments, at most one selector per axis. an axis without selector
+           is returned whole: row_ids, col_ids - ids of the rows/columns to
+           return, in the given order row_regex, col_regex - return
+           rows/columns whose id matches the regular expression row_range,
+           col_range - [start, end) 0-based positions of the rows/columns to
+           return) -> structure: parameter "func_profile_ref" of type "WSRef"
+           (Ref to a WS object @id ws), parameter "row_ids" of list of
+           String, parameter "col_ids" of list of String, parameter
+           "row_regex" of String, parameter "col_regex" of String, parameter
+           "row_range" of list of Long, parameter "col_range" of list of Long
+        :returns: instance of type "FuncProfileSubset" (row_ids, col_ids,
+           values - the selected matrix, null cells are null row_indices,
+           col_indices - positions of the selected rows/columns in the whole
+           matrix) -> structure: parameter "row_ids" of list of String,
+           parameter "col_ids" of list of String, parameter "values" of list
+           of list of Double, parameter "row_indices" of list of Long,
+           parameter "col_indices" of list of Long
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_func_profile_subset
+        returnVal = self.profile_subsetter.get_func_profile_subset(params)
+        #END get_func_profile_subset
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method get_func_profile_subset return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {'state': "OK",
@@ -342,6 +342,18 @@ class Application(object):
                              name='FunctionalProfileUtil.import_func_profile',
                              types=[dict])
         self.method_authentication['FunctionalProfileUtil.import_func_profile'] = 'required'  # noqa
+        self.rpc_service.add(impl_FunctionalProfileUtil.import_func_profiles,
+                             name='FunctionalProfileUtil.import_func_profiles',
+                             types=[dict])
+        self.method_authentication['FunctionalProfileUtil.import_func_profiles'] = 'required'  # noqa
+        self.rpc_service.add(impl_FunctionalProfileUtil.export_func_profile,
+                             name='FunctionalProfileUtil.export_func_profile',
+                             types=[dict])
+        self.method_authentication['FunctionalProfileUtil.export_func_profile'] = 'required'  # noqa
+        self.rpc_service.add(impl_FunctionalProfileUtil.get_func_profile_subset,
+                             name='FunctionalProfileUtil.get_func_profile_subset',
+                             types=[dict])
+        self.method_authentication['FunctionalProfileUtil.get_func_profile_subset'] = 'required'  # noqa
         self.rpc_service.add(impl_FunctionalProfileUtil.status,
                              name='FunctionalProfileUtil.status',
                              types=[dict])
@@ -0,0 +1,137 @@
+import importlib.util
+import os
+
+import numpy as np
+
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+
+
+PARQUET_FORMAT = 'parquet'
+PARQUET_COMPRESSION = 'zstd'
+ROW_GROUP_CELLS = 16 * 1024 * 1024
+
+
+def columnar_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _import_pyarrow():
+    # pyarrow is only needed for columnar storage, keep it out of the service start up
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError('Columnar storage requires pyarrow, which is not installed')
+
+    return pa, pq
+
+
+def write_parquet(file_path, col_ids, matrices, compression=PARQUET_COMPRESSION,
+                  row_id_column=None):
+    """
+    write_parquet: write FloatMatrix2D row chunks into one Parquet file
+
+    the file holds one float64 column per matrix column named by col_ids, null cells are
+    stored as Parquet nulls. row ids are only written as a leading string column if
+    row_id_column names it, stored objects keep them inline.
+    returns (row_ids, file size in bytes)
+    """
+    pa, pq = _import_pyarrow()
+
+    col_ids = [str(col_id) for col_id in col_ids]
+    fields = [(col_id, pa.float64()) for col_id in col_ids]
+    if row_id_column is not None:
+        if row_id_column in col_ids:
+            raise ValueError('Column id {} is reserved for row ids'.format(row_id_column))
+        fields.insert(0, (row_id_column, pa.string()))
+    schema = pa.schema(fields)
+    block_rows = max(ROW_GROUP_CELLS // max(len(col_ids), 1), 1)
+    row_ids = list()
+
+    with pq.ParquetWriter(file_path, schema, compression=compression) as writer:
+        for matrix in matrices:
+            if matrix.col_ids != col_ids:
+                raise ValueError('Profile file chunk columns do not match the header')
+            row_ids.extend(matrix.row_ids)
+            for start in range(0, matrix.shape[0], block_rows):
+                # transposed copy of the block so every column is contiguous
+                block_columns = np.ascontiguousarray(matrix.values[start:start + block_rows].T)
+                arrays = [pa.array(column, mask=np.isnan(column)) for column in block_columns]
+                if row_id_column is not None:
+                    arrays.insert(0, pa.array(matrix.row_ids[start:start + block_rows],
+                                              type=pa.string()))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    return row_ids, os.path.getsize(file_path)
+
+
+def _table_values(table):
+    values = np.empty((table.num_rows, table.num_columns), dtype=np.float64)
+    for idx, column in enumerate(table.columns):
+        # null cells come back as NaN
+        values[:, idx] = column.to_numpy()
+
+    return values
+
+
+def _check_parquet_shape(parquet_file, row_ids, col_ids):
+    metadata = parquet_file.metadata
+    if metadata.num_rows != len(row_ids) or metadata.num_columns != len(col_ids):
+        raise ValueError('Columnar values shape ({}, {}) does not match {} row ids and {} col '
+                         'ids'.format(metadata.num_rows, metadata.num_columns, len(row_ids),
+                                      len(col_ids)))
+
+
+def read_parquet(file_path, row_ids, col_ids):
+    """
+    read_parquet: read a Parquet file written by write_parquet back into a FloatMatrix2D
+    """
+    _, pq = _import_pyarrow()
+
+    _check_parquet_shape(pq.ParquetFile(file_path), row_ids, col_ids)
+
+    return FloatMatrix2D(row_ids, col_ids, _table_values(pq.read_table(file_path)))
+
+
+def iter_parquet(file_path, row_ids, col_ids):
+    """
+    iter_parquet: yield a Parquet file written by write_parquet as FloatMatrix2D row chunks
+
+    one chunk per row group, so only a row group of the matrix is in memory at a time
+    """
+    _, pq = _import_pyarrow()
+
+    parquet_file = pq.ParquetFile(file_path)
+    _check_parquet_shape(parquet_file, row_ids, col_ids)
+
+    start = 0
+    for row_group in range(parquet_file.num_row_groups):
+        values = _table_values(parquet_file.read_row_group(row_group))
+        yield FloatMatrix2D(row_ids[start:start + len(values)], col_ids, values)
+        start += len(values)
+
+
+def read_parquet_subset(file_path, row_positions, col_ids):
+    """
+    read_parquet_subset: read selected cells of a Parquet file written by write_parquet
+
+    only the columns named in col_ids and the row groups holding row_positions are decoded.
+    row_positions have to be sorted, returns values indexed as [row_positions][col_ids]
+    """
+    _, pq = _import_pyarrow()
+
+    parquet_file = pq.ParquetFile(file_path)
+    row_positions = np.asarray(row_positions, dtype=np.int64)
+    values = np.empty((len(row_positions), len(col_ids)), dtype=np.float64)
+
+    group_start = 0
+    for row_group in range(parquet_file.num_row_groups):
+        group_end = group_start + parquet_file.metadata.row_group(row_group).num_rows
+        first, last = np.searchsorted(row_positions, [group_start, group_end])
+        if last > first:
+            group_values = _table_values(parquet_file.read_row_group(row_group,
+                                                                     columns=list(col_ids)))
+            values[first:last] = group_values[row_positions[first:last] - group_start]
+        group_start = group_end
+
+    return values
@@ -0,0 +1,361 @@
+import json
+import math
+
+import numpy as np
+
+
+JSON_CHUNK_ROWS = 1000
+SIZE_ESTIMATE_BLOCK_CELLS = 1000000
+SIZE_ESTIMATE_SAMPLE_SIZE = 10000
+
+# float repr switches to exponent notation at 1e16, integral values below that are written as
+# '<digits>.0'. the longest float repr is 24 characters, e.g. '-2.2250738585072014e-308'
+MAX_POSITIONAL_INT = 1e15
+POWERS_OF_TEN = 10.0 ** np.arange(16)
+MIN_FLOAT_JSON_WIDTH = 3
+MAX_FLOAT_JSON_WIDTH = 24
+NULL_JSON_WIDTH = len('null')
+
+
+class FloatMatrix2D:
+    """
+    In-memory representation of a KBaseProfile.FloatMatrix2D
+
+    row_ids - unique ids for rows.
+    col_ids - unique ids for columns.
+    values - contiguous float64 array indexed as: values[row][col]. null cells are stored as NaN
+    sparse - serialize values as sparse_values (CSR) instead of a dense list of lists
+
+    A nested list of Python floats is only built when to_dict is called explicitly.
+    """
+
+    def __init__(self, row_ids, col_ids, values, sparse=False):
+        self.row_ids = [str(row_id) for row_id in row_ids]
+        self.col_ids = [str(col_id) for col_id in col_ids]
+
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        if values.size == 0:
+            values = values.reshape(len(self.row_ids), len(self.col_ids))
+        if values.shape != (len(self.row_ids), len(self.col_ids)):
+            err_msg = 'Matrix values shape {} does not match {} row ids and {} col ids'.format(
+                                            values.shape, len(self.row_ids), len(self.col_ids))
+            raise ValueError(err_msg)
+        self.values = values
+        self.sparse = sparse
+
+    @classmethod
+    def from_df(cls, df):
+        try:
+            values = df.to_numpy(dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError('Profile file contains non-numeric values')
+
+        return cls(df.index.astype('str').tolist(), df.columns.astype('str').tolist(), values)
+
+    @classmethod
+    def from_dict(cls, data):
+        sparse_values = data.get('sparse_values')
+        if sparse_values is None:
+            # None (null) cells become NaN
+            values = np.array(data['values'], dtype=np.float64)
+            return cls(data['row_ids'], data['col_ids'], values)
+
+        values = np.zeros((len(data['row_ids']), len(data['col_ids'])))
+        indptr = np.asarray(sparse_values['indptr'], dtype=np.int64)
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        values[rows, sparse_values['indices']] = np.array(sparse_values['values'],
+                                                          dtype=np.float64)
+
+        return cls(data['row_ids'], data['col_ids'], values, sparse=True)
+
+    @classmethod
+    def iter_dict_chunks(cls, data, chunk_rows=JSON_CHUNK_ROWS):
+        """
+        iter_dict_chunks: yield a FloatMatrix2D dict as row chunks of at most chunk_rows rows
+
+        only one chunk of dense values is built at a time, sparse_values chunks are filled from
+        their slice of the CSR arrays
+        """
+        row_ids = data['row_ids']
+        col_ids = data['col_ids']
+        sparse_values = data.get('sparse_values')
+        indptr = None
+        if sparse_values is not None:
+            indptr = np.asarray(sparse_values['indptr'], dtype=np.int64)
+
+        for start in range(0, len(row_ids), chunk_rows):
+            end = min(start + chunk_rows, len(row_ids))
+            if indptr is None:
+                yield cls(row_ids[start:end], col_ids,
+                          np.array(data['values'][start:end], dtype=np.float64))
+                continue
+
+            values = np.zeros((end - start, len(col_ids)))
+            rows = np.repeat(np.arange(end - start), np.diff(indptr[start:end + 1]))
+            stored = slice(indptr[start], indptr[end])
+            values[rows, np.asarray(sparse_values['indices'][stored], dtype=np.int64)] = \
+                np.array(sparse_values['values'][stored], dtype=np.float64)
+            yield cls(row_ids[start:end], col_ids, values, sparse=True)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def null_mask(self):
+        return np.isnan(self.values)
+
+    @property
+    def zero_fraction(self):
+        """
+        zero_fraction: fraction of cells that are exactly 0, null cells are not counted as zeros
+        """
+        if not self.values.size:
+            return 0.0
+
+        zero_count = 0
+        flat_values = self.values.reshape(-1)
+        for start in range(0, flat_values.size, SIZE_ESTIMATE_BLOCK_CELLS):
+            zero_count += int(np.count_nonzero(
+                                    flat_values[start:start + SIZE_ESTIMATE_BLOCK_CELLS] == 0))
+
+        return zero_count / flat_values.size
+
+    def transpose(self):
+        return FloatMatrix2D(self.col_ids, self.row_ids, self.values.T, sparse=self.sparse)
+
+    def to_df(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.values, index=self.row_ids, columns=self.col_ids)
+
+    def iter_value_rows(self):
+        """
+        iter_value_rows: yield matrix rows as lists of floats with None for null cells
+        """
+        for row in self.values:
+            row_values = row.tolist()
+            row_mask = np.isnan(row)
+            if row_mask.any():
+                for idx in np.flatnonzero(row_mask):
+                    row_values[idx] = None
+            yield row_values
+
+    def iter_csr_blocks(self, chunk_rows=JSON_CHUNK_ROWS):
+        """
+        iter_csr_blocks: yield the CSR encoding of values in blocks of at most chunk_rows rows
+
+        yields (row_counts, indices, stored_values) per block. zeros are implicit, null cells
+        are stored explicitly as NaN
+        """
+        for start in range(0, self.shape[0], chunk_rows):
+            block = self.values[start:start + chunk_rows]
+            # NaN != 0 so null cells are kept
+            stored_mask = block != 0
+            rows, indices = np.nonzero(stored_mask)
+            yield stored_mask.sum(axis=1), indices, block[rows, indices]
+
+    @staticmethod
+    def _float_list(values):
+        float_list = values.tolist()
+        for idx in np.flatnonzero(np.isnan(values)):
+            float_list[idx] = None
+        return float_list
+
+    def to_sparse_dict(self):
+        indptr = [0]
+        indices = []
+        stored_values = []
+        for row_counts, block_indices, block_values in self.iter_csr_blocks():
+            indptr.extend((indptr[-1] + np.cumsum(row_counts)).tolist())
+            indices.extend(block_indices.tolist())
+            stored_values.extend(self._float_list(block_values))
+
+        return {'indptr': indptr, 'indices': indices, 'values': stored_values}
+
+    def to_dict(self):
+        data = {'row_ids': list(self.row_ids),
+                'col_ids': list(self.col_ids)}
+        if self.sparse:
+            data['sparse_values'] = self.to_sparse_dict()
+        else:
+            data['values'] = list(self.iter_value_rows())
+
+        return data
+
+    def _iter_sparse_json(self, chunk_rows):
+        # one pass over the CSR blocks per field, so only a block of the encoding is in memory
+        yield '{"indptr": [0'
+        offset = 0
+        for row_counts, _, _ in self.iter_csr_blocks(chunk_rows=chunk_rows):
+            if row_counts.size:
+                indptr = offset + np.cumsum(row_counts)
+                offset = int(indptr[-1])
+                yield ', ' + json.dumps(indptr.tolist())[1:-1]
+
+        yield '], "indices": ['
+        first_chunk = True
+        for _, indices, _ in self.iter_csr_blocks(chunk_rows=chunk_rows):
+            if indices.size:
+                yield ('' if first_chunk else ', ') + json.dumps(indices.tolist())[1:-1]
+                first_chunk = False
+
+        yield '], "values": ['
+        first_chunk = True
+        for _, _, stored_values in self.iter_csr_blocks(chunk_rows=chunk_rows):
+            if stored_values.size:
+                yield ('' if first_chunk else ', ') + json.dumps(
+                                                        self._float_list(stored_values))[1:-1]
+                first_chunk = False
+        yield ']}'
+
+    def iter_json(self, chunk_rows=JSON_CHUNK_ROWS):
+        """
+        iter_json: yield the JSON encoding of to_dict() in chunks of at most chunk_rows rows
+
+        output is identical to json.dumps(self.to_dict())
+        """
+        yield '{"row_ids": '
+        yield json.dumps(self.row_ids)
+        yield ', "col_ids": '
+        yield json.dumps(self.col_ids)
+
+        if self.sparse:
+            yield ', "sparse_values": '
+            for chunk in self._iter_sparse_json(chunk_rows):
+                yield chunk
+            yield '}'
+            return
+
+        yield ', "values": ['
+
+        rows = []
+        first_chunk = True
+        for row_values in self.iter_value_rows():
+            rows.append(json.dumps(row_values))
+            if len(rows) >= chunk_rows:
+                yield ('' if first_chunk else ', ') + ', '.join(rows)
+                first_chunk = False
+                rows = []
+        if rows:
+            yield ('' if first_chunk else ', ') + ', '.join(rows)
+
+        yield ']}'
+
+    @staticmethod
+    def _int_list_width(int_values):
+        """
+        _int_list_width: exact total JSON width of non-negative integers
+        """
+        digits = np.maximum(np.searchsorted(POWERS_OF_TEN, int_values, side='right'), 1)
+        return int(digits.sum())
+
+    @staticmethod
+    def _estimate_values_width(flat_values):
+        """
+        _estimate_values_width: estimate total JSON width of a flat array of value cells
+
+        nulls and integral values (e.g. the zeros dominating most profiles) are measured exactly
+        with vectorized operations. the width of remaining values is estimated from a sample and
+        bounded by the shortest and longest possible float repr
+
+        returns (estimate, lower_bound, upper_bound)
+        """
+        exact_width = 0
+        other_count = 0
+        fallback_sample = []
+
+        for start in range(0, flat_values.size, SIZE_ESTIMATE_BLOCK_CELLS):
+            block = flat_values[start:start + SIZE_ESTIMATE_BLOCK_CELLS]
+
+            null_mask = np.isnan(block)
+            exact_width += NULL_JSON_WIDTH * int(null_mask.sum())
+
+            abs_block = np.abs(np.where(null_mask, 0, block))
+            int_mask = ~null_mask & (abs_block < MAX_POSITIONAL_INT) & (np.rint(block) == block)
+            int_values = abs_block[int_mask]
+            # '.0' suffix plus sign (including '-0.0')
+            exact_width += FloatMatrix2D._int_list_width(int_values) + 2 * int_values.size
+            exact_width += int(np.signbit(block[int_mask]).sum())
+
+            other_mask = ~(null_mask | int_mask)
+            block_other_count = int(other_mask.sum())
+            other_count += block_other_count
+            if block_other_count and not fallback_sample:
+                fallback_sample = block[other_mask][:100].tolist()
+
+        if not other_count:
+            return exact_width, exact_width, exact_width
+
+        rng = np.random.RandomState(0)
+        sample = flat_values[rng.randint(0, flat_values.size, SIZE_ESTIMATE_SAMPLE_SIZE)]
+        sample = sample[~np.isnan(sample)]
+        sample = sample[(np.abs(sample) >= MAX_POSITIONAL_INT) | (np.rint(sample) != sample)]
+        sample = sample.tolist() or fallback_sample
+        mean_width = sum(len(json.dumps(value)) for value in sample) / len(sample)
+
+        estimate = exact_width + int(math.ceil(mean_width * other_count))
+        lower_bound = exact_width + MIN_FLOAT_JSON_WIDTH * other_count
+        upper_bound = exact_width + MAX_FLOAT_JSON_WIDTH * other_count
+
+        return estimate, lower_bound, upper_bound
+
+    def _estimate_sparse_json_size(self):
+        """
+        _estimate_sparse_json_size: estimate JSON width of the sparse_values field
+
+        indptr and indices are measured exactly, only stored values are estimated
+        """
+        n_rows = self.shape[0]
+
+        indptr_width = len('0')
+        indices_width = 0
+        stored_value_blocks = []
+        offset = 0
+        for row_counts, indices, stored_values in self.iter_csr_blocks():
+            if row_counts.size:
+                indptr = offset + np.cumsum(row_counts)
+                offset = int(indptr[-1])
+                indptr_width += self._int_list_width(indptr)
+            indices_width += self._int_list_width(indices)
+            stored_value_blocks.append(stored_values)
+        stored_count = offset
+
+        fixed_width = len(', "sparse_values": ') + len('{"indptr": [') + indptr_width + 2 * n_rows
+        fixed_width += len('], "indices": [') + indices_width
+        fixed_width += len('], "values": [') + len(']}')
+        fixed_width += 2 * 2 * max(stored_count - 1, 0)
+
+        stored_values = np.concatenate(stored_value_blocks) if stored_value_blocks else \
+            np.empty(0)
+        estimate, lower_bound, upper_bound = self._estimate_values_width(stored_values)
+
+        return fixed_width + estimate, fixed_width + lower_bound, fixed_width + upper_bound
+
+    def estimate_json_size(self):
+        """
+        estimate_json_size: predict len(json.dumps(self.to_dict())) without serializing values
+
+        returns (estimate, lower_bound, upper_bound), the exact size is always within the bounds
+        """
+        n_rows, n_cols = self.shape
+
+        ids_width = len('{"row_ids": ') + len(json.dumps(self.row_ids))
+        ids_width += len(', "col_ids": ') + len(json.dumps(self.col_ids))
+
+        if self.sparse:
+            estimate, lower_bound, upper_bound = self._estimate_sparse_json_size()
+            ids_width += len('}')
+            return ids_width + estimate, ids_width + lower_bound, ids_width + upper_bound
+
+        # brackets and ', ' separators of the values list of lists
+        separator_width = len(', "values": [') + len(']}')
+        if n_rows:
+            separator_width += 2 * (n_rows - 1) + n_rows * 2
+            if n_cols:
+                separator_width += n_rows * 2 * (n_cols - 1)
+
+        fixed_width = ids_width + separator_width
+        estimate, lower_bound, upper_bound = self._estimate_values_width(self.values.reshape(-1))
+
+        return fixed_width + estimate, fixed_width + lower_bound, fixed_width + upper_bound
@@ -0,0 +1,240 @@
+import logging
+
+import numpy as np
+
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+from FunctionalProfileUtil.Utils.ProfileSummary import row_std
+
+
+# variance keeps the rows with the highest standard deviation, kmeans replaces rows by the mean
+# row of each k-means cluster. columns are always the ones with the highest standard deviation
+PREVIEW_METHODS = ['variance', 'kmeans']
+DEFAULT_PREVIEW_METHOD = 'variance'
+# profiles larger than this are previewed, heatmaps of this size still render quickly
+DEFAULT_HEATMAP_MAX_ROWS = 500
+DEFAULT_HEATMAP_MAX_COLS = 200
+
+# k-means is fitted on a row sample, then every row is assigned to its nearest centroid
+KMEANS_SAMPLE_ROWS = 20000
+KMEANS_MAX_ITERATIONS = 25
+KMEANS_SEED = 0
+# blocks of about this many cells are assigned to centroids at a time
+ASSIGN_BLOCK_CELLS = 4 * 1024 * 1024
+
+ROWS_DESCRIPTION = 'the {} of {} rows with the highest standard deviation'
+COLS_DESCRIPTION = 'the {} of {} columns with the highest standard deviation'
+
+
+def _top_variable(std, max_count):
+    """
+    _top_variable: positions of the max_count entries with the highest standard deviation,
+                   in their original order. undefined (None or NaN) deviations rank last
+    """
+    std = np.array([np.nan if value is None else value for value in std], dtype=np.float64)
+    if len(std) <= max_count:
+        return np.arange(len(std))
+
+    return np.sort(np.argsort(-np.nan_to_num(std, nan=-1.0), kind='stable')[:max_count])
+
+
+def _describe(shape, descriptions):
+    logging.info('heatmap preview of {} x {} profile: {}'.format(shape[0], shape[1],
+                                                                 ', '.join(descriptions)))
+
+    return 'Showing ' + ' and '.join(descriptions)
+
+
+def _squared_distances(rows, centroids, row_norms=None):
+    """
+    _squared_distances: squared euclidean distance of each row to each centroid, row_norms are
+                        the precomputed squared norms of rows
+    """
+    if row_norms is None:
+        row_norms = np.einsum('ij,ij->i', rows, rows)
+    distances = rows @ centroids.T
+    distances *= -2
+    distances += row_norms[:, None]
+    distances += np.einsum('ij,ij->i', centroids, centroids)[None, :]
+
+    return np.maximum(distances, 0, out=distances)
+
+
+def _cluster_sums(rows, labels, cluster_count):
+    """
+    _cluster_sums: (sum of the rows, number of rows) of each cluster label
+    """
+    counts = np.bincount(labels, minlength=cluster_count)
+    sums = np.zeros((cluster_count, rows.shape[1]))
+    order = np.argsort(labels, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    filled = counts > 0
+    if filled.any():
+        sums[filled] = np.add.reduceat(rows[order], starts[filled], axis=0)
+
+    return sums, counts
+
+
+def _kmeans(rows, cluster_count, random):
+    """
+    _kmeans: k-means++ seeded Lloyd iterations, returns the centroids
+    """
+    row_norms = np.einsum('ij,ij->i', rows, rows)
+    seeds = [random.randint(len(rows))]
+    distances = _squared_distances(rows, rows[seeds], row_norms).ravel()
+    while len(seeds) < cluster_count and distances.sum():
+        seeds.append(random.choice(len(rows), p=distances / distances.sum()))
+        # only the distances to the newest seed are computed
+        distances = np.minimum(distances,
+                               _squared_distances(rows, rows[seeds[-1:]], row_norms).ravel())
+    centroids = rows[seeds]
+
+    for _ in range(KMEANS_MAX_ITERATIONS):
+        labels = _squared_distances(rows, centroids, row_norms).argmin(axis=1)
+        sums, counts = _cluster_sums(rows, labels, len(centroids))
+        new_centroids = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None],
+                                 centroids)
+        if np.allclose(new_centroids, centroids):
+            break
+        centroids = new_centroids
+
+    return centroids
+
+
+def _cluster_rows(values, cols, cluster_count):
+    """
+    _cluster_rows: aggregate the rows of values[:, cols] into the mean rows of k-means clusters
+
+    returns (cluster mean rows, cluster sizes) ordered by decreasing size
+    """
+    random = np.random.RandomState(KMEANS_SEED)
+    sample = np.arange(len(values))
+    if len(values) > KMEANS_SAMPLE_ROWS:
+        sample = np.sort(random.choice(len(values), KMEANS_SAMPLE_ROWS, replace=False))
+    centroids = _kmeans(np.nan_to_num(values[sample][:, cols]), cluster_count, random)
+
+    sums = np.zeros_like(centroids)
+    counts = np.zeros(len(centroids), dtype=np.int64)
+    block_rows = max(ASSIGN_BLOCK_CELLS // max(values.shape[1], 1), 1)
+    for start in range(0, len(values), block_rows):
+        block = np.nan_to_num(values[start:start + block_rows][:, cols])
+        block_sums, block_counts = _cluster_sums(
+                        block, _squared_distances(block, centroids).argmin(axis=1), len(centroids))
+        sums += block_sums
+        counts += block_counts
+
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0]
+
+    return sums[order] / counts[order][:, None], counts[order]
+
+
+def heatmap_preview(matrix, summary, max_rows=DEFAULT_HEATMAP_MAX_ROWS,
+                    max_cols=DEFAULT_HEATMAP_MAX_COLS, method=DEFAULT_PREVIEW_METHOD):
+    """
+    heatmap_preview: bounded size matrix to draw the heatmap of a profile from
+
+    summary is the ProfileSummary of matrix, its standard deviations rank rows and columns.
+    null cells are 0 in the preview.
+    returns (preview FloatMatrix2D, description of the preview or None if it is the whole
+    matrix)
+    """
+    if method not in PREVIEW_METHODS:
+        raise ValueError('Please choose one of {} as heatmap preview method'.format(
+                                                                            PREVIEW_METHODS))
+
+    row_count, col_count = matrix.shape
+    if row_count <= max_rows and col_count <= max_cols:
+        return FloatMatrix2D(matrix.row_ids, matrix.col_ids, np.nan_to_num(matrix.values)), None
+
+    cols = _top_variable(summary['cols']['std'], max_cols)
+    col_ids = [matrix.col_ids[col] for col in cols]
+    descriptions = list()
+
+    if row_count <= max_rows:
+        values = np.nan_to_num(matrix.values[:, cols])
+        row_ids = matrix.row_ids
+    elif method == 'variance':
+        rows = _top_variable(summary['rows']['std'], max_rows)
+        values = np.nan_to_num(matrix.values[rows][:, cols])
+        row_ids = [matrix.row_ids[row] for row in rows]
+        descriptions.append(ROWS_DESCRIPTION.format(len(rows), row_count))
+    else:
+        values, counts = _cluster_rows(matrix.values, cols, max_rows)
+        row_ids = ['cluster_{} ({} rows)'.format(idx + 1, count)
+                   for idx, count in enumerate(counts)]
+        descriptions.append('the mean rows of {} k-means clusters of {} rows'.format(
+                                                                    len(row_ids), row_count))
+
+    if len(cols) < col_count:
+        descriptions.append(COLS_DESCRIPTION.format(len(cols), col_count))
+
+    return FloatMatrix2D(row_ids, col_ids, values), _describe(matrix.shape, descriptions)
+
+
+class HeatmapPreviewBuilder:
+    """
+    Collects the variance heatmap preview of a matrix given in row chunks
+
+    the standard deviation of a row is known from its chunk, so only the max_rows most variable
+    rows seen so far are kept. columns are chosen from the summary once all chunks are read
+    """
+
+    def __init__(self, col_ids, max_rows=DEFAULT_HEATMAP_MAX_ROWS,
+                 max_cols=DEFAULT_HEATMAP_MAX_COLS):
+        self.col_ids = list(col_ids)
+        self.row_ids = list()
+        self.max_rows = max_rows
+        self.max_cols = max_cols
+
+        self._values = np.empty((0, len(self.col_ids)))
+        self._std = np.empty(0)
+        self._positions = np.empty(0, dtype=np.int64)
+
+    @property
+    def shape(self):
+        return len(self.row_ids), len(self.col_ids)
+
+    def add(self, matrix):
+        std = np.nan_to_num(row_std(matrix.values), nan=-1.0)
+        # rows of the chunk that can make it into the top max_rows, in file order
+        top = np.sort(np.argsort(-std, kind='stable')[:self.max_rows])
+
+        values = np.concatenate([self._values, matrix.values[top]])
+        std = np.concatenate([self._std, std[top]])
+        positions = np.concatenate([self._positions, top + len(self.row_ids)])
+        # kept rows come first, so ties go to the earlier row like in heatmap_preview
+        keep = np.sort(np.argsort(-std, kind='stable')[:self.max_rows])
+
+        self._values = values[keep]
+        self._std = std[keep]
+        self._positions = positions[keep]
+        self.row_ids.extend(matrix.row_ids)
+
+    def observe(self, matrices):
+        """
+        observe: pass FloatMatrix2D row chunks through, adding each to the preview
+        """
+        for matrix in matrices:
+            self.add(matrix)
+            yield matrix
+
+    def preview(self, summary):
+        """
+        preview: (preview FloatMatrix2D, description or None) like heatmap_preview with the
+                 variance method, summary is the ProfileSummary of the whole matrix
+        """
+        row_count, col_count = self.shape
+        cols = _top_variable(summary['cols']['std'], self.max_cols)
+        preview = FloatMatrix2D([self.row_ids[position] for position in self._positions],
+                                [self.col_ids[col] for col in cols],
+                                np.nan_to_num(self._values[:, cols]))
+
+        descriptions = list()
+        if len(self._positions) < row_count:
+            descriptions.append(ROWS_DESCRIPTION.format(len(self._positions), row_count))
+        if len(cols) < col_count:
+            descriptions.append(COLS_DESCRIPTION.format(len(cols), col_count))
+        if not descriptions:
+            return preview, None
+
+        return preview, _describe(self.shape, descriptions)
@@ -0,0 +1,159 @@
+import json
+import os
+import uuid
+
+import numpy as np
+
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+
+
+MATRIX_CACHE_DIR = 'matrix_cache'
+COPY_BLOCK_CELLS = 16 * 1024 * 1024
+
+NPY_FLOAT64_DESCR = np.lib.format.dtype_to_descr(np.dtype(np.float64))
+
+
+class MatrixCacheWriter:
+    """
+    Appends row chunks of a matrix to a cache entry
+
+    the row count is only known on close, the .npy header is written up front and rewritten in
+    place with the final shape. numpy pads headers so the rewrite never changes their length.
+    """
+
+    def __init__(self, values_path, ids_path, col_ids):
+        self.values_path = values_path
+        self.ids_path = ids_path
+        self.col_ids = [str(col_id) for col_id in col_ids]
+        self.row_ids = list()
+
+        self._file = open(values_path, 'wb')
+        self._header_size = self._write_header()
+
+    def _write_header(self):
+        self._file.seek(0)
+        np.lib.format.write_array_header_1_0(self._file, {
+                                                'descr': NPY_FLOAT64_DESCR,
+                                                'fortran_order': False,
+                                                'shape': (len(self.row_ids), len(self.col_ids))})
+        return self._file.tell()
+
+    def append(self, matrix):
+        if matrix.col_ids != self.col_ids:
+            raise ValueError('Profile file chunk columns do not match the header')
+
+        self.row_ids.extend(matrix.row_ids)
+        block_rows = max(COPY_BLOCK_CELLS // max(matrix.shape[1], 1), 1)
+        for start in range(0, matrix.shape[0], block_rows):
+            self._file.write(matrix.values[start:start + block_rows].tobytes())
+
+    def close(self):
+        self._file.flush()
+        if self._write_header() != self._header_size:
+            self._file.close()
+            raise RuntimeError('Failed to update matrix cache header of {}'.format(
+                                                                            self.values_path))
+        self._file.close()
+
+        with open(self.ids_path, 'w') as ids_file:
+            json.dump({'row_ids': self.row_ids, 'col_ids': self.col_ids}, ids_file)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.values_path)
+
+
+class MatrixCache:
+    """
+    Scratch cache of parsed profile matrices
+
+    a matrix is written once as <name>.npy holding the values plus a <name>.ids.json sidecar
+    holding row and column ids. get returns a FloatMatrix2D over a read-only memory map of the
+    values, so parse, validation, save and report all work on views of the same pages. The
+    entry is removed from disk once mapped, the mapping keeps the data alive.
+    """
+
+    def __init__(self, scratch):
+        self.cache_dir = os.path.join(scratch, MATRIX_CACHE_DIR)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def new_name():
+        return 'matrix_{}'.format(uuid.uuid4())
+
+    def _paths(self, name):
+        return (os.path.join(self.cache_dir, name + '.npy'),
+                os.path.join(self.cache_dir, name + '.ids.json'))
+
+    def writer(self, col_ids, name=None):
+        """
+        writer: start a cache entry filled by appending row chunks, returns (name, writer)
+        """
+        name = name or self.new_name()
+        return name, MatrixCacheWriter(*self._paths(name), col_ids)
+
+    def put(self, matrix, name=None):
+        """
+        put: write a FloatMatrix2D to the cache, returns the entry name
+        """
+        name, writer = self.writer(matrix.col_ids, name=name)
+        try:
+            writer.append(matrix)
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+
+        return name
+
+    def get(self, name):
+        """
+        get: map a cache entry as a read-only FloatMatrix2D and remove it from disk
+        """
+        values_path, ids_path = self._paths(name)
+        with open(ids_path) as ids_file:
+            ids = json.load(ids_file)
+        values = np.load(values_path, mmap_mode='r')
+        self.remove(name)
+
+        return FloatMatrix2D(ids['row_ids'], ids['col_ids'], values)
+
+    def remove(self, name):
+        for path in self._paths(name):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cache(self, matrix):
+        """
+        cache: move a FloatMatrix2D into the cache, returns the memory-mapped copy
+        """
+        cached_matrix = self.get(self.put(matrix))
+        cached_matrix.sparse = matrix.sparse
+
+        return cached_matrix
+
+    def transpose(self, matrix):
+        """
+        transpose: write the transpose of a FloatMatrix2D to the cache block by block
+
+        unlike FloatMatrix2D.transpose, the transposed copy is never held in memory
+        """
+        n_rows, n_cols = matrix.shape
+        name = self.new_name()
+        values_path, ids_path = self._paths(name)
+
+        values = np.lib.format.open_memmap(values_path, mode='w+', dtype=np.float64,
+                                           shape=(n_cols, n_rows))
+        block_cols = max(COPY_BLOCK_CELLS // max(n_rows, 1), 1)
+        for start in range(0, n_cols, block_cols):
+            values[start:start + block_cols] = matrix.values[:, start:start + block_cols].T
+        values.flush()
+        del values
+
+        with open(ids_path, 'w') as ids_file:
+            json.dump({'row_ids': matrix.col_ids, 'col_ids': matrix.row_ids}, ids_file)
+
+        transposed_matrix = self.get(name)
+        transposed_matrix.sparse = matrix.sparse
+
+        return transposed_matrix
@@ -0,0 +1,149 @@
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+from FunctionalProfileUtil.Utils.MatrixCache import MatrixCache
+
+
+DEFAULT_SPLIT_MIN_SIZE = 256 * 1024 * 1024
+DEFAULT_RANGE_SIZE = 64 * 1024 * 1024
+
+
+def _parse_to_cache(parse_func, parse_args, scratch, name):
+    MatrixCache(scratch).put(parse_func(*parse_args), name=name)
+
+
+def _parse_text_range(file_path, start, end, delimiter, col_ids, scratch, name):
+    import pandas as pd
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    if not data.strip():
+        MatrixCache(scratch).put(FloatMatrix2D([], col_ids, np.empty((0, len(col_ids)))),
+                                 name=name)
+        return
+
+    df = pd.read_csv(io.BytesIO(data), sep=delimiter, header=None, index_col=0, dtype={0: str})
+    if len(df.columns) != len(col_ids):
+        raise ValueError('Found {} data columns in rows but {} in the header'.format(
+                                                            len(df.columns), len(col_ids)))
+    matrix = FloatMatrix2D.from_df(df)
+    MatrixCache(scratch).put(FloatMatrix2D(matrix.row_ids, col_ids, matrix.values), name=name)
+
+
+class ParseExecutor:
+    """
+    Parses profile files across a process pool
+
+    workers hand parsed matrices back through the scratch MatrixCache instead of pickling
+    DataFrames, the parent maps them without copying. Work is split one task per file,
+    and large delimited text files are split further into newline aligned byte ranges.
+    """
+
+    def __init__(self, scratch, max_workers=None, split_min_size=DEFAULT_SPLIT_MIN_SIZE,
+                 range_size=DEFAULT_RANGE_SIZE):
+        self.scratch = scratch
+        self.matrix_cache = MatrixCache(scratch)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.split_min_size = split_min_size
+        self.range_size = range_size
+
+    def parse_files(self, parse_func, parse_args):
+        """
+        parse_files: run parse_func(*args) for each args in parse_args, one process per file
+
+        parse_func - picklable module level function returning a FloatMatrix2D
+        returns list of (FloatMatrix2D, error) in input order
+        """
+        results = list()
+        max_workers = max(min(len(parse_args), self.max_workers), 1)
+        logging.info('start parsing {} profile files with {} workers'.format(len(parse_args),
+                                                                             max_workers))
+        names = [self.matrix_cache.new_name() for _ in parse_args]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_parse_to_cache, parse_func, args, self.scratch, name)
+                       for args, name in zip(parse_args, names)]
+            for future, name in zip(futures, names):
+                try:
+                    future.result()
+                    results.append((self.matrix_cache.get(name), None))
+                except Exception as err:
+                    self.matrix_cache.remove(name)
+                    results.append((None, str(err)))
+
+        return results
+
+    def should_split(self, file_path):
+        return self.max_workers > 1 and os.path.getsize(file_path) >= self.split_min_size
+
+    def _text_ranges(self, file_path):
+        """
+        _text_ranges: split the data lines of a text file into newline aligned byte ranges
+                      returns (header_line, ranges)
+        """
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            header_line = f.readline()
+            data_start = f.tell()
+
+            range_count = max(min(self.max_workers * 4,
+                                  (file_size - data_start) // self.range_size + 1), 1)
+            range_size = (file_size - data_start) // range_count + 1
+
+            boundaries = [data_start]
+            while boundaries[-1] < file_size:
+                f.seek(min(boundaries[-1] + range_size, file_size))
+                f.readline()
+                boundaries.append(min(f.tell(), file_size))
+
+        ranges = [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:])
+                  if end > start]
+
+        return header_line, ranges
+
+    def parse_text_file(self, file_path, delimiter):
+        """
+        parse_text_file: parse one large delimited text file with a worker per byte range
+
+        row ids are kept as written in the file. quoted fields spanning lines are not supported
+        """
+        import pandas as pd
+
+        header_line, ranges = self._text_ranges(file_path)
+        col_ids = pd.read_csv(io.BytesIO(header_line), sep=delimiter, index_col=0).columns
+        col_ids = col_ids.astype('str').tolist()
+
+        logging.info('start parsing {} in {} ranges with {} workers'.format(
+                                    os.path.basename(file_path), len(ranges), self.max_workers))
+
+        names = [self.matrix_cache.new_name() for _ in ranges]
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(_parse_text_range, file_path, start, end, delimiter,
+                                           col_ids, self.scratch, name)
+                           for (start, end), name in zip(ranges, names)]
+                for future in futures:
+                    future.result()
+        except Exception:
+            for name in names:
+                self.matrix_cache.remove(name)
+            raise
+
+        name, writer = self.matrix_cache.writer(col_ids)
+        try:
+            for range_name in names:
+                writer.append(self.matrix_cache.get(range_name))
+            writer.close()
+        except Exception:
+            writer.abort()
+            for range_name in names:
+                self.matrix_cache.remove(range_name)
+            raise
+
+        return self.matrix_cache.get(name)
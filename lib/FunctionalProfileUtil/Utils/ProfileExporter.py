@@ -0,0 +1,426 @@
+import datetime
+import errno
+import gzip
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from installed_clients.DataFileUtilClient import DataFileUtil
+from installed_clients.WorkspaceClient import Workspace
+from FunctionalProfileUtil.Utils.ColumnarStore import iter_parquet, write_parquet
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+from FunctionalProfileUtil.Utils.MatrixCache import MatrixCache
+from FunctionalProfileUtil.Utils.ProfileSubsetter import ID_INCLUDED_PATHS, MAX_INCLUDED_PATHS
+
+
+EXPORT_FORMATS = ['tsv', 'parquet', 'biom']
+# rows of a chunk are chosen so a chunk holds about this many cells
+EXPORT_CHUNK_CELLS = 4 * 1024 * 1024
+# level 6 is several times faster than the gzip module default of 9 at nearly the same ratio
+GZIP_COMPRESS_LEVEL = 6
+GZIP_COPY_SIZE = 16 * 1024 * 1024
+
+PARQUET_ROW_ID_COLUMN = 'row_id'
+
+BIOM_FORMAT_URL = 'http://biom-format.org'
+BIOM_FORMAT_VERSION = (2, 1)
+BIOM_TABLE_TYPE = 'Function table'
+
+
+def _import_h5py():
+    # h5py is only needed for BIOM export, keep it out of the service start up
+    try:
+        import h5py
+    except ImportError:
+        raise ValueError('BIOM export requires h5py, which is not installed')
+
+    return h5py
+
+
+class ProfileExporter:
+    """
+    Exports the matrix of a FunctionalProfile object to a TSV, Parquet or BIOM (HDF5) file
+
+    the matrix is written in row chunks. inline values are fetched one row block at a time
+    through workspace included paths, or with the whole object via DataFileUtil without a
+    workspace-url. values stored in columnar mode are read one Parquet row group at a time.
+    BIOM export writes sparse_values and their transpose straight from the stored CSR arrays,
+    other matrices are staged in the scratch MatrixCache to write both of their CSR
+    orientations.
+    """
+
+    @staticmethod
+    def _mkdir_p(path):
+        """
+        _mkdir_p: make directory for given path
+        """
+        if not path:
+            return
+        try:
+            os.makedirs(path)
+        except OSError as exc:
+            if exc.errno == errno.EEXIST and os.path.isdir(path):
+                pass
+            else:
+                raise
+
+    @staticmethod
+    def _validate_export_params(params):
+        for key in ['func_profile_ref', 'file_format']:
+            if key not in params:
+                raise ValueError('Required key {} not in supplied parameters'.format(key))
+
+        for param in params:
+            if param not in ['func_profile_ref', 'file_format', 'gzip']:
+                logging.warning('Unexpected parameter {} supplied'.format(param))
+
+        if str(params['file_format']).lower() not in EXPORT_FORMATS:
+            raise ValueError('Please choose one of {} as file format'.format(EXPORT_FORMATS))
+
+    @staticmethod
+    def _chunk_rows(col_ids):
+        return max(EXPORT_CHUNK_CELLS // max(len(col_ids), 1), 1)
+
+    def _get_func_profile(self, func_profile_ref):
+        """
+        _get_func_profile: fetch a FunctionalProfile object
+                           returns (object name, FloatMatrix2D data)
+
+        with a workspace-url the data holds ids, CSR row offsets and the columnar values
+        reference only, inline values are fetched by _iter_matrix_chunks
+        """
+        if self.ws:
+            func_profile = self.ws.get_objects2({'objects': [{
+                                            'ref': func_profile_ref,
+                                            'included': ID_INCLUDED_PATHS}]})['data'][0]
+        else:
+            logging.warning('no workspace-url configured, fetching the whole object {}'.format(
+                                                                            func_profile_ref))
+            func_profile = self.dfu.get_objects({'object_refs': [func_profile_ref]})['data'][0]
+
+        return func_profile['info'][1], func_profile['data']['data']
+
+    def _get_matrix_subset(self, func_profile_ref, included):
+        return self.ws.get_objects2({'objects': [{
+                                        'ref': func_profile_ref,
+                                        'included': included}]})['data'][0]['data']['data']
+
+    def _iter_dense_row_blocks(self, func_profile_ref, row_ids, col_ids):
+        chunk_rows = min(self._chunk_rows(col_ids), MAX_INCLUDED_PATHS)
+        for start in range(0, len(row_ids), chunk_rows):
+            end = min(start + chunk_rows, len(row_ids))
+            included = ['data/values/{}'.format(row) for row in range(start, end)]
+            values = self._get_matrix_subset(func_profile_ref, included)['values']
+            # None (null) cells become NaN
+            yield FloatMatrix2D(row_ids[start:end], col_ids,
+                                np.array(values, dtype=np.float64).reshape(end - start,
+                                                                           len(col_ids)))
+
+    def _iter_sparse_row_blocks(self, func_profile_ref, row_ids, col_ids, indptr):
+        """
+        _iter_sparse_row_blocks: fetch the CSR entries of inline sparse values in row blocks
+
+        a block holds as many rows as fit MAX_INCLUDED_PATHS stored entries, at least one
+        """
+        indptr = np.asarray(indptr, dtype=np.int64)
+        chunk_rows = self._chunk_rows(col_ids)
+        start = 0
+        while start < len(row_ids):
+            fitting_end = np.searchsorted(indptr, indptr[start] + MAX_INCLUDED_PATHS // 2,
+                                          side='right') - 1
+            end = min(max(int(fitting_end), start + 1), start + chunk_rows, len(row_ids))
+
+            values = np.zeros((end - start, len(col_ids)), dtype=np.float64)
+            positions = range(indptr[start], indptr[end])
+            if len(positions):
+                # an empty included list would return the whole object
+                included = ['data/sparse_values/{}/{}'.format(field, position)
+                            for field in ['indices', 'values'] for position in positions]
+                sparse_values = self._get_matrix_subset(func_profile_ref,
+                                                        included)['sparse_values']
+                rows = np.repeat(np.arange(end - start), np.diff(indptr[start:end + 1]))
+                values[rows, sparse_values['indices']] = np.array(sparse_values['values'],
+                                                                  dtype=np.float64)
+            yield FloatMatrix2D(row_ids[start:end], col_ids, values)
+            start = end
+
+    def _get_sparse_arrays(self, func_profile_ref, matrix_data):
+        """
+        _get_sparse_arrays: matrix_data with the complete CSR arrays of inline sparse values
+        """
+        sparse_values = matrix_data['sparse_values']
+        if 'indices' in sparse_values:
+            return matrix_data
+
+        fetched_values = self._get_matrix_subset(func_profile_ref,
+                                                 ['data/sparse_values/indices',
+                                                  'data/sparse_values/values'])['sparse_values']
+
+        return dict(matrix_data, sparse_values=dict(sparse_values, **fetched_values))
+
+    def _iter_matrix_chunks(self, func_profile_ref, matrix_data, output_directory):
+        """
+        _iter_matrix_chunks: yield the saved FunctionalProfile matrix as FloatMatrix2D row chunks
+        """
+        row_ids = matrix_data['row_ids']
+        col_ids = matrix_data['col_ids']
+
+        columnar_values = matrix_data.get('columnar_values')
+        if columnar_values is not None:
+            file_path = self.dfu.shock_to_file({'handle_id': columnar_values['values_handle'],
+                                                'file_path': output_directory})['file_path']
+            for matrix in iter_parquet(file_path, row_ids, col_ids):
+                yield matrix
+            os.remove(file_path)
+            return
+
+        if not self.ws:
+            for matrix in FloatMatrix2D.iter_dict_chunks(matrix_data,
+                                                         chunk_rows=self._chunk_rows(col_ids)):
+                yield matrix
+            return
+
+        sparse_values = matrix_data.get('sparse_values')
+        if sparse_values is None:
+            chunks = self._iter_dense_row_blocks(func_profile_ref, row_ids, col_ids)
+        else:
+            chunks = self._iter_sparse_row_blocks(func_profile_ref, row_ids, col_ids,
+                                                  sparse_values['indptr'])
+        for matrix in chunks:
+            yield matrix
+
+    @staticmethod
+    def _write_tsv(file_path, col_ids, chunks, compress=False):
+        """
+        _write_tsv: write row chunks as TSV with row ids in the first column, null cells empty
+        """
+        if compress:
+            tsv_file = gzip.open(file_path, 'wt', compresslevel=GZIP_COMPRESS_LEVEL)
+        else:
+            tsv_file = open(file_path, 'w')
+
+        with tsv_file:
+            tsv_file.write('\t'.join([''] + list(col_ids)) + '\n')
+            for matrix in chunks:
+                lines = list()
+                for row_id, row_values in zip(matrix.row_ids, matrix.values.tolist()):
+                    lines.append('\t'.join([row_id] + ['' if value != value else repr(value)
+                                                       for value in row_values]))
+                if lines:
+                    tsv_file.write('\n'.join(lines) + '\n')
+
+    @staticmethod
+    def _append_dataset(dataset, values):
+        size = dataset.shape[0]
+        dataset.resize((size + len(values),))
+        dataset[size:] = values
+
+    @staticmethod
+    def _iter_csr_slices(indptr, indices, stored_values, chunk_rows):
+        """
+        _iter_csr_slices: yield CSR arrays in blocks of chunk_rows rows like
+                          FloatMatrix2D.iter_csr_blocks
+        """
+        for start in range(0, len(indptr) - 1, chunk_rows):
+            end = min(start + chunk_rows, len(indptr) - 1)
+            stored = slice(indptr[start], indptr[end])
+            yield np.diff(indptr[start:end + 1]), indices[stored], stored_values[stored]
+
+    def _write_biom_axis(self, group, ids, csr_blocks):
+        """
+        _write_biom_axis: write ids and CSR matrix of one BIOM axis, returns the stored value count
+        """
+        h5py = _import_h5py()
+
+        group.create_dataset('ids', data=np.array(ids, dtype=object),
+                             dtype=h5py.special_dtype(vlen=str))
+        group.create_group('metadata')
+        group.create_group('group-metadata')
+
+        matrix_group = group.create_group('matrix')
+        datasets = {name: matrix_group.create_dataset(name, shape=(0,), maxshape=(None,),
+                                                      dtype=dtype, chunks=True,
+                                                      compression='gzip')
+                    for name, dtype in [('data', np.float64),
+                                        ('indices', np.int32),
+                                        # offsets of large matrices overflow int32
+                                        ('indptr', np.int64)]}
+
+        self._append_dataset(datasets['indptr'], [0])
+        nnz = 0
+        for row_counts, indices, stored_values in csr_blocks:
+            if row_counts.size:
+                self._append_dataset(datasets['indptr'], nnz + np.cumsum(row_counts))
+                nnz += int(row_counts.sum())
+            if stored_values.size:
+                self._append_dataset(datasets['indices'], indices)
+                self._append_dataset(datasets['data'], stored_values)
+
+        return nnz
+
+    def _write_biom_file(self, file_path, table_id, shape, observations, samples):
+        """
+        _write_biom_file: write a BIOM 2.1 HDF5 table
+
+        observations and samples are (ids, CSR blocks) of the matrix and of its transpose
+        """
+        h5py = _import_h5py()
+
+        with h5py.File(file_path, 'w') as biom_file:
+            biom_file.attrs['id'] = table_id
+            biom_file.attrs['type'] = BIOM_TABLE_TYPE
+            biom_file.attrs['format-url'] = BIOM_FORMAT_URL
+            biom_file.attrs['format-version'] = BIOM_FORMAT_VERSION
+            biom_file.attrs['generated-by'] = 'FunctionalProfileUtil'
+            biom_file.attrs['creation-date'] = datetime.datetime.now().isoformat()
+            biom_file.attrs['shape'] = shape
+
+            nnz = self._write_biom_axis(biom_file.create_group('observation'), *observations)
+            self._write_biom_axis(biom_file.create_group('sample'), *samples)
+            biom_file.attrs['nnz'] = nnz
+
+    def _write_biom(self, file_path, col_ids, chunks, table_id):
+        """
+        _write_biom: write row chunks as a BIOM 2.1 HDF5 table
+
+        matrix rows are BIOM observations and columns are samples. BIOM has no null, null
+        cells are stored as NaN
+        """
+        name, cache_writer = self.matrix_cache.writer(col_ids)
+        try:
+            for matrix in chunks:
+                cache_writer.append(matrix)
+            cache_writer.close()
+        except Exception:
+            cache_writer.abort()
+            raise
+        matrix = self.matrix_cache.get(name)
+        transposed = self.matrix_cache.transpose(matrix)
+
+        self._write_biom_file(
+                file_path, table_id, matrix.shape,
+                (matrix.row_ids, matrix.iter_csr_blocks(chunk_rows=self._chunk_rows(col_ids))),
+                (transposed.row_ids,
+                 transposed.iter_csr_blocks(chunk_rows=self._chunk_rows(transposed.col_ids))))
+
+    def _write_sparse_biom(self, file_path, matrix_data, table_id):
+        """
+        _write_sparse_biom: write a matrix stored as sparse_values as a BIOM 2.1 HDF5 table
+
+        observations are written from the stored CSR arrays, samples from their transpose
+        (CSC) computed on the stored entries, no dense copy of the matrix is built
+        """
+        row_ids = matrix_data['row_ids']
+        col_ids = matrix_data['col_ids']
+        sparse_values = matrix_data['sparse_values']
+        indptr = np.asarray(sparse_values['indptr'], dtype=np.int64)
+        indices = np.asarray(sparse_values['indices'], dtype=np.int64)
+        # None (null) cells become NaN
+        stored_values = np.array(sparse_values['values'], dtype=np.float64)
+
+        rows = np.repeat(np.arange(len(row_ids)), np.diff(indptr))
+        # stable, so rows stay in order within each column
+        order = np.argsort(indices, kind='stable')
+        col_indptr = np.concatenate([[0], np.cumsum(np.bincount(indices,
+                                                                minlength=len(col_ids)))])
+
+        self._write_biom_file(
+                file_path, table_id, (len(row_ids), len(col_ids)),
+                (row_ids, self._iter_csr_slices(indptr, indices, stored_values,
+                                                self._chunk_rows(col_ids))),
+                (col_ids, self._iter_csr_slices(col_indptr, rows[order], stored_values[order],
+                                                self._chunk_rows(row_ids))))
+
+    @staticmethod
+    def _gzip_file(file_path):
+        gzip_file_path = file_path + '.gz'
+        with open(file_path, 'rb') as source_file, \
+                gzip.open(gzip_file_path, 'wb', compresslevel=GZIP_COMPRESS_LEVEL) as gzip_file:
+            shutil.copyfileobj(source_file, gzip_file, GZIP_COPY_SIZE)
+        os.remove(file_path)
+
+        return gzip_file_path
+
+    def __init__(self, config):
+        self.callback_url = config['SDK_CALLBACK_URL']
+        self.scratch = config['scratch']
+        self.token = config['KB_AUTH_TOKEN']
+        self.ws_url = config.get('workspace-url')
+        self.matrix_cache = MatrixCache(self.scratch)
+        self._dfu = None
+        self._ws = None
+
+    @property
+    def dfu(self):
+        if self._dfu is None:
+            self._dfu = DataFileUtil(self.callback_url)
+        return self._dfu
+
+    @dfu.setter
+    def dfu(self, dfu):
+        self._dfu = dfu
+
+    @property
+    def ws(self):
+        """
+        ws: Workspace client, None if no workspace-url is configured
+        """
+        if self._ws is None and self.ws_url:
+            self._ws = Workspace(self.ws_url, token=self.token)
+        return self._ws
+
+    @ws.setter
+    def ws(self, ws):
+        self._ws = ws
+
+    def export_func_profile(self, params):
+        """
+        export_func_profile: write the matrix of a FunctionalProfile to a file in Shock
+        """
+        self._validate_export_params(params)
+
+        func_profile_ref = params['func_profile_ref']
+        file_format = params['file_format'].lower()
+        compress = bool(params.get('gzip', False))
+
+        logging.info('start exporting {} as {}'.format(func_profile_ref, file_format))
+        func_profile_name, matrix_data = self._get_func_profile(func_profile_ref)
+
+        output_directory = os.path.join(self.scratch, str(uuid.uuid4()))
+        self._mkdir_p(output_directory)
+        try:
+            file_path = os.path.join(output_directory,
+                                     '{}.{}'.format(func_profile_name, file_format))
+            col_ids = matrix_data['col_ids']
+            chunks = self._iter_matrix_chunks(func_profile_ref, matrix_data, output_directory)
+
+            if file_format == 'tsv':
+                if compress:
+                    file_path += '.gz'
+                self._write_tsv(file_path, col_ids, chunks, compress=compress)
+            else:
+                if file_format == 'parquet':
+                    write_parquet(file_path, col_ids, chunks, row_id_column=PARQUET_ROW_ID_COLUMN)
+                elif matrix_data.get('sparse_values') is not None:
+                    # the transpose needs all stored entries, the CSR arrays are fetched whole
+                    self._write_sparse_biom(file_path,
+                                            self._get_sparse_arrays(func_profile_ref, matrix_data),
+                                            func_profile_name)
+                else:
+                    self._write_biom(file_path, col_ids, chunks, func_profile_name)
+                if compress:
+                    file_path = self._gzip_file(file_path)
+
+            file_size = os.path.getsize(file_path)
+            logging.info('exported file {} has {} bytes'.format(os.path.basename(file_path),
+                                                                file_size))
+            shock_id = self.dfu.file_to_shock({'file_path': file_path})['shock_id']
+        finally:
+            shutil.rmtree(output_directory, ignore_errors=True)
+
+        return {'shock_id': shock_id,
+                'file_name': os.path.basename(file_path),
+                'size': file_size}
@@ -1,9 +1,8 @@
 
+import csv
 import errno
 import logging
 import os
-import pandas as pd
-from xlrd.biffh import XLRDError
 import uuid
 import shutil
 import math
@@ -14,12 +13,69 @@ from installed_clients.KBaseReportClient import KBaseReport
 from installed_clients.kb_GenericsReportClient import kb_GenericsReport
 from installed_clients.GenericsAPIClient import GenericsAPI
 from installed_clients.WsLargeDataIOClient import WsLargeDataIO
+from installed_clients.WorkspaceClient import Workspace
+from FunctionalProfileUtil.Utils.ColumnarStore import PARQUET_COMPRESSION, PARQUET_FORMAT
+from FunctionalProfileUtil.Utils.ColumnarStore import columnar_available, read_parquet
+from FunctionalProfileUtil.Utils.ColumnarStore import write_parquet
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+from FunctionalProfileUtil.Utils.HeatmapPreview import DEFAULT_HEATMAP_MAX_COLS
+from FunctionalProfileUtil.Utils.HeatmapPreview import DEFAULT_HEATMAP_MAX_ROWS
+from FunctionalProfileUtil.Utils.HeatmapPreview import DEFAULT_PREVIEW_METHOD, heatmap_preview
+from FunctionalProfileUtil.Utils.HeatmapPreview import HeatmapPreviewBuilder
+from FunctionalProfileUtil.Utils.MatrixCache import MatrixCache
+from FunctionalProfileUtil.Utils.ParseExecutor import DEFAULT_RANGE_SIZE, ParseExecutor
+from FunctionalProfileUtil.Utils.ProfileStreamWriter import ProfileStreamWriter
+from FunctionalProfileUtil.Utils.ProfileSummary import ProfileSummaryBuilder, summarize
+from FunctionalProfileUtil.Utils.ProfileSummary import DEFAULT_SKETCH_CELLS, summary_table
+from FunctionalProfileUtil.Utils.StageTimer import StageTimer
 
 
 DATA_EPISTEMOLOGY = ['measured', 'asserted', 'predicted']
 PROFILE_CATEGORY = ['community',  'organism']
 PROFILE_TYPE = ['amplicon', 'mg', 'modelset']
 
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+EXCEL_EXTENSIONS = ['.xlsx', '.xls']
+DELIMITER_CANDIDATES = '\t,;|'
+SNIFF_SIZE = 64 * 1024
+
+DFU_SAVE_SIZE_LIMIT = 200 * 1024 * 1024
+MAX_OBJECT_SIZE = 1 * 1024 * 1024 * 1024
+
+MISMATCH_SAMPLE_SIZE = 10
+
+# json keeps the matrix inline in the object, columnar uploads it as a Parquet file referenced
+# by a handle. objects above MAX_OBJECT_SIZE switch to columnar if pyarrow is installed.
+# object JSON of a streamed text profile is assumed to be up to JSON_SIZE_FACTOR times the file
+STORAGE_MODES = ['json', 'columnar']
+DEFAULT_STORAGE_MODE = 'json'
+JSON_SIZE_FACTOR = 2
+
+# profiles with at least the 'sparse-threshold' config fraction of zero cells are saved in sparse
+# (CSR) encoding. it is opt-in until the workspace type and FunctionalProfile readers support
+# sparse_values, no profile reaches the default threshold
+DEFAULT_SPARSE_THRESHOLD = math.inf
+
+# text profiles whose in-memory import would exceed the memory budget are streamed in row chunks.
+# peak memory of the in-memory import is roughly IN_MEMORY_SIZE_FACTOR times the file size,
+# a parsed chunk takes about STREAM_BYTES_PER_CELL bytes per cell
+DEFAULT_IMPORT_MEMORY_BUDGET = 4 * 1024 * 1024 * 1024
+IN_MEMORY_SIZE_FACTOR = 8
+STREAM_BYTES_PER_CELL = 64
+
+# in-memory imports with a matrix cache parse text files in chunks of PARSE_CHUNK_CELLS cells
+PARSE_CHUNK_CELLS = 1024 * 1024
+
+# parse processes used unless the 'parse-workers' config asks for more, fewer if the CPUs
+# available to the job or the memory budget (IN_MEMORY_SIZE_FACTOR times a byte range per
+# worker) do not allow it
+DEFAULT_PARSE_WORKERS = 4
+
+# base object fields used by import, values of the base matrix are never needed
+BASE_OBJECT_INCLUDED_PATHS = ['col_attributemapping_ref', 'row_attributemapping_ref',
+                              'data/row_ids', 'data/col_ids']
+
 
 class ProfileImporter:
 
@@ -62,110 +118,411 @@ class ProfileImporter:
         s = round(size_bytes / p, 2)
         return "%s %s" % (s, size_name[i])
 
-    def _calculate_object_size(self, func_profile_data):
-        json_size = 0
-        try:
-            logging.info('start calculating object size')
-            json_object = json.dumps(func_profile_data).encode("utf-8")
-            json_size = len(json_object)
-            size_str = self._convert_size(json_size)
-            logging.info('serialized object JSON size: {}'.format(size_str))
-        except Exception:
-            logging.info('failed to calculate object size')
+    @staticmethod
+    def _iter_func_profile_json(func_profile_data):
+        """
+        _iter_func_profile_json: yield JSON encoding of FunctionalProfile data in chunks
 
-        return json_size
+        FloatMatrix2D values are serialized directly from the matrix array
+        """
+        yield '{'
+        for idx, (key, value) in enumerate(func_profile_data.items()):
+            if idx:
+                yield ', '
+            yield json.dumps(key) + ': '
+            if isinstance(value, FloatMatrix2D):
+                for chunk in value.iter_json():
+                    yield chunk
+            else:
+                yield json.dumps(value)
+        yield '}'
 
     @staticmethod
-    def _file_to_df(file_path):
-        logging.info('start parsing file content to data frame')
+    def _detect_file_format(file_path):
+        """
+        _detect_file_format: detect file format from magic bytes and file extension
+                             returns one of 'xlsx', 'xls' or 'text'
+        """
+        with open(file_path, 'rb') as f:
+            header = f.read(len(XLS_MAGIC))
+
+        if header.startswith(XLSX_MAGIC):
+            return 'xlsx'
+        if header.startswith(XLS_MAGIC):
+            return 'xls'
+
+        if os.path.splitext(file_path)[1].lower() in EXCEL_EXTENSIONS:
+            raise ValueError('Cannot parse file. {} is not a valid excel file'.format(
+                                                                os.path.basename(file_path)))
+
+        return 'text'
+
+    @staticmethod
+    def _detect_delimiter(file_path):
+        """
+        _detect_delimiter: infer delimiter of a text file from its first few KB
+        """
+        with open(file_path, 'rb') as f:
+            sample = f.read(SNIFF_SIZE).decode('utf-8', errors='replace')
+
+        # only sniff complete lines
+        if len(sample) >= SNIFF_SIZE and '\n' in sample:
+            sample = sample[:sample.rindex('\n')]
 
         try:
-            df = pd.read_excel(file_path, sheet_name='data', index_col=0)
+            return csv.Sniffer().sniff(sample, delimiters=DELIMITER_CANDIDATES).delimiter
+        except csv.Error:
+            # Sniffer gives up on single line samples, fall back to the most frequent candidate
+            header = sample.splitlines()[0] if sample else ''
+            counts = {sep: header.count(sep) for sep in DELIMITER_CANDIDATES}
+            delimiter = max(counts, key=counts.get)
+            if not counts[delimiter]:
+                err_msg = 'Cannot parse file. Please provide valide tsv, excel or csv file'
+                raise ValueError(err_msg)
+            return delimiter
 
-        except XLRDError:
-            try:
-                df = pd.read_excel(file_path, index_col=0)
-                logging.warning('WARNING: A sheet named "data" was not found in the attached file,'
-                                ' proceeding with the first sheet as the data sheet.')
+    @staticmethod
+    def _excel_to_df(file_path):
+        import pandas as pd
 
-            except XLRDError:
+        excel_file = pd.ExcelFile(file_path)
 
-                try:
-                    reader = pd.read_csv(file_path, sep=None, iterator=True)
-                    inferred_sep = reader._engine.data.dialect.delimiter
-                    df = pd.read_csv(file_path, sep=inferred_sep, index_col=0)
-                except Exception:
-                    err_msg = 'Cannot parse file. Please provide valide tsv, excel or csv file'
-                    raise ValueError(err_msg)
+        sheet_name = 'data'
+        if sheet_name not in excel_file.sheet_names:
+            sheet_name = excel_file.sheet_names[0]
+            logging.warning('WARNING: A sheet named "data" was not found in the attached file,'
+                            ' proceeding with the first sheet as the data sheet.')
+
+        return excel_file.parse(sheet_name, index_col=0)
+
+    @classmethod
+    def _file_to_df(cls, file_path):
+        import pandas as pd
+
+        logging.info('start parsing file content to data frame')
+
+        file_format = cls._detect_file_format(file_path)
+        logging.info('detected file format: {}'.format(file_format))
+
+        if file_format == 'text':
+            delimiter = cls._detect_delimiter(file_path)
+            logging.info('detected delimiter: {}'.format(repr(delimiter)))
+
+        try:
+            if file_format in ['xlsx', 'xls']:
+                df = cls._excel_to_df(file_path)
+            else:
+                # row ids are kept as written (e.g. '001'), like the split and streaming parsers
+                df = pd.read_csv(file_path, sep=delimiter, index_col=0, dtype={0: str})
+        except Exception:
+            err_msg = 'Cannot parse file. Please provide valide tsv, excel or csv file'
+            raise ValueError(err_msg)
 
         df.index = df.index.astype('str')
         df.columns = df.columns.astype('str')
 
-        # fill NA with "None" so that they are properly represented as nulls in the KBase Object
-        df = df.where((pd.notnull(df)), None)
+        return df
 
-        # df = df.applymap(str)
+    @staticmethod
+    def _estimate_object_size(func_profile_data):
+        """
+        _estimate_object_size: predict serialized FunctionalProfile JSON size without dumping it
+                               returns (estimate, lower_bound, upper_bound)
+        """
+        fixed_width = len('{') + len('}') + len(', ') * max(len(func_profile_data) - 1, 0)
+        estimate = lower_bound = upper_bound = 0
+        for key, value in func_profile_data.items():
+            fixed_width += len(json.dumps(key) + ': ')
+            if isinstance(value, FloatMatrix2D):
+                value_estimate, value_lower, value_upper = value.estimate_json_size()
+                estimate += value_estimate
+                lower_bound += value_lower
+                upper_bound += value_upper
+            else:
+                fixed_width += len(json.dumps(value))
 
-        return df
+        return fixed_width + estimate, fixed_width + lower_bound, fixed_width + upper_bound
 
-    def _save_func_profile(self, workspace_id, func_profile_data, func_profile_obj_name):
-        logging.info('start saving FunctionalProfile object: {}'.format(func_profile_obj_name))
+    def _dump_func_profile(self, func_profile_data, data_path):
+        """
+        _dump_func_profile: stream FunctionalProfile JSON into data_path chunk by chunk
+                            returns number of bytes written
+        """
+        logging.info('Dumpping object data to file: {}'.format(data_path))
+        json_size = 0
+        with open(data_path, 'w') as data_file:
+            for chunk in self._iter_func_profile_json(func_profile_data):
+                data_file.write(chunk)
+                # json.dumps escapes non-ASCII characters so string length equals byte length
+                json_size += len(chunk)
 
-        obj_size = self._calculate_object_size(func_profile_data)
+        logging.info('serialized object JSON size: {}'.format(self._convert_size(json_size)))
 
-        MB_200 = 200 * 1024 * 1024
-        GB_1 = 1 * 1024 * 1024 * 1024
+        return json_size
 
-        if obj_size > GB_1:
+    @staticmethod
+    def _to_obj_data(func_profile_data):
+        return {key: value.to_dict() if isinstance(value, FloatMatrix2D) else value
+                for key, value in func_profile_data.items()}
+
+    def _save_via_dfu(self, workspace_id, func_profile_data, func_profile_obj_name):
+        logging.info('Starting saving object via DataFileUtil')
+        info = self.dfu.save_objects({
+            "id": workspace_id,
+            "objects": [{
+                "type": 'KBaseProfile.FunctionalProfile',
+                "data": self._to_obj_data(func_profile_data),
+                "name": func_profile_obj_name
+            }]
+        })[0]
+
+        return info
+
+    def _save_via_ws_large_data(self, workspace_id, data_path, func_profile_obj_name):
+        logging.info('Starting saving object via WsLargeDataIO')
+        info = self.ws_large_data.save_objects({
+            "id": workspace_id,
+            "objects": [{
+                "type": 'KBaseProfile.FunctionalProfile',
+                "data_json_file": data_path,
+                "name": func_profile_obj_name
+            }]
+        })[0]
+
+        return info
+
+    def _save_func_profile(self, workspace_id, func_profile_data, func_profile_obj_name,
+                           timer=None):
+        logging.info('start saving FunctionalProfile object: {}'.format(func_profile_obj_name))
+        timer = timer or StageTimer()
+
+        with timer.span('estimate_size') as span:
+            estimate, lower_bound, upper_bound = self._estimate_object_size(func_profile_data)
+            span['bytes_out'] = estimate
+        logging.info('estimated object JSON size: {} (between {} and {})'.format(
+                                                            self._convert_size(estimate),
+                                                            self._convert_size(lower_bound),
+                                                            self._convert_size(upper_bound)))
+
+        if estimate > MAX_OBJECT_SIZE and self._can_save_columnar(func_profile_data):
+            logging.info('object is too large for JSON storage, saving values in columnar '
+                         'storage')
+            func_profile_data = self._to_columnar(func_profile_data, func_profile_obj_name,
+                                                  timer=timer)
+            estimate, lower_bound, upper_bound = self._estimate_object_size(func_profile_data)
+
+        if lower_bound > MAX_OBJECT_SIZE:
             raise ValueError('Object is too large')
-        elif obj_size <= MB_200:
-            logging.info('Starting saving object via DataFileUtil')
-            info = self.dfu.save_objects({
-                "id": workspace_id,
-                "objects": [{
-                    "type": 'KBaseProfile.FunctionalProfile',
-                    "data": func_profile_data,
-                    "name": func_profile_obj_name
-                }]
-            })[0]
+        elif upper_bound <= DFU_SAVE_SIZE_LIMIT:
+            # DataFileUtil client serializes the object as part of the save call
+            with timer.span('save', bytes_in=estimate):
+                info = self._save_via_dfu(workspace_id, func_profile_data, func_profile_obj_name)
         else:
-            logging.info('Starting saving object via WsLargeDataIO')
-            data_path = os.path.join(self.scratch,
-                                     func_profile_obj_name + "_" + str(uuid.uuid4()) + ".json")
-            logging.info('Dumpping object data to file: {}'.format(data_path))
-            json.dump(func_profile_data, open(data_path, 'w'))
-
-            info = self.ws_large_data.save_objects({
-                "id": workspace_id,
-                "objects": [{
-                    "type": 'KBaseProfile.FunctionalProfile',
-                    "data_json_file": data_path,
-                    "name": func_profile_obj_name
-                }]
-            })[0]
+            # estimate is close to or above the DataFileUtil limit, dump to file for exact size
+            data_path = self._func_profile_data_path(func_profile_obj_name)
+            with timer.span('serialize') as span:
+                obj_size = self._dump_func_profile(func_profile_data, data_path)
+                span['bytes_out'] = obj_size
+            if obj_size > MAX_OBJECT_SIZE and self._can_save_columnar(func_profile_data):
+                os.remove(data_path)
+                logging.info('object JSON is too large, saving values in columnar storage')
+                func_profile_data = self._to_columnar(func_profile_data, func_profile_obj_name,
+                                                      timer=timer)
+                return self._save_func_profile(workspace_id, func_profile_data,
+                                               func_profile_obj_name, timer=timer)
+            return self._save_func_profile_file(workspace_id, data_path, obj_size,
+                                                func_profile_obj_name,
+                                                func_profile_data=func_profile_data, timer=timer)
 
         obj_ref = "%s/%s/%s" % (info[6], info[0], info[4])
 
         return obj_ref
 
-    def _generate_visualization_content(self, func_profile_ref, output_directory):
-        func_profile_data = self.dfu.get_objects(
-                                            {'object_refs': [func_profile_ref]})['data'][0]['data']
+    @staticmethod
+    def _can_save_columnar(func_profile_data):
+        return isinstance(func_profile_data.get('data'), FloatMatrix2D) and columnar_available()
 
-        data = func_profile_data.get('data')
-        data_df = pd.DataFrame(data['values'],
-                               index=data['row_ids'], columns=data['col_ids'])
+    def _save_columnar_values(self, col_ids, matrices, func_profile_obj_name, timer=None):
+        """
+        _save_columnar_values: write FloatMatrix2D row chunks as a Parquet file and upload it
 
-        data_df.fillna(0, inplace=True)
+        returns (row_ids, columnar_values) where columnar_values references the file handle
+        """
+        timer = timer or StageTimer()
+        file_path = os.path.join(self.scratch, '{}_{}.{}'.format(
+                                        func_profile_obj_name, str(uuid.uuid4()), PARQUET_FORMAT))
+        try:
+            with timer.span('columnar_serialize') as span:
+                row_ids, file_size = write_parquet(file_path, col_ids, matrices)
+                span['bytes_out'] = file_size
+            logging.info('columnar values size: {}'.format(self._convert_size(file_size)))
+
+            with timer.span('columnar_upload', bytes_in=file_size):
+                handle = self.dfu.file_to_shock({'file_path': file_path,
+                                                 'make_handle': 1})['handle']
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        columnar_values = {'values_handle': handle['hid'],
+                           'file_format': PARQUET_FORMAT,
+                           'compression': PARQUET_COMPRESSION}
+
+        return row_ids, columnar_values
+
+    def _to_columnar(self, func_profile_data, func_profile_obj_name, timer=None):
+        """
+        _to_columnar: move FunctionalProfile matrix values into columnar storage
+
+        returns a copy of func_profile_data whose data keeps only ids and columnar_values
+        """
+        profile_data = func_profile_data['data']
+        row_ids, columnar_values = self._save_columnar_values(profile_data.col_ids,
+                                                              [profile_data],
+                                                              func_profile_obj_name, timer=timer)
+
+        return dict(func_profile_data, data={'row_ids': row_ids,
+                                             'col_ids': profile_data.col_ids,
+                                             'columnar_values': columnar_values})
+
+    def _load_profile_data(self, matrix_data):
+        """
+        _load_profile_data: FloatMatrix2D of saved FunctionalProfile data in any storage mode
+        """
+        columnar_values = matrix_data.get('columnar_values')
+        if columnar_values is None:
+            return FloatMatrix2D.from_dict(matrix_data)
+
+        output_directory = os.path.join(self.scratch, str(uuid.uuid4()))
+        self._mkdir_p(output_directory)
+        try:
+            file_path = self.dfu.shock_to_file({'handle_id': columnar_values['values_handle'],
+                                                'file_path': output_directory})['file_path']
+            return read_parquet(file_path, matrix_data['row_ids'], matrix_data['col_ids'])
+        finally:
+            shutil.rmtree(output_directory, ignore_errors=True)
+
+    def _func_profile_data_path(self, func_profile_obj_name):
+        return os.path.join(self.scratch,
+                            func_profile_obj_name + "_" + str(uuid.uuid4()) + ".json")
+
+    def _save_func_profile_file(self, workspace_id, data_path, obj_size, func_profile_obj_name,
+                                func_profile_data=None, timer=None):
+        """
+        _save_func_profile_file: save FunctionalProfile JSON dumped to data_path
+
+        objects within the DataFileUtil limit are saved from func_profile_data, or loaded back
+        from data_path if it is not given
+        """
+        timer = timer or StageTimer()
+
+        if obj_size > MAX_OBJECT_SIZE:
+            os.remove(data_path)
+            raise ValueError('Object is too large')
+
+        with timer.span('save', bytes_in=obj_size):
+            if obj_size <= DFU_SAVE_SIZE_LIMIT:
+                if func_profile_data is None:
+                    with open(data_path) as data_file:
+                        func_profile_data = json.load(data_file)
+                os.remove(data_path)
+                info = self._save_via_dfu(workspace_id, func_profile_data, func_profile_obj_name)
+            else:
+                info = self._save_via_ws_large_data(workspace_id, data_path,
+                                                    func_profile_obj_name)
+
+        obj_ref = "%s/%s/%s" % (info[6], info[0], info[4])
+
+        return obj_ref
+
+    def _save_func_profiles(self, workspace_id, func_profiles):
+        """
+        _save_func_profiles: save many FunctionalProfile objects
+
+        objects small enough for DataFileUtil are saved together in as few save_objects calls
+        as the DataFileUtil size limit allows, larger objects go through _save_func_profile
+
+        func_profiles - list of (func_profile_obj_name, func_profile_data)
+        returns list of (func_profile_ref, error) in input order
+        """
+        results = [None] * len(func_profiles)
+
+        dfu_batches = [[]]
+        batch_size = 0
+        for idx, (func_profile_obj_name, func_profile_data) in enumerate(func_profiles):
+            upper_bound = self._estimate_object_size(func_profile_data)[2]
+            if upper_bound > DFU_SAVE_SIZE_LIMIT:
+                continue
+            if batch_size + upper_bound > DFU_SAVE_SIZE_LIMIT:
+                dfu_batches.append([])
+                batch_size = 0
+            dfu_batches[-1].append(idx)
+            batch_size += upper_bound
+
+        for dfu_batch in dfu_batches:
+            if not dfu_batch:
+                continue
+            logging.info('Starting saving {} objects via DataFileUtil'.format(len(dfu_batch)))
+            try:
+                infos = self.dfu.save_objects({
+                    "id": workspace_id,
+                    "objects": [{
+                        "type": 'KBaseProfile.FunctionalProfile',
+                        "data": self._to_obj_data(func_profiles[idx][1]),
+                        "name": func_profiles[idx][0]
+                    } for idx in dfu_batch]
+                })
+            except Exception as err:
+                logging.warning('failed to save objects together, saving them one by one: '
+                                '{}'.format(err))
+                continue
+            for idx, info in zip(dfu_batch, infos):
+                results[idx] = ("%s/%s/%s" % (info[6], info[0], info[4]), None)
+
+        for idx, (func_profile_obj_name, func_profile_data) in enumerate(func_profiles):
+            if results[idx] is not None:
+                continue
+            try:
+                results[idx] = (self._save_func_profile(workspace_id, func_profile_data,
+                                                        func_profile_obj_name), None)
+            except Exception as err:
+                results[idx] = (None, str(err))
+
+        return results
+
+    def _generate_visualization_content(self, func_profile_ref, output_directory,
+                                        profile_data=None, summary=None, preview_builder=None):
+        if preview_builder is not None:
+            # streamed profiles are not kept in memory, their preview was collected while
+            # streaming
+            row_ids, col_ids = preview_builder.row_ids, preview_builder.col_ids
+            heatmap_data, heatmap_description = preview_builder.preview(summary)
+        else:
+            if profile_data is None:
+                # only fetch the saved object when no in-memory matrix is provided
+                func_profile_data = self.dfu.get_objects(
+                                            {'object_refs': [func_profile_ref]})['data'][0]['data']
+                profile_data = self._load_profile_data(func_profile_data.get('data'))
+                summary = func_profile_data.get('summary')
+            if summary is None:
+                # objects saved before summaries were stored with them
+                summary = summarize(profile_data, sketch_cells=self.summary_sketch_cells)
+
+            # the heatmap service only gets a bounded size preview of large profiles
+            heatmap_data, heatmap_description = heatmap_preview(profile_data, summary,
+                                                                max_rows=self.heatmap_max_rows,
+                                                                max_cols=self.heatmap_max_cols,
+                                                                method=self.heatmap_preview)
+            row_ids, col_ids = profile_data.row_ids, profile_data.col_ids
         tsv_file_path = os.path.join(output_directory, 'heatmap_data_{}.tsv'.format(
                                                                     str(uuid.uuid4())))
-        data_df.to_csv(tsv_file_path)
+        heatmap_data.to_df().to_csv(tsv_file_path)
         heatmap_dir = self.report_util.build_heatmap_html({
                                             'tsv_file_path': tsv_file_path,
                                             'cluster_data': True})['html_dir']
 
-        row_data_summary = data_df.T.describe().to_string()
-        col_data_summary = data_df.describe().to_string()
+        row_data_summary = summary_table(summary['rows'], row_ids)
+        col_data_summary = summary_table(summary['cols'], col_ids)
 
         tab_def_content = ''
         tab_content = ''
@@ -179,8 +536,7 @@ class ProfileImporter:
         tab_def_content += '''>Profile Statistics</button>\n'''
 
         tab_content += '''\n<div id="{}" class="tabcontent" style="overflow:auto">'''.format(viewer_name)
-        tab_content += '''\n<h5>Profile Size: {} x {}</h5>'''.format(len(data_df.index),
-                                                                     len(data_df.columns))
+        tab_content += '''\n<h5>Profile Size: {} x {}</h5>'''.format(len(row_ids), len(col_ids))
         tab_content += '''\n<h5>Row Aggregating Statistics</h5>'''
         html = '''\n<pre class="tab">''' + str(row_data_summary).replace("\n", "<br>") + "</pre>"
         tab_content += html
@@ -210,6 +566,8 @@ class ProfileImporter:
 
         if heatmap_index_page:
             tab_content += '''\n<div id="{}" class="tabcontent">'''.format(viewer_name)
+            if heatmap_description:
+                tab_content += '''\n<p>{}.</p>'''.format(heatmap_description)
             tab_content += '\n<iframe height="1300px" width="100%" '
             tab_content += 'src="{}" '.format(heatmap_index_page)
             tab_content += 'style="border:none;"></iframe>'
@@ -223,7 +581,8 @@ class ProfileImporter:
         tab_def_content += '\n</div>\n'
         return tab_def_content + tab_content
 
-    def _generate_html_report(self, func_profile_ref):
+    def _generate_html_report(self, func_profile_ref, profile_data=None, summary=None,
+                              preview_builder=None):
 
         logging.info('Start generating report page')
 
@@ -235,8 +594,11 @@ class ProfileImporter:
         self._mkdir_p(output_directory)
         result_file_path = os.path.join(output_directory, 'func_profile_viewer_report.html')
 
-        visualization_content = self._generate_visualization_content(func_profile_ref,
-                                                                     output_directory)
+        visualization_content = self._generate_visualization_content(
+                                                            func_profile_ref, output_directory,
+                                                            profile_data=profile_data,
+                                                            summary=summary,
+                                                            preview_builder=preview_builder)
 
         with open(result_file_path, 'w') as result_file:
             with open(os.path.join(os.path.dirname(__file__),
@@ -257,12 +619,15 @@ class ProfileImporter:
                             })
         return html_report
 
-    def _gen_func_profile_report(self, func_profile_ref, workspace_id):
+    def _gen_func_profile_report(self, func_profile_ref, workspace_id, profile_data=None,
+                                 summary=None, preview_builder=None):
         logging.info('start generating report')
 
         objects_created = [{'ref': func_profile_ref, 'description': 'Imported FunctionalProfile'}]
 
-        output_html_files = self._generate_html_report(func_profile_ref)
+        output_html_files = self._generate_html_report(func_profile_ref, profile_data=profile_data,
+                                                       summary=summary,
+                                                       preview_builder=preview_builder)
 
         report_params = {'message': '',
                          'objects_created': objects_created,
@@ -279,7 +644,45 @@ class ProfileImporter:
 
         return report_output
 
-    def _build_profile_data(self, profile_file_path, item_ids, profile_category, staging_file=False):
+    @staticmethod
+    def _match_item_ids(row_ids, col_ids, item_ids, profile_category):
+        """
+        _match_item_ids: match profile file ids against base object item ids in both orientations
+
+        community profiles are expected to have item ids as columns, organism profiles as rows.
+        returns a compact report with match counts/rates and a sample of unmatched ids for each
+        orientation, plus the chosen orientation ('original', 'transposed' or None)
+        """
+        import pandas as pd
+
+        item_index = pd.Index(item_ids).unique()
+        row_ids = pd.Index(row_ids)
+        col_ids = pd.Index(col_ids)
+
+        if profile_category == 'community':
+            orientation_ids = {'original': col_ids, 'transposed': row_ids}
+        else:
+            orientation_ids = {'original': row_ids, 'transposed': col_ids}
+
+        match_report = {}
+        for orientation, ids in orientation_ids.items():
+            matched = item_index.get_indexer(ids) >= 0
+            matched_count = int(matched.sum())
+            match_report[orientation] = {
+                'id_count': len(ids),
+                'matched_count': matched_count,
+                'match_rate': matched_count / len(ids) if len(ids) else 0.0,
+                'unmatched_sample': ids[~matched][:MISMATCH_SAMPLE_SIZE].tolist()}
+
+        match_report['orientation'] = None
+        for orientation in ['original', 'transposed']:
+            if match_report[orientation]['match_rate'] == 1:
+                match_report['orientation'] = orientation
+                break
+
+        return match_report
+
+    def _download_profile_file(self, profile_file_path, staging_file=False):
 
         if not profile_file_path:
             raise ValueError('Missing profile file path')
@@ -291,55 +694,346 @@ class ProfileImporter:
             profile_file_path = self.dfu.download_staging_file(
                                                 download_staging_file_params).get('copy_file_path')
 
-        df = self._file_to_df(profile_file_path)
+        return profile_file_path
+
+    def _gen_func_profiles_report(self, saved_profiles, workspace_id):
+        """
+        _gen_func_profiles_report: build one report for a batch of imported profiles
+                                   saved_profiles - list of (func_profile_ref, profile_data,
+                                                    summary, preview_builder)
+        """
+        logging.info('start generating report for {} profiles'.format(len(saved_profiles)))
+
+        objects_created = list()
+        output_html_files = list()
+        for func_profile_ref, profile_data, summary, preview_builder in saved_profiles:
+            objects_created.append({'ref': func_profile_ref,
+                                    'description': 'Imported FunctionalProfile'})
+            html_report = self._generate_html_report(func_profile_ref, profile_data=profile_data,
+                                                     summary=summary,
+                                                     preview_builder=preview_builder)
+            for html_file in html_report:
+                html_file['label'] = 'FunctionalProfile {}'.format(func_profile_ref)
+            output_html_files.extend(html_report)
+
+        report_params = {'message': '',
+                         'objects_created': objects_created,
+                         'workspace_id': workspace_id,
+                         'html_links': output_html_files,
+                         'direct_html_link_index': 0,
+                         'html_window_height': 1400,
+                         'report_object_name': 'func_profile_viewer_' + str(uuid.uuid4())}
+
+        kbase_report_client = KBaseReport(self.callback_url, token=self.token)
+        output = kbase_report_client.create_extended_report(report_params)
+
+        report_output = {'report_name': output['name'], 'report_ref': output['ref']}
+
+        return report_output
+
+    @classmethod
+    def _parse_profile_data(cls, profile_file_path, item_ids, profile_category,
+                            parse_executor=None, matrix_cache=None, timer=None):
+        """
+        _parse_profile_data: parse local profile file and check it against base object item ids
+
+        large text files are split across the processes of parse_executor if one is given.
+        with a matrix_cache text files are parsed in row chunks written straight into the cache
+        and all later stages, including transposing, work on the memory-mapped copy
+        """
+        timer = timer or StageTimer()
+
+        with timer.span('parse', bytes_in=os.path.getsize(profile_file_path)) as span:
+            file_format = cls._detect_file_format(profile_file_path)
+            if (parse_executor and file_format == 'text' and
+                    parse_executor.should_split(profile_file_path)):
+                delimiter = cls._detect_delimiter(profile_file_path)
+                profile_data = parse_executor.parse_text_file(profile_file_path, delimiter)
+            elif matrix_cache and file_format == 'text':
+                profile_data = cls._cache_text_file(profile_file_path, matrix_cache)
+            else:
+                # missing cells stay NaN and are written as nulls in the KBase Object
+                profile_data = FloatMatrix2D.from_df(cls._file_to_df(profile_file_path))
+                if matrix_cache:
+                    profile_data = matrix_cache.cache(profile_data)
+            span['bytes_out'] = profile_data.values.nbytes
 
         # check base object contains all items from function profile file
-        if profile_category == 'community' and item_ids is not None:
-            unmatched_ids = set(df.columns) - set(item_ids)
-            if unmatched_ids:
-                msg = 'Found some unmatched data ids in profile file columns\n{}'.format(
-                                                                                    unmatched_ids)
-                logging.warning(msg)
-
-                unmatched_ids = set(df.index) - set(item_ids)
-                if not unmatched_ids:
-                    logging.warning('Matrix column contains all items from file index')
-                    logging.warning('Using transpose matrix from file')
-                    df = df.T
-                else:
-                    msg = 'Found some unmatched data ids in profile file rows\n{}'.format(
-                                                                                    unmatched_ids)
-                    logging.warning(msg)
-                    err_msg = 'Matrix column does not contain all data ids from profile file'
-                    raise ValueError(err_msg)
-        elif profile_category == 'organism' and item_ids is not None:
-            unmatched_ids = set(df.index) - set(item_ids)
-            if unmatched_ids:
-                msg = 'Found some unmatched data ids in profile file rows\n{}'.format(
-                                                                                    unmatched_ids)
-                logging.warning(msg)
-
-                unmatched_ids = set(df.columns) - set(item_ids)
-                if not unmatched_ids:
-                    logging.warning('Matrix row contains all items from file columns')
-                    logging.warning('Using transpose matrix from file')
-                    df = df.T
-                else:
-                    msg = 'Found some unmatched data ids in profile file columns\n{}'.format(
-                                                                                    unmatched_ids)
-                    logging.warning(msg)
-                    err_msg = 'Matrix row does not contain all data ids from profile file'
+        if profile_category in PROFILE_CATEGORY and item_ids is not None:
+            with timer.span('check_ids'):
+                match_report = cls._match_item_ids(profile_data.row_ids, profile_data.col_ids,
+                                                   item_ids, profile_category)
+            logging.info('profile file id match report: {}'.format(match_report))
+
+            if match_report['orientation'] == 'transposed':
+                logging.warning('Using transpose matrix from file')
+                with timer.span('transpose'):
+                    if matrix_cache:
+                        profile_data = matrix_cache.transpose(profile_data)
+                    else:
+                        profile_data = profile_data.transpose()
+            elif match_report['orientation'] is None:
+                raise ValueError(cls._match_error_msg(match_report, profile_category))
+
+        return profile_data
+
+    @staticmethod
+    def _match_error_msg(match_report, profile_category):
+        axis_name = 'column' if profile_category == 'community' else 'row'
+        best_match = max(match_report['original'], match_report['transposed'],
+                         key=lambda match: match['match_rate'])
+        err_msg = 'Matrix {} does not contain all data ids from profile file '.format(axis_name)
+        err_msg += '(best match rate {:.1%}, unmatched ids include {})'.format(
+                                        best_match['match_rate'], best_match['unmatched_sample'])
+
+        return err_msg
+
+    @classmethod
+    def _cache_text_file(cls, profile_file_path, matrix_cache):
+        """
+        _cache_text_file: parse a text profile file into matrix_cache chunk by chunk
+
+        only one parsed chunk is in memory at a time, returns the memory-mapped matrix
+        """
+        import pandas as pd
+
+        delimiter = cls._detect_delimiter(profile_file_path)
+        logging.info('start parsing {} into the matrix cache'.format(
+                                                        os.path.basename(profile_file_path)))
+
+        err_msg = 'Cannot parse file. Please provide valide tsv, excel or csv file'
+        try:
+            col_ids = pd.read_csv(profile_file_path, sep=delimiter, index_col=0,
+                                  nrows=0).columns.astype('str').tolist()
+            chunk_dfs = pd.read_csv(profile_file_path, sep=delimiter, index_col=0,
+                                    dtype={0: str},
+                                    chunksize=max(PARSE_CHUNK_CELLS // max(len(col_ids), 1), 1))
+        except Exception:
+            raise ValueError(err_msg)
+
+        name, cache_writer = matrix_cache.writer(col_ids)
+        try:
+            while True:
+                try:
+                    chunk_df = next(chunk_dfs)
+                except StopIteration:
+                    break
+                except Exception:
                     raise ValueError(err_msg)
+                # missing cells stay NaN and are written as nulls in the KBase Object
+                cache_writer.append(FloatMatrix2D.from_df(chunk_df))
+            cache_writer.close()
+        except Exception:
+            cache_writer.abort()
+            raise
 
-        profile_data = {'row_ids': df.index.tolist(),
-                        'col_ids': df.columns.tolist(),
-                        'values': df.values.tolist()}
+        return matrix_cache.get(name)
 
-        return profile_data
+    def _should_stream(self, profile_file_path):
+        """
+        _should_stream: whether importing the profile file in memory would exceed the budget
+        """
+        if self._detect_file_format(profile_file_path) != 'text':
+            return False
 
-    def _gen_func_profile(self, base_object_ref, matrix_data,
-                          profile_category, profile_file_path, metadata, staging_file=False):
+        return os.path.getsize(profile_file_path) * IN_MEMORY_SIZE_FACTOR > self.memory_budget
 
+    @staticmethod
+    def _iter_profile_chunks(profile_file_path, delimiter, chunk_rows, item_index=None,
+                             err_msg=None):
+        """
+        _iter_profile_chunks: yield a text profile file as FloatMatrix2D row chunks
+
+        if item_index is given every row id has to be a base object item id, err_msg is raised
+        for the first chunk that has unmatched rows
+        """
+        import pandas as pd
+
+        for chunk_df in pd.read_csv(profile_file_path, sep=delimiter, index_col=0,
+                                    dtype={0: str}, chunksize=chunk_rows):
+            profile_chunk = FloatMatrix2D.from_df(chunk_df)
+
+            if item_index is not None:
+                rows_matched = item_index.get_indexer(profile_chunk.row_ids) >= 0
+                if not rows_matched.all():
+                    unmatched_ids = pd.Index(profile_chunk.row_ids)[~rows_matched]
+                    raise ValueError(err_msg or
+                                     'Matrix row does not contain all data ids from profile '
+                                     'file (unmatched ids include {})'.format(
+                                                unmatched_ids[:MISMATCH_SAMPLE_SIZE].tolist()))
+
+            yield profile_chunk
+
+    def _heatmap_preview_builder(self, col_ids):
+        if self.heatmap_preview != 'variance':
+            logging.info('streamed profiles are previewed by variance, not {}'.format(
+                                                                        self.heatmap_preview))
+        return HeatmapPreviewBuilder(col_ids, max_rows=self.heatmap_max_rows,
+                                     max_cols=self.heatmap_max_cols)
+
+    def _stream_func_profile(self, workspace_id, func_profile_data, profile_file_path, item_ids,
+                             profile_category, func_profile_obj_name, timer=None,
+                             storage_mode=DEFAULT_STORAGE_MODE, build_report=False):
+        """
+        _stream_func_profile: import a text profile file in row chunks with bounded memory
+
+        ids are checked against the base object item ids, from the header and a first pass over
+        the row ids for organism profiles, from each chunk for transposed community profiles.
+        as in the in-memory import the expected orientation (item ids as columns for community
+        profiles, as rows for organism profiles) wins if both match. profiles in the expected
+        orientation are written straight into the object JSON file, or the Parquet file in
+        columnar storage mode. the JSON encoding is chosen from the zero fraction of the first
+        chunk. transposed profiles are collected in the matrix cache and transposed there.
+
+        with build_report the heatmap preview is collected along the way, the saved object is
+        never read back into memory for the report.
+
+        returns (func_profile_ref, summary, preview_builder or None)
+        """
+        import pandas as pd
+
+        timer = timer or StageTimer()
+        delimiter = self._detect_delimiter(profile_file_path)
+        col_ids = pd.read_csv(profile_file_path, sep=delimiter, index_col=0,
+                              nrows=0).columns.astype('str').tolist()
+        chunk_rows = max(self.memory_budget // (max(len(col_ids), 1) * STREAM_BYTES_PER_CELL), 1)
+        logging.info('start streaming {} in chunks of {} rows'.format(
+                                            os.path.basename(profile_file_path), chunk_rows))
+
+        item_index = None
+        transposed = False
+        err_msg = None
+        if profile_category in PROFILE_CATEGORY and item_ids is not None:
+            item_index = pd.Index(item_ids).unique()
+            cols_matched = item_index.get_indexer(col_ids) >= 0
+            if profile_category == 'community':
+                # rows have to be item ids if columns are not
+                transposed = not cols_matched.all()
+                err_msg = 'Matrix column does not contain all data ids from profile file '
+                err_msg += '(unmatched ids include {})'.format(
+                            pd.Index(col_ids)[~cols_matched][:MISMATCH_SAMPLE_SIZE].tolist())
+                if not transposed:
+                    item_index = None
+            else:
+                # row ids are read ahead, the original orientation wins if both orientations
+                # match like in _match_item_ids
+                row_ids = pd.read_csv(profile_file_path, sep=delimiter, usecols=[0],
+                                      dtype=str).iloc[:, 0].astype('str').tolist()
+                match_report = self._match_item_ids(row_ids, col_ids, item_ids, profile_category)
+                logging.info('profile file id match report: {}'.format(match_report))
+                if match_report['orientation'] is None:
+                    raise ValueError(self._match_error_msg(match_report, profile_category))
+                transposed = match_report['orientation'] == 'transposed'
+                item_index = None
+
+        chunks = self._iter_profile_chunks(profile_file_path, delimiter, chunk_rows,
+                                           item_index=item_index, err_msg=err_msg)
+        summary_builder = ProfileSummaryBuilder(len(col_ids))
+        preview_builder = None
+        if build_report and not transposed:
+            preview_builder = self._heatmap_preview_builder(col_ids)
+            chunks = preview_builder.observe(chunks)
+
+        if (storage_mode != 'columnar' and columnar_available() and
+                os.path.getsize(profile_file_path) * JSON_SIZE_FACTOR > MAX_OBJECT_SIZE):
+            logging.info('profile file is too large for JSON storage, saving values in columnar '
+                         'storage')
+            storage_mode = 'columnar'
+
+        if transposed:
+            logging.warning('Using transpose matrix from file')
+            name, cache_writer = self.matrix_cache.writer(col_ids)
+            with timer.span('stream_parse', bytes_in=os.path.getsize(profile_file_path)):
+                try:
+                    for profile_chunk in chunks:
+                        cache_writer.append(profile_chunk)
+                    cache_writer.close()
+                except Exception:
+                    cache_writer.abort()
+                    raise
+            with timer.span('transpose'):
+                profile_data = self.matrix_cache.transpose(self.matrix_cache.get(name))
+            with timer.span('summarize'):
+                summary = summarize(profile_data, sketch_cells=self.summary_sketch_cells)
+            if build_report:
+                preview_builder = self._heatmap_preview_builder(profile_data.col_ids)
+                preview_builder.add(profile_data)
+
+            func_profile_data = dict(func_profile_data, data=self._choose_encoding(profile_data),
+                                     summary=summary)
+            if storage_mode == 'columnar':
+                func_profile_data = self._to_columnar(func_profile_data, func_profile_obj_name,
+                                                      timer=timer)
+
+            func_profile_ref = self._save_func_profile(workspace_id, func_profile_data,
+                                                       func_profile_obj_name, timer=timer)
+            return func_profile_ref, summary, preview_builder
+
+        if storage_mode == 'columnar':
+            row_ids, columnar_values = self._save_columnar_values(
+                                                            col_ids,
+                                                            summary_builder.observe(chunks),
+                                                            func_profile_obj_name, timer=timer)
+            logging.info('streamed {} rows into columnar storage'.format(len(row_ids)))
+
+            summary = summary_builder.summary()
+            func_profile_data = dict(func_profile_data,
+                                     data={'row_ids': row_ids,
+                                           'col_ids': col_ids,
+                                           'columnar_values': columnar_values},
+                                     summary=summary)
+            func_profile_ref = self._save_func_profile(workspace_id, func_profile_data,
+                                                       func_profile_obj_name, timer=timer)
+            return func_profile_ref, summary, preview_builder
+
+        data_path = self._func_profile_data_path(func_profile_obj_name)
+        writer = None
+        obj_size = None
+        with timer.span('stream_serialize', bytes_in=os.path.getsize(profile_file_path)) as span:
+            try:
+                for profile_chunk in summary_builder.observe(chunks):
+                    if writer is None:
+                        writer = ProfileStreamWriter(
+                                    data_path, func_profile_data, col_ids,
+                                    sparse=profile_chunk.zero_fraction >= self.sparse_threshold)
+                    writer.write_chunk(profile_chunk)
+                    if writer.size > MAX_OBJECT_SIZE:
+                        break
+                else:
+                    if writer is None:
+                        writer = ProfileStreamWriter(data_path, func_profile_data, col_ids)
+                    summary = summary_builder.summary()
+                    obj_size = writer.close(trailing_data={'summary': summary})
+            except Exception:
+                if writer is not None:
+                    writer.abort()
+                raise
+            span['bytes_out'] = obj_size if obj_size is not None else writer.size
+
+        if obj_size is None or obj_size > MAX_OBJECT_SIZE:
+            # the file size underestimated the object JSON, start over in columnar storage
+            writer.abort()
+            if not columnar_available():
+                raise ValueError('Object is too large')
+            logging.info('object JSON is too large, streaming values into columnar storage')
+            return self._stream_func_profile(workspace_id, func_profile_data, profile_file_path,
+                                             item_ids, profile_category, func_profile_obj_name,
+                                             timer=timer, storage_mode='columnar',
+                                             build_report=build_report)
+
+        logging.info('streamed {} rows, serialized object JSON size: {}'.format(
+                                            len(writer.row_ids), self._convert_size(obj_size)))
+
+        func_profile_ref = self._save_func_profile_file(workspace_id, data_path, obj_size,
+                                                        func_profile_obj_name, timer=timer)
+        return func_profile_ref, summary, preview_builder
+
+    @staticmethod
+    def _init_func_profile(base_object_ref, matrix_data, profile_category, metadata):
+        """
+        _init_func_profile: build FunctionalProfile data without the profile matrix
+                            returns (func_profile_data, item_ids)
+        """
         func_profile_data = dict()
         item_ids = None
 
@@ -361,25 +1055,133 @@ class ProfileImporter:
                 item_ids = matrix_data.get('row_ids')
                 func_profile_data.pop('col_attributemapping_ref', None)
 
-        profile_data = self._build_profile_data(profile_file_path, item_ids, profile_category,
-                                                staging_file=staging_file)
-        func_profile_data['data'] = profile_data
+        return func_profile_data, item_ids
+
+    def _choose_encoding(self, profile_data):
+        """
+        _choose_encoding: switch profile_data to sparse encoding above the sparsity threshold
+        """
+        zero_fraction = profile_data.zero_fraction
+        profile_data.sparse = zero_fraction >= self.sparse_threshold
+        logging.info('profile zero fraction: {:.1%}, using {} encoding'.format(
+                                    zero_fraction, 'sparse' if profile_data.sparse else 'dense'))
+
+        return profile_data
+
+    def _default_parse_workers(self):
+        if hasattr(os, 'sched_getaffinity'):
+            available_cpus = len(os.sched_getaffinity(0))
+        else:
+            available_cpus = os.cpu_count() or 1
+        budget_workers = self.memory_budget // (IN_MEMORY_SIZE_FACTOR * DEFAULT_RANGE_SIZE)
+
+        return max(min(DEFAULT_PARSE_WORKERS, available_cpus, budget_workers), 1)
+
+    def _get_base_object_data(self, base_object_ref):
+        """
+        _get_base_object_data: fetch only the base object fields used by import
 
-        return func_profile_data
+        falls back to fetching the whole object via DataFileUtil if the workspace subset
+        request is not available
+        """
+        if self.ws:
+            try:
+                base_object_data = self.ws.get_objects2({'objects': [{
+                                            'ref': base_object_ref,
+                                            'included': BASE_OBJECT_INCLUDED_PATHS}]})['data'][0]
+                return base_object_data['data']
+            except Exception:
+                logging.warning('failed to fetch subset of base object {}, fetching the whole '
+                                'object via DataFileUtil'.format(base_object_ref))
+
+        base_object_data = self.dfu.get_objects(
+                                            {'object_refs': [base_object_ref]})['data'][0]['data']
+
+        return base_object_data
 
     def __init__(self, config):
         self.callback_url = config['SDK_CALLBACK_URL']
         self.scratch = config['scratch']
         self.token = config['KB_AUTH_TOKEN']
-        self.dfu = DataFileUtil(self.callback_url)
-        self.report_util = kb_GenericsReport(self.callback_url)
-        self.generics_api = GenericsAPI(self.callback_url)
-        self.ws_large_data = WsLargeDataIO(self.callback_url)
+        self.ws_url = config.get('workspace-url')
+        self._dfu = None
+        self._report_util = None
+        self._generics_api = None
+        self._ws_large_data = None
+        self._ws = None
+        self.memory_budget = int(config.get('import-memory-budget', DEFAULT_IMPORT_MEMORY_BUDGET))
+        self.parse_workers = int(config.get('parse-workers') or self._default_parse_workers())
+        self.matrix_cache = MatrixCache(self.scratch)
+        self.parse_executor = ParseExecutor(self.scratch, max_workers=self.parse_workers)
+        self.sparse_threshold = float(config.get('sparse-threshold', DEFAULT_SPARSE_THRESHOLD))
+        self.timing_trace = str(config.get('timing-trace', '')).lower() in ['1', 'true', 'yes']
+        self.storage_mode = config.get('storage-mode') or DEFAULT_STORAGE_MODE
+        self.heatmap_max_rows = int(config.get('heatmap-max-rows', DEFAULT_HEATMAP_MAX_ROWS))
+        self.heatmap_max_cols = int(config.get('heatmap-max-cols', DEFAULT_HEATMAP_MAX_COLS))
+        self.heatmap_preview = config.get('heatmap-preview') or DEFAULT_PREVIEW_METHOD
+        # matrices above this many cells get approximate column quantiles in their summary
+        self.summary_sketch_cells = int(config.get('summary-sketch-cells', DEFAULT_SKETCH_CELLS))
 
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
                             level=logging.INFO)
 
-    def import_func_profile(self, params):
+    # service clients are created on first use, most calls only need one or two of them
+
+    @property
+    def dfu(self):
+        if self._dfu is None:
+            self._dfu = DataFileUtil(self.callback_url)
+        return self._dfu
+
+    @dfu.setter
+    def dfu(self, dfu):
+        self._dfu = dfu
+
+    @property
+    def report_util(self):
+        if self._report_util is None:
+            self._report_util = kb_GenericsReport(self.callback_url)
+        return self._report_util
+
+    @report_util.setter
+    def report_util(self, report_util):
+        self._report_util = report_util
+
+    @property
+    def generics_api(self):
+        if self._generics_api is None:
+            self._generics_api = GenericsAPI(self.callback_url)
+        return self._generics_api
+
+    @generics_api.setter
+    def generics_api(self, generics_api):
+        self._generics_api = generics_api
+
+    @property
+    def ws_large_data(self):
+        if self._ws_large_data is None:
+            self._ws_large_data = WsLargeDataIO(self.callback_url)
+        return self._ws_large_data
+
+    @ws_large_data.setter
+    def ws_large_data(self, ws_large_data):
+        self._ws_large_data = ws_large_data
+
+    @property
+    def ws(self):
+        """
+        ws: Workspace client, None if no workspace-url is configured
+        """
+        if self._ws is None and self.ws_url:
+            self._ws = Workspace(self.ws_url, token=self.token)
+        return self._ws
+
+    @ws.setter
+    def ws(self, ws):
+        self._ws = ws
+
+    @classmethod
+    def _validate_import_params(cls, params):
 
         if params.get('original_matrix_ref') and params.get('base_object_ref') is None:
             logging.info("rename original_matrix_ref to base_object_ref")
@@ -387,28 +1189,29 @@ class ProfileImporter:
 
         logging.info("start importing FunctionalProfile with params:{}".format(params))
 
-        self._validate_params(params, ('workspace_id',
-                                       'func_profile_obj_name',
-                                       'base_object_ref',
-                                       'profile_type',
-                                       'profile_category',
-                                       'profile_file_path'),
-                                      ('data_epistemology',
-                                       'epistemology_method',
-                                       'description',
-                                       'staging_file',
-                                       'build_report'))
-
-        workspace_id = params.get('workspace_id')
-        func_profile_obj_name = params.get('func_profile_obj_name')
-        staging_file = params.get('staging_file', False)
-        build_report = params.get('build_report', False)
-        profile_file_path = params.get('profile_file_path')
-
-        base_object_ref = params.get('base_object_ref')
-        base_object_data = self.dfu.get_objects(
-                                            {'object_refs': [base_object_ref]})['data'][0]['data']
+        cls._validate_params(params, ('workspace_id',
+                                      'func_profile_obj_name',
+                                      'base_object_ref',
+                                      'profile_type',
+                                      'profile_category',
+                                      'profile_file_path'),
+                                     ('data_epistemology',
+                                      'epistemology_method',
+                                      'description',
+                                      'staging_file',
+                                      'build_report',
+                                      'include_timings',
+                                      'storage_mode'))
+
+        if params.get('storage_mode', DEFAULT_STORAGE_MODE) not in STORAGE_MODES:
+            raise ValueError('Please choose one of {} as storage mode'.format(STORAGE_MODES))
 
+    @staticmethod
+    def _build_metadata(params, base_object_data):
+        """
+        _build_metadata: collect FunctionalProfile metadata fields from params and base object
+                         returns (metadata, profile_category)
+        """
         params['col_attributemapping_ref'] = base_object_data.get('col_attributemapping_ref')
         params['row_attributemapping_ref'] = base_object_data.get('row_attributemapping_ref')
 
@@ -427,21 +1230,198 @@ class ProfileImporter:
         if profile_type not in PROFILE_TYPE:
             raise ValueError('Please choose one of {} as profile type'.format(PROFILE_TYPE))
 
-        func_profile_data = self._gen_func_profile(base_object_ref,
-                                                   base_object_data.get('data'),
-                                                   profile_category,
-                                                   profile_file_path,
-                                                   metadata,
-                                                   staging_file=staging_file)
+        return metadata, profile_category
+
+    def import_func_profile(self, params):
 
-        func_profile_ref = self._save_func_profile(workspace_id,
-                                                   func_profile_data,
-                                                   func_profile_obj_name)
+        self._validate_import_params(params)
+
+        workspace_id = params.get('workspace_id')
+        func_profile_obj_name = params.get('func_profile_obj_name')
+        staging_file = params.get('staging_file', False)
+        build_report = params.get('build_report', False)
+        include_timings = params.get('include_timings', False)
+        storage_mode = params.get('storage_mode', self.storage_mode)
+        profile_file_path = params.get('profile_file_path')
+
+        timer = StageTimer()
+
+        base_object_ref = params.get('base_object_ref')
+        with timer.span('fetch_base_object'):
+            base_object_data = self._get_base_object_data(base_object_ref)
+
+        metadata, profile_category = self._build_metadata(params, base_object_data)
+
+        func_profile_data, item_ids = self._init_func_profile(base_object_ref,
+                                                              base_object_data.get('data'),
+                                                              profile_category,
+                                                              metadata)
+        with timer.span('download') as span:
+            profile_file_path = self._download_profile_file(profile_file_path,
+                                                            staging_file=staging_file)
+            span['bytes_out'] = os.path.getsize(profile_file_path)
+
+        preview_builder = None
+        if self._should_stream(profile_file_path):
+            # streamed matrix is not kept in memory, the report is built from the summary and
+            # the heatmap preview collected while streaming
+            func_profile_ref, summary, preview_builder = self._stream_func_profile(
+                                                            workspace_id, func_profile_data,
+                                                            profile_file_path, item_ids,
+                                                            profile_category,
+                                                            func_profile_obj_name, timer=timer,
+                                                            storage_mode=storage_mode,
+                                                            build_report=build_report)
+            profile_data = None
+        else:
+            profile_data = self._parse_profile_data(profile_file_path, item_ids,
+                                                    profile_category,
+                                                    parse_executor=self.parse_executor,
+                                                    matrix_cache=self.matrix_cache,
+                                                    timer=timer)
+            func_profile_data['data'] = self._choose_encoding(profile_data)
+            with timer.span('summarize'):
+                func_profile_data['summary'] = summarize(profile_data,
+                                                         sketch_cells=self.summary_sketch_cells)
+            if storage_mode == 'columnar':
+                func_profile_data = self._to_columnar(func_profile_data, func_profile_obj_name,
+                                                      timer=timer)
+            func_profile_ref = self._save_func_profile(workspace_id,
+                                                       func_profile_data,
+                                                       func_profile_obj_name,
+                                                       timer=timer)
+            summary = func_profile_data['summary']
 
         returnVal = {'func_profile_ref': func_profile_ref}
 
         if build_report:
-            report_output = self._gen_func_profile_report(func_profile_ref, workspace_id)
+            with timer.span('report'):
+                report_output = self._gen_func_profile_report(func_profile_ref, workspace_id,
+                                                              profile_data=profile_data,
+                                                              summary=summary,
+                                                              preview_builder=preview_builder)
             returnVal.update(report_output)
 
+        if self.timing_trace:
+            trace_path = os.path.join(self.scratch, 'import_trace_{}_{}.json'.format(
+                                                    func_profile_obj_name, str(uuid.uuid4())))
+            logging.info('import timing trace written to {}'.format(
+                                                                timer.write_trace(trace_path)))
+
+        if include_timings:
+            returnVal['timings'] = timer.summary()
+
         return returnVal
+
+    def import_func_profiles(self, params):
+        """
+        import_func_profiles: import many FunctionalProfile objects into one workspace
+
+        each distinct base object is fetched once, profile files are parsed in parallel and
+        objects are saved together. a failing profile does not abort the rest of the batch
+        """
+        self._validate_params(params, ('workspace_id', 'profiles'), ('build_report',))
+
+        workspace_id = params.get('workspace_id')
+        profiles = params.get('profiles')
+        build_report = params.get('build_report', False)
+
+        if not isinstance(profiles, list) or not profiles:
+            raise ValueError('Please provide a list of profiles to import')
+
+        results = [{'func_profile_obj_name': profile.get('func_profile_obj_name')}
+                   for profile in profiles]
+        base_objects = dict()
+        pending = list()
+        saved_profiles = list()
+
+        for idx, profile in enumerate(profiles):
+            try:
+                profile = dict(profile, workspace_id=workspace_id)
+                profile.pop('build_report', None)
+                profile.pop('include_timings', None)
+                self._validate_import_params(profile)
+
+                base_object_ref = profile.get('base_object_ref')
+                if base_object_ref not in base_objects:
+                    base_objects[base_object_ref] = self._get_base_object_data(base_object_ref)
+                base_object_data = base_objects[base_object_ref]
+
+                metadata, profile_category = self._build_metadata(profile, base_object_data)
+                func_profile_data, item_ids = self._init_func_profile(
+                                                            base_object_ref,
+                                                            base_object_data.get('data'),
+                                                            profile_category,
+                                                            metadata)
+                profile_file_path = self._download_profile_file(
+                                                profile.get('profile_file_path'),
+                                                staging_file=profile.get('staging_file', False))
+                storage_mode = profile.get('storage_mode', self.storage_mode)
+
+                if self._should_stream(profile_file_path):
+                    func_profile_ref, summary, preview_builder = self._stream_func_profile(
+                                                            workspace_id, func_profile_data,
+                                                            profile_file_path, item_ids,
+                                                            profile_category,
+                                                            results[idx]['func_profile_obj_name'],
+                                                            storage_mode=storage_mode,
+                                                            build_report=build_report)
+                    results[idx]['func_profile_ref'] = func_profile_ref
+                    saved_profiles.append((func_profile_ref, None, summary, preview_builder))
+                    continue
+            except Exception as err:
+                logging.warning('failed to prepare profile {}: {}'.format(idx, err))
+                results[idx]['error'] = str(err)
+                continue
+
+            pending.append((idx, func_profile_data, storage_mode,
+                            (profile_file_path, item_ids, profile_category)))
+
+        parse_results = self.parse_executor.parse_files(
+                                        _parse_profile_data,
+                                        [parse_args for _, _, _, parse_args in pending])
+
+        func_profiles = list()
+        parsed_idx = list()
+        parsed_data = list()
+        for (idx, func_profile_data, storage_mode, _), (profile_data, error) in zip(
+                                                                        pending, parse_results):
+            if error is not None:
+                results[idx]['error'] = error
+                continue
+            func_profile_data['data'] = self._choose_encoding(profile_data)
+            func_profile_data['summary'] = summarize(profile_data,
+                                                     sketch_cells=self.summary_sketch_cells)
+            if storage_mode == 'columnar':
+                try:
+                    func_profile_data = self._to_columnar(func_profile_data,
+                                                          results[idx]['func_profile_obj_name'])
+                except Exception as err:
+                    results[idx]['error'] = str(err)
+                    continue
+            func_profiles.append((results[idx]['func_profile_obj_name'], func_profile_data))
+            parsed_idx.append(idx)
+            parsed_data.append(profile_data)
+
+        save_results = self._save_func_profiles(workspace_id, func_profiles)
+        for idx, profile_data, (_, func_profile_data), (func_profile_ref, error) in zip(
+                                        parsed_idx, parsed_data, func_profiles, save_results):
+            if error is not None:
+                results[idx]['error'] = error
+                continue
+            results[idx]['func_profile_ref'] = func_profile_ref
+            saved_profiles.append((func_profile_ref, profile_data, func_profile_data['summary'],
+                                   None))
+
+        returnVal = {'results': results}
+
+        if build_report and saved_profiles:
+            report_output = self._gen_func_profiles_report(saved_profiles, workspace_id)
+            returnVal.update(report_output)
+
+        return returnVal
+
+
+def _parse_profile_data(profile_file_path, item_ids, profile_category):
+    # module level so it can be pickled into ProcessPoolExecutor workers
+    return ProfileImporter._parse_profile_data(profile_file_path, item_ids, profile_category)
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+
+
+class ProfileStreamWriter:
+    """
+    Writes FunctionalProfile JSON to a file while the profile matrix is parsed in row chunks
+
+    row ids are only known once all chunks are written, so the FloatMatrix2D is written with
+    col_ids first and row_ids last. In sparse encoding indices and values are spooled to side
+    files next to data_path and appended after the last chunk.
+    """
+
+    def __init__(self, data_path, func_profile_data, col_ids, sparse=False):
+        self.data_path = data_path
+        self.col_ids = [str(col_id) for col_id in col_ids]
+        self.sparse = sparse
+
+        self.row_ids = list()
+        self.stored_count = 0
+        self._first_chunk = True
+
+        self._data_file = open(data_path, 'w')
+        self._side_files = list()
+        if sparse:
+            self._side_files = [open(data_path + suffix, 'w+')
+                                for suffix in ['.indices', '.values']]
+
+        self._data_file.write('{')
+        for key, value in func_profile_data.items():
+            self._data_file.write(json.dumps(key) + ': ' + json.dumps(value) + ', ')
+        self._data_file.write('"data": {"col_ids": ' + json.dumps(self.col_ids))
+        if sparse:
+            self._data_file.write(', "sparse_values": {"indptr": [0')
+        else:
+            self._data_file.write(', "values": [')
+
+    def _write_list_chunk(self, list_file, items, first_chunk):
+        if items:
+            list_file.write(('' if first_chunk else ', ') + json.dumps(items)[1:-1])
+
+    def write_chunk(self, matrix):
+        """
+        write_chunk: append the rows of a FloatMatrix2D chunk
+        """
+        if matrix.col_ids != self.col_ids:
+            raise ValueError('Profile file chunk columns do not match the header')
+
+        self.row_ids.extend(matrix.row_ids)
+
+        if self.sparse:
+            indices_file, values_file = self._side_files
+            for row_counts, indices, stored_values in matrix.iter_csr_blocks():
+                if not row_counts.size:
+                    continue
+                indptr = self.stored_count + np.cumsum(row_counts)
+                self._data_file.write(', ' + json.dumps(indptr.tolist())[1:-1])
+                first_chunk = not self.stored_count
+                self._write_list_chunk(indices_file, indices.tolist(), first_chunk)
+                self._write_list_chunk(values_file, FloatMatrix2D._float_list(stored_values),
+                                       first_chunk)
+                self.stored_count = int(indptr[-1])
+        else:
+            for row_values in matrix.iter_value_rows():
+                self._data_file.write(('' if self._first_chunk else ', ') + json.dumps(row_values))
+                self._first_chunk = False
+
+    @property
+    def size(self):
+        """
+        size: number of bytes written so far, spooled side files included
+        """
+        if self._data_file.closed:
+            return os.path.getsize(self.data_path)
+        return sum(json_file.tell() for json_file in [self._data_file] + self._side_files)
+
+    def close(self, trailing_data=None):
+        """
+        close: finish the JSON document, returns number of bytes written
+
+        trailing_data - FunctionalProfile fields only known once all chunks are written,
+                        e.g. the summary, written after the matrix
+        """
+        if self.sparse:
+            for field_name, side_file in zip(['indices', 'values'], self._side_files):
+                self._data_file.write('], {}: ['.format(json.dumps(field_name)))
+                side_file.seek(0)
+                shutil.copyfileobj(side_file, self._data_file)
+            self._data_file.write(']}')
+        else:
+            self._data_file.write(']')
+
+        self._data_file.write(', "row_ids": ' + json.dumps(self.row_ids) + '}')
+        for key, value in (trailing_data or dict()).items():
+            self._data_file.write(', ' + json.dumps(key) + ': ' + json.dumps(value))
+        self._data_file.write('}')
+        self._data_file.close()
+        self._remove_side_files()
+
+        return os.path.getsize(self.data_path)
+
+    def abort(self):
+        self._data_file.close()
+        self._remove_side_files()
+        if os.path.exists(self.data_path):
+            os.remove(self.data_path)
+
+    def _remove_side_files(self):
+        for side_file in self._side_files:
+            side_file.close()
+            os.remove(side_file.name)
+        self._side_files = list()
@@ -0,0 +1,291 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from installed_clients.DataFileUtilClient import DataFileUtil
+from installed_clients.WorkspaceClient import Workspace
+from FunctionalProfileUtil.Utils.ColumnarStore import read_parquet_subset
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+
+
+MISMATCH_SAMPLE_SIZE = 10
+
+# fields needed to map ids to positions, values are fetched in a second request
+ID_INCLUDED_PATHS = ['data/row_ids', 'data/col_ids', 'data/columnar_values',
+                     'data/sparse_values/indptr']
+# larger selections fall back to fetching whole rows (dense values) or the whole sparse arrays
+MAX_INCLUDED_PATHS = 50000
+
+# versioned objects never change, their id indexes are kept in an LRU
+DEFAULT_ID_INDEX_CACHE_SIZE = 32
+VERSIONED_REF_PATTERN = re.compile(r'^[^/]+/[^/]+/\d+$')
+
+
+class ProfileIdIndex:
+    """
+    Row and column id to position index of a saved FunctionalProfile matrix
+
+    also keeps what is needed to locate values without fetching them: the CSR row offsets of
+    sparse values and the columnar values reference
+    """
+
+    def __init__(self, matrix_data):
+        self.row_ids = matrix_data['row_ids']
+        self.col_ids = matrix_data['col_ids']
+        self.row_positions = {row_id: idx for idx, row_id in enumerate(self.row_ids)}
+        self.col_positions = {col_id: idx for idx, col_id in enumerate(self.col_ids)}
+
+        self.columnar_values = matrix_data.get('columnar_values')
+        sparse_values = matrix_data.get('sparse_values')
+        self.indptr = None
+        if sparse_values is not None:
+            self.indptr = np.asarray(sparse_values['indptr'], dtype=np.int64)
+
+    @staticmethod
+    def _select(ids, positions, select_ids, regex, index_range, axis):
+        """
+        _select: positions of the selected ids of one axis, in selection order without duplicates
+
+        at most one of select_ids, regex (re.search on each id) and index_range ([start, end),
+        0-based) may be given, nothing selects the whole axis
+        """
+        selectors = [selector for selector in [select_ids, regex, index_range]
+                     if selector is not None]
+        if len(selectors) > 1:
+            raise ValueError('Please provide only one of {0}_ids, {0}_regex and {0}_range'.format(
+                                                                                        axis))
+
+        if select_ids is not None:
+            unknown_ids = [select_id for select_id in select_ids if select_id not in positions]
+            if unknown_ids:
+                raise ValueError('Unknown {} ids (e.g. {})'.format(
+                                                    axis, unknown_ids[:MISMATCH_SAMPLE_SIZE]))
+            return list(OrderedDict.fromkeys(positions[select_id] for select_id in select_ids))
+
+        if regex is not None:
+            try:
+                pattern = re.compile(regex)
+            except re.error as err:
+                raise ValueError('Invalid {}_regex: {}'.format(axis, err))
+            return [idx for idx, item_id in enumerate(ids) if pattern.search(item_id)]
+
+        if index_range is not None:
+            if len(index_range) != 2 or not 0 <= index_range[0] <= index_range[1]:
+                raise ValueError('{}_range has to be [start, end) with 0 <= start <= end'.format(
+                                                                                        axis))
+            return list(range(index_range[0], min(index_range[1], len(ids))))
+
+        return list(range(len(ids)))
+
+    def select_rows(self, row_ids=None, row_regex=None, row_range=None):
+        return self._select(self.row_ids, self.row_positions, row_ids, row_regex, row_range,
+                            'row')
+
+    def select_cols(self, col_ids=None, col_regex=None, col_range=None):
+        return self._select(self.col_ids, self.col_positions, col_ids, col_regex, col_range,
+                            'col')
+
+
+class ProfileSubsetter:
+    """
+    Fetches a subset of rows and columns of a saved FunctionalProfile matrix
+
+    ids are fetched first to resolve the selection, then only the selected cells are requested
+    through workspace included paths, or read from the selected Parquet columns and row groups
+    in columnar storage. without a workspace-url the whole object is fetched via DataFileUtil
+    """
+
+    def __init__(self, config, id_index_cache_size=DEFAULT_ID_INDEX_CACHE_SIZE):
+        self.callback_url = config['SDK_CALLBACK_URL']
+        self.scratch = config['scratch']
+        self.token = config['KB_AUTH_TOKEN']
+        self.ws_url = config.get('workspace-url')
+        self._dfu = None
+        self._ws = None
+
+        self.id_index_cache_size = id_index_cache_size
+        self._id_indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def dfu(self):
+        if self._dfu is None:
+            self._dfu = DataFileUtil(self.callback_url)
+        return self._dfu
+
+    @dfu.setter
+    def dfu(self, dfu):
+        self._dfu = dfu
+
+    @property
+    def ws(self):
+        """
+        ws: Workspace client, None if no workspace-url is configured
+        """
+        if self._ws is None and self.ws_url:
+            self._ws = Workspace(self.ws_url, token=self.token)
+        return self._ws
+
+    @ws.setter
+    def ws(self, ws):
+        self._ws = ws
+
+    @staticmethod
+    def _validate_subset_params(params):
+        if 'func_profile_ref' not in params:
+            raise ValueError('Required key func_profile_ref not in supplied parameters')
+
+        for param in params:
+            if param not in ['func_profile_ref', 'row_ids', 'col_ids', 'row_regex', 'col_regex',
+                             'row_range', 'col_range']:
+                logging.warning('Unexpected parameter {} supplied'.format(param))
+
+    def _get_matrix_subset(self, func_profile_ref, included):
+        return self.ws.get_objects2({'objects': [{
+                                        'ref': func_profile_ref,
+                                        'included': included}]})['data'][0]['data']['data']
+
+    def _get_id_index(self, func_profile_ref):
+        versioned = bool(VERSIONED_REF_PATTERN.match(func_profile_ref))
+        if versioned:
+            with self._lock:
+                id_index = self._id_indexes.get(func_profile_ref)
+                if id_index is not None:
+                    self._id_indexes.move_to_end(func_profile_ref)
+                    return id_index
+
+        id_index = ProfileIdIndex(self._get_matrix_subset(func_profile_ref, ID_INCLUDED_PATHS))
+
+        if versioned:
+            with self._lock:
+                self._id_indexes[func_profile_ref] = id_index
+                while len(self._id_indexes) > self.id_index_cache_size:
+                    self._id_indexes.popitem(last=False)
+
+        return id_index
+
+    def _fetch_dense_values(self, func_profile_ref, id_index, rows, cols):
+        """
+        _fetch_dense_values: fetch selected cells of inline dense values
+
+        rows and cols have to be sorted, the workspace returns included array elements
+        compacted in index order
+        """
+        if len(cols) < len(id_index.col_ids) and len(rows) * len(cols) <= MAX_INCLUDED_PATHS:
+            included = ['data/values/{}/{}'.format(row, col) for row in rows for col in cols]
+            values = self._get_matrix_subset(func_profile_ref, included)['values']
+            return np.array(values, dtype=np.float64).reshape(len(rows), len(cols))
+
+        if len(rows) <= MAX_INCLUDED_PATHS:
+            included = ['data/values/{}'.format(row) for row in rows]
+            values = self._get_matrix_subset(func_profile_ref, included)['values']
+            return np.array(values, dtype=np.float64).reshape(len(rows), -1)[:, cols]
+
+        values = self._get_matrix_subset(func_profile_ref, ['data/values'])['values']
+        return np.array(values, dtype=np.float64)[np.ix_(rows, cols)]
+
+    def _fetch_sparse_values(self, func_profile_ref, id_index, rows, cols):
+        """
+        _fetch_sparse_values: fetch the CSR entries of the selected rows of inline sparse values
+        """
+        indptr = id_index.indptr
+        positions = [np.arange(indptr[row], indptr[row + 1]) for row in rows]
+        positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+
+        if not len(positions):
+            # an empty included list would return the whole object
+            indices = np.empty(0, dtype=np.int64)
+            stored_values = np.empty(0, dtype=np.float64)
+        elif len(positions) * 2 <= MAX_INCLUDED_PATHS:
+            included = ['data/sparse_values/{}/{}'.format(field, position)
+                        for field in ['indices', 'values'] for position in positions]
+            sparse_values = self._get_matrix_subset(func_profile_ref, included)['sparse_values']
+            indices = np.asarray(sparse_values['indices'], dtype=np.int64)
+            stored_values = np.array(sparse_values['values'], dtype=np.float64)
+        else:
+            sparse_values = self._get_matrix_subset(
+                            func_profile_ref, ['data/sparse_values/indices',
+                                               'data/sparse_values/values'])['sparse_values']
+            indices = np.asarray(sparse_values['indices'], dtype=np.int64)[positions]
+            stored_values = np.array(sparse_values['values'], dtype=np.float64)[positions]
+
+        row_counts = np.array([indptr[row + 1] - indptr[row] for row in rows], dtype=np.int64)
+        values = np.zeros((len(rows), len(id_index.col_ids)), dtype=np.float64)
+        values[np.repeat(np.arange(len(rows)), row_counts), indices] = stored_values
+
+        return values[:, cols]
+
+    def _fetch_columnar_values(self, id_index, rows, cols):
+        output_directory = os.path.join(self.scratch, str(uuid.uuid4()))
+        os.makedirs(output_directory)
+        try:
+            file_path = self.dfu.shock_to_file({
+                                    'handle_id': id_index.columnar_values['values_handle'],
+                                    'file_path': output_directory})['file_path']
+            return read_parquet_subset(file_path, rows,
+                                       [id_index.col_ids[col] for col in cols])
+        finally:
+            shutil.rmtree(output_directory, ignore_errors=True)
+
+    def _fetch_values(self, func_profile_ref, id_index, rows, cols, matrix=None):
+        """
+        _fetch_values: values of the selected cells, rows and cols have to be sorted
+        """
+        if matrix is not None:
+            return matrix.values[np.ix_(rows, cols)]
+        if id_index.columnar_values is not None:
+            return self._fetch_columnar_values(id_index, rows, cols)
+        if id_index.indptr is not None:
+            return self._fetch_sparse_values(func_profile_ref, id_index, rows, cols)
+
+        return self._fetch_dense_values(func_profile_ref, id_index, rows, cols)
+
+    def get_func_profile_subset(self, params):
+        """
+        get_func_profile_subset: selected rows and columns of a FunctionalProfile matrix
+        """
+        self._validate_subset_params(params)
+        func_profile_ref = params['func_profile_ref']
+
+        matrix = None
+        if self.ws:
+            id_index = self._get_id_index(func_profile_ref)
+        else:
+            logging.warning('no workspace-url configured, fetching the whole object {}'.format(
+                                                                            func_profile_ref))
+            matrix_data = self.dfu.get_objects(
+                                    {'object_refs': [func_profile_ref]})['data'][0]['data']['data']
+            id_index = ProfileIdIndex(matrix_data)
+            if id_index.columnar_values is None:
+                matrix = FloatMatrix2D.from_dict(matrix_data)
+
+        rows = id_index.select_rows(params.get('row_ids'), params.get('row_regex'),
+                                    params.get('row_range'))
+        cols = id_index.select_cols(params.get('col_ids'), params.get('col_regex'),
+                                    params.get('col_range'))
+        logging.info('selected {} rows and {} columns of {}'.format(len(rows), len(cols),
+                                                                    func_profile_ref))
+
+        sorted_rows = sorted(rows)
+        sorted_cols = sorted(cols)
+        if sorted_rows and sorted_cols:
+            values = self._fetch_values(func_profile_ref, id_index, sorted_rows, sorted_cols,
+                                        matrix=matrix)
+            # back from index order to selection order
+            values = values[np.ix_(np.searchsorted(sorted_rows, rows),
+                                   np.searchsorted(sorted_cols, cols))]
+        else:
+            values = np.empty((len(rows), len(cols)))
+
+        subset = FloatMatrix2D([id_index.row_ids[row] for row in rows],
+                               [id_index.col_ids[col] for col in cols], values).to_dict()
+        subset['row_indices'] = rows
+        subset['col_indices'] = cols
+
+        return subset
@@ -0,0 +1,224 @@
+import numpy as np
+
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+from FunctionalProfileUtil.Utils.QuantileSketch import QuantileSketches
+
+
+# (field name, quantile), quantiles are linearly interpolated like pandas describe
+SUMMARY_QUANTILES = [('q1', 0.25), ('median', 0.5), ('q3', 0.75)]
+SUMMARY_FIELDS = (['count', 'sum', 'mean', 'std', 'min'] +
+                  [field for field, _ in SUMMARY_QUANTILES] + ['max', 'nonzero_count'])
+COUNT_FIELDS = ['count', 'nonzero_count']
+# (field name, row label) of summary tables, the describe() layout followed by sum and nonzero
+SUMMARY_TABLE_ROWS = [('count', 'count'), ('mean', 'mean'), ('std', 'std'), ('min', 'min'),
+                      ('q1', '25%'), ('median', '50%'), ('q3', '75%'), ('max', 'max'),
+                      ('sum', 'sum'), ('nonzero_count', 'nonzero')]
+# blocks of about this many cells are summarized at a time, bounding the temporary arrays
+SUMMARY_BLOCK_CELLS = 4 * 1024 * 1024
+# exact column quantiles read the matrix once per block of columns, larger matrices are read
+# once in row blocks and their column quantiles come from quantile sketches
+DEFAULT_SKETCH_CELLS = 64 * 1024 * 1024
+
+
+def _block_stats(block, quantiles=True):
+    """
+    _block_stats: statistics of each row of a 2D block, null (NaN) cells are skipped
+
+    returns a dict of arrays with count, sum, m2 (sum of squared deviations from the mean),
+    min, max, nonzero_count and, if quantiles, the SUMMARY_QUANTILES fields
+    """
+    mask = ~np.isnan(block)
+    count = mask.sum(axis=1)
+    empty = count == 0
+
+    filled = np.where(mask, block, 0)
+    total = filled.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    deviations = np.where(mask, block - mean[:, None], 0)
+
+    stats = {'count': count,
+             'sum': total,
+             'm2': np.einsum('ij,ij->i', deviations, deviations),
+             'min': np.where(mask, block, np.inf).min(axis=1, initial=np.inf),
+             'max': np.where(mask, block, -np.inf).max(axis=1, initial=-np.inf),
+             'nonzero_count': (filled != 0).sum(axis=1)}
+    stats['min'][empty] = np.nan
+    stats['max'][empty] = np.nan
+
+    if quantiles and not block.shape[1]:
+        for field, _ in SUMMARY_QUANTILES:
+            stats[field] = np.full(len(block), np.nan)
+    elif quantiles:
+        # NaN sorts last, the first count cells of a sorted row are its values
+        sorted_block = np.sort(block, axis=1)
+        rows = np.arange(len(block))
+        last = np.maximum(count - 1, 0)
+        for field, quantile in SUMMARY_QUANTILES:
+            position = last * quantile
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, last)
+            lower_values = sorted_block[rows, lower]
+            upper_values = sorted_block[rows, upper]
+            with np.errstate(invalid='ignore'):
+                quantile_values = lower_values + (upper_values - lower_values) * (position - lower)
+            quantile_values[empty] = np.nan
+            stats[field] = quantile_values
+
+    return stats
+
+
+def _axis_stats(values, quantiles=True):
+    """
+    _axis_stats: statistics of each row of values, computed in blocks of rows
+    """
+    block_rows = max(SUMMARY_BLOCK_CELLS // max(values.shape[1], 1), 1)
+    blocks = [_block_stats(np.ascontiguousarray(values[start:start + block_rows]),
+                           quantiles=quantiles)
+              for start in range(0, values.shape[0], block_rows)]
+    if not blocks:
+        blocks = [_block_stats(np.empty((0, values.shape[1])), quantiles=quantiles)]
+
+    return {field: np.concatenate([block[field] for block in blocks]) for field in blocks[0]}
+
+
+def _merge_stats(stats, other):
+    """
+    _merge_stats: combine statistics of the same rows over two disjoint sets of cells
+
+    quantiles can not be combined and are dropped
+    """
+    count = stats['count'] + other['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.nan_to_num(other['sum'] / other['count'] - stats['sum'] / stats['count'])
+        m2 = stats['m2'] + other['m2'] + delta ** 2 * stats['count'] * other['count'] / count
+
+    return {'count': count,
+            'sum': stats['sum'] + other['sum'],
+            'm2': np.where(count > 0, m2, 0),
+            'min': np.fmin(stats['min'], other['min']),
+            'max': np.fmax(stats['max'], other['max']),
+            'nonzero_count': stats['nonzero_count'] + other['nonzero_count']}
+
+
+def _std(stats):
+    count = stats['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # sample standard deviation like pandas describe
+        return np.where(count > 1, np.sqrt(stats['m2'] / (count - 1)), np.nan)
+
+
+def row_std(values):
+    """
+    row_std: standard deviation of each row of values as stored in summaries, NaN if undefined
+    """
+    return _std(_axis_stats(values, quantiles=False))
+
+
+def _to_summary(stats):
+    """
+    _to_summary: JSON ready AxisSummary of statistics, NaN (undefined statistics) become None
+    """
+    count = stats['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = dict(stats, mean=np.where(count > 0, stats['sum'] / count, np.nan),
+                     std=_std(stats))
+
+    summary = dict()
+    if stats.get('approximate_quantiles'):
+        summary['approximate_quantiles'] = 1
+    for field in SUMMARY_FIELDS:
+        if field not in stats:
+            continue
+        if field in COUNT_FIELDS:
+            summary[field] = stats[field].astype(np.int64).tolist()
+        else:
+            summary[field] = FloatMatrix2D._float_list(stats[field].astype(np.float64))
+
+    return summary
+
+
+def summarize(matrix, sketch_cells=DEFAULT_SKETCH_CELLS):
+    """
+    summarize: per row and per column statistics of a FloatMatrix2D
+
+    matrices of more than sketch_cells cells are summarized in one pass over row blocks with
+    approximate column quantiles
+    returns a KBaseProfile.ProfileSummary dict
+    """
+    if matrix.values.size <= sketch_cells:
+        return {'rows': _to_summary(_axis_stats(matrix.values)),
+                'cols': _to_summary(_axis_stats(matrix.values.T))}
+
+    summary_builder = ProfileSummaryBuilder(len(matrix.col_ids))
+    block_rows = max(SUMMARY_BLOCK_CELLS // max(len(matrix.col_ids), 1), 1)
+    for start in range(0, len(matrix.row_ids), block_rows):
+        summary_builder.add(FloatMatrix2D(matrix.row_ids[start:start + block_rows],
+                                          matrix.col_ids,
+                                          matrix.values[start:start + block_rows]))
+
+    return summary_builder.summary()
+
+
+def summary_table(axis_summary, ids):
+    """
+    summary_table: text table of an AxisSummary laid out like DataFrame.describe(), one column
+                   per row/column id
+    """
+    import pandas as pd
+
+    table = pd.DataFrame({label: axis_summary[field] for field, label in SUMMARY_TABLE_ROWS
+                          if field in axis_summary}, index=ids, dtype=np.float64)
+    table_text = table.T.to_string()
+    if axis_summary.get('approximate_quantiles'):
+        table_text += '\n\n25%, 50% and 75% are approximate, estimated with quantile sketches'
+
+    return table_text
+
+
+class ProfileSummaryBuilder:
+    """
+    Accumulates the ProfileSummary of a matrix given in row chunks
+
+    row statistics are exact. column statistics are merged across chunks, column quantiles
+    need whole columns and are estimated with a quantile sketch per column unless the matrix
+    came in a single chunk
+    """
+
+    def __init__(self, col_count):
+        self._row_stats = [_axis_stats(np.empty((0, col_count)))]
+        self._col_stats = _axis_stats(np.empty((col_count, 0)))
+        self._col_sketches = QuantileSketches(col_count)
+        self._chunk_count = 0
+
+    def add(self, matrix):
+        self._row_stats.append(_axis_stats(matrix.values))
+        col_stats = _axis_stats(matrix.values.T, quantiles=not self._chunk_count)
+        if self._chunk_count:
+            self._col_stats = _merge_stats(self._col_stats, col_stats)
+        else:
+            self._col_stats = col_stats
+        self._col_sketches.update(matrix.values.T)
+        self._chunk_count += 1
+
+    def observe(self, matrices):
+        """
+        observe: pass FloatMatrix2D row chunks through, adding each to the summary
+        """
+        for matrix in matrices:
+            self.add(matrix)
+            yield matrix
+
+    def summary(self):
+        row_stats = {field: np.concatenate([stats[field] for stats in self._row_stats])
+                     for field in self._row_stats[-1]}
+
+        col_stats = self._col_stats
+        if self._chunk_count > 1:
+            col_quantiles = self._col_sketches.quantiles([quantile
+                                                          for _, quantile in SUMMARY_QUANTILES])
+            col_stats = dict(col_stats, approximate_quantiles=not self._col_sketches.exact)
+            for (field, _), quantile_values in zip(SUMMARY_QUANTILES, col_quantiles):
+                col_stats[field] = quantile_values
+
+        return {'rows': _to_summary(row_stats), 'cols': _to_summary(col_stats)}
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+# capacity of the top compactor, the rank error of a quantile is typically below 2 / capacity
+DEFAULT_SKETCH_CAPACITY = 200
+# each compactor below the top one holds CAPACITY_DECAY times as many items as the one above
+CAPACITY_DECAY = 2 / 3
+MIN_LEVEL_CAPACITY = 2
+
+
+class QuantileSketches:
+    """
+    KLL quantile sketches of many value streams at once, e.g. the columns of a matrix read in
+    row chunks
+
+    the sketches share their compactor layout: level h holds items of weight 2 ** h, a level
+    over its capacity is sorted and every other item, starting at a random offset, moves up a
+    level. NaN (null) sorts last and is carried like any other item, it is only left out when
+    quantiles are queried. memory is O(capacity) items per stream for any stream length
+    """
+
+    def __init__(self, stream_count, capacity=DEFAULT_SKETCH_CAPACITY, seed=None):
+        self.stream_count = stream_count
+        self.capacity = capacity
+        self.levels = [np.empty((stream_count, 0))]
+        self._random = np.random.RandomState(seed)
+
+    @property
+    def exact(self):
+        """
+        exact: whether no item was compacted yet, quantiles are then exact
+        """
+        return len(self.levels) == 1
+
+    def _level_capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(int(np.ceil(self.capacity * CAPACITY_DECAY ** depth)), MIN_LEVEL_CAPACITY)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if items.shape[1] > self._level_capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty((self.stream_count, 0)))
+                items = np.sort(items, axis=1)
+                # an odd item out, the largest, stays on this level
+                paired = items.shape[1] // 2 * 2
+                promoted = items[:, self._random.randint(2):paired:2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted],
+                                                        axis=1)
+                self.levels[level] = items[:, paired:]
+            level += 1
+
+    def update(self, values):
+        """
+        update: add values[i] to stream i, values is a (stream_count, n) array
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(self.stream_count, -1)
+        self.levels[0] = np.concatenate([self.levels[0], values], axis=1)
+        self._compress()
+
+    def quantiles(self, quantiles):
+        """
+        quantiles: quantiles of the non-null values of each stream, linearly interpolated
+                   between the items around the quantile rank
+
+        returns an array of shape (len(quantiles), stream_count), NaN for streams without values
+        """
+        results = np.full((len(quantiles), self.stream_count), np.nan)
+        items = np.concatenate(self.levels, axis=1)
+        if not items.shape[1]:
+            return results
+        weights = np.concatenate([np.full(level.shape[1], 2 ** idx, dtype=np.float64)
+                                  for idx, level in enumerate(self.levels)])
+
+        order = np.argsort(items, axis=1)
+        items = np.take_along_axis(items, order, axis=1)
+        weights = np.where(np.isnan(items), 0, weights[order])
+        # item i covers the 0-based ranks [rank_ends[i] - weights[i], rank_ends[i] - 1]
+        rank_ends = np.cumsum(weights, axis=1)
+        total = rank_ends[:, -1]
+        last_item = np.maximum((weights > 0).sum(axis=1) - 1, 0)
+
+        streams = np.arange(self.stream_count)
+        for idx, quantile in enumerate(quantiles):
+            position = np.maximum(total - 1, 0) * quantile
+            lower_rank = np.floor(position)
+            lower = np.minimum((rank_ends <= lower_rank[:, None]).sum(axis=1), last_item)
+            upper = np.minimum((rank_ends <= lower_rank[:, None] + 1).sum(axis=1), last_item)
+            lower_values = items[streams, lower]
+            upper_values = items[streams, upper]
+            fraction = position - lower_rank
+            with np.errstate(invalid='ignore'):
+                results[idx] = lower_values + (upper_values - lower_values) * fraction
+            results[idx][total == 0] = np.nan
+
+        return results
@@ -0,0 +1,118 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 300
+
+# sample versions are always > 0, unversioned (latest) lookups are stored as version 0 on disk
+UNVERSIONED = 0
+
+
+class SampleCache:
+    """
+    Two level cache for SampleService samples keyed by (sample_id, version)
+
+    level 1 is an in-process LRU, level 2 is an optional sqlite store. A sample at a given
+    version never changes so versioned entries never expire, unversioned lookups resolve to the
+    latest version and expire after ttl seconds.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, db_path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS samples ('
+                             'sample_id TEXT NOT NULL, '
+                             'version INTEGER NOT NULL, '
+                             'stored_at REAL NOT NULL, '
+                             'sample TEXT NOT NULL, '
+                             'PRIMARY KEY (sample_id, version))')
+            self._db.commit()
+
+    def _is_expired(self, version, stored_at):
+        return version == UNVERSIONED and time.time() - stored_at > self.ttl
+
+    def _put_memory(self, key, sample, stored_at):
+        self._lru[key] = (sample, stored_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def get(self, sample_id, version=None):
+        """
+        get: return the cached sample or None
+        """
+        key = (sample_id, version or UNVERSIONED)
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                sample, stored_at = entry
+                if not self._is_expired(key[1], stored_at):
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    return sample
+                del self._lru[key]
+
+            if self._db is not None:
+                row = self._db.execute('SELECT sample, stored_at FROM samples '
+                                       'WHERE sample_id = ? AND version = ?', key).fetchone()
+                if row is not None and not self._is_expired(key[1], row[1]):
+                    sample = json.loads(row[0])
+                    self._put_memory(key, sample, row[1])
+                    self.disk_hits += 1
+                    return sample
+
+            self.misses += 1
+
+        return None
+
+    def put(self, sample_id, version, sample):
+        """
+        put: cache a sample fetched for (sample_id, version)
+
+        unversioned lookups are also cached under the version the sample resolved to
+        """
+        stored_at = time.time()
+        keys = [(sample_id, version or UNVERSIONED)]
+        if not version and sample.get('version'):
+            keys.append((sample_id, sample['version']))
+
+        with self._lock:
+            for key in keys:
+                self._put_memory(key, sample, stored_at)
+
+            if self._db is not None:
+                try:
+                    sample_json = json.dumps(sample)
+                    self._db.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)',
+                                         [key + (stored_at, sample_json) for key in keys])
+                    self._db.commit()
+                except sqlite3.Error as err:
+                    logging.warning('failed to write sample {} to disk cache: {}'.format(
+                                                                            sample_id, err))
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0}
@@ -1,11 +1,21 @@
-
 import json
+import os
 import requests
+import threading
+import time
 import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from installed_clients.DataFileUtilClient import DataFileUtil
 from installed_clients.SampleServiceClient import SampleService
+from FunctionalProfileUtil.Utils.SampleCache import (SampleCache, DEFAULT_CACHE_SIZE,
+                                                     DEFAULT_CACHE_TTL)
+
+
+DEFAULT_SAMPLE_CONCURRENCY = 8
+DEFAULT_SAMPLE_BATCH_SIZE = 100
+FAILED_SAMPLE_REPORT_SIZE = 10
 
 
 class SampleServiceUtil:
@@ -19,36 +29,161 @@ class SampleServiceUtil:
         self.dfu = DataFileUtil(self.callback_url)
         self.sample_ser = SampleService(self.sample_url)
 
+        self.concurrency = int(config.get('sample-service-concurrency',
+                                          DEFAULT_SAMPLE_CONCURRENCY))
+        self.batch_size = int(config.get('sample-service-batch-size', DEFAULT_SAMPLE_BATCH_SIZE))
+
+        # persistent session so concurrent lookups reuse keep-alive connections
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        db_path = None
+        if str(config.get('sample-cache-on-disk', '')).lower() in ['1', 'true', 'yes']:
+            db_path = os.path.join(self.scratch, 'sample_cache.sqlite')
+        self.sample_cache = SampleCache(
+                            max_size=int(config.get('sample-cache-size', DEFAULT_CACHE_SIZE)),
+                            ttl=float(config.get('sample-cache-ttl', DEFAULT_CACHE_TTL)),
+                            db_path=db_path)
+        self.network_time = 0.0
+        self.fetched_sample_count = 0
+        self._stats_lock = threading.Lock()
+
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
                             level=logging.INFO)
 
     def get_sample_service_url(self):
         return self.sample_url
 
-    def get_sample(self, sample_id, version=None):
-
+    def _call_sample_service(self, method, params):
         sample_url = self.get_sample_service_url()
         headers = {"Authorization": self.token}
-        params = {
-            "id": sample_id,
-            "version": version
-        }
         payload = {
-            "method": "SampleService.get_sample",
+            "method": method,
             "id": str(uuid.uuid4()),
             "params": [params],
             "version": "1.1"
         }
-        resp = requests.post(url=sample_url, headers=headers, data=json.dumps(payload))
+        start_time = time.time()
+        resp = self.session.post(url=sample_url, headers=headers, data=json.dumps(payload))
         resp_json = resp.json()
+        with self._stats_lock:
+            self.network_time += time.time() - start_time
         if resp_json.get('error'):
             raise RuntimeError(f"Error from SampleService - {resp_json['error']}")
-        sample = resp_json['result'][0]
+
+        return resp_json['result'][0]
+
+    def get_cache_stats(self):
+        """
+        get_cache_stats: sample cache hit/miss counters plus SampleService network time
+
+        time_saved is estimated from the average network time per fetched sample
+        """
+        cache_stats = self.sample_cache.stats()
+        cache_stats['network_time'] = self.network_time
+        cache_stats['fetched_sample_count'] = self.fetched_sample_count
+        average_time = self.network_time / self.fetched_sample_count \
+            if self.fetched_sample_count else 0.0
+        cache_stats['time_saved'] = cache_stats['hits'] * average_time
+
+        return cache_stats
+
+    def _fetch_sample(self, sample_id, version=None):
+
+        params = {
+            "id": sample_id,
+            "version": version
+        }
+        sample = self._call_sample_service("SampleService.get_sample", params)
+        with self._stats_lock:
+            self.fetched_sample_count += 1
 
         # sample = self.sample_ser.get_sample(params)[0]
 
+        self.sample_cache.put(sample_id, version, sample)
+
         return sample
 
+    def get_sample(self, sample_id, version=None):
+
+        sample = self.sample_cache.get(sample_id, version=version)
+        if sample is None:
+            sample = self._fetch_sample(sample_id, version=version)
+
+        return sample
+
+    def get_samples(self, samples):
+        """
+        get_samples: fetch a batch of samples with a single SampleService.get_samples call
+                     samples - list of {'id': sample_id, 'version': version}
+        """
+        params = {"samples": [{"id": sample.get('id'), "version": sample.get('version')}
+                              for sample in samples]}
+        sample_data = self._call_sample_service("SampleService.get_samples", params)
+        with self._stats_lock:
+            self.fetched_sample_count += len(sample_data)
+
+        return sample_data
+
+    def _resolve_sample_batch(self, samples):
+        """
+        _resolve_sample_batch: resolve a batch of samples, returns a (sample, error) pair per
+                               input sample in input order
+        """
+        try:
+            sample_data = self.get_samples(samples)
+            if [sample.get('id') for sample in sample_data] == [s.get('id') for s in samples]:
+                for sample, sample_data_item in zip(samples, sample_data):
+                    self.sample_cache.put(sample.get('id'), sample.get('version'),
+                                          sample_data_item)
+                return [(sample, None) for sample in sample_data]
+            logging.warning('SampleService.get_samples returned unexpected samples')
+        except Exception as err:
+            logging.warning('failed to fetch {} samples in batch, fetching them one by one: '
+                            '{}'.format(len(samples), err))
+
+        results = []
+        for sample in samples:
+            try:
+                results.append((self._fetch_sample(sample.get('id'),
+                                                   version=sample.get('version')), None))
+            except Exception as err:
+                results.append((None, str(err)))
+
+        return results
+
+    def resolve_samples(self, samples):
+        """
+        resolve_samples: fetch samples concurrently in batches over a shared connection pool
+
+        samples - list of {'id': sample_id, 'version': version}
+
+        returns (sample_data, errors): sample_data follows input order with None for samples
+        that failed, errors maps the failed sample's position to its error message
+        """
+        sample_data = [self.sample_cache.get(sample.get('id'), version=sample.get('version'))
+                       for sample in samples]
+        uncached_idx = [idx for idx, sample in enumerate(sample_data) if sample is None]
+        uncached_samples = [samples[idx] for idx in uncached_idx]
+
+        batches = [uncached_samples[i:i + self.batch_size]
+                   for i in range(0, len(uncached_samples), self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            batch_results = list(executor.map(self._resolve_sample_batch, batches))
+
+        errors = dict()
+        batch_results = [result for batch_result in batch_results for result in batch_result]
+        for idx, (sample, error) in zip(uncached_idx, batch_results):
+            if error is not None:
+                errors[idx] = error
+            sample_data[idx] = sample
+
+        return sample_data, errors
+
     def get_ids_from_samples(self, sample_set_ref):
         logging.info('start retrieving sample ids from sample set')
 
@@ -57,14 +192,16 @@ class SampleServiceUtil:
 
         samples = sample_set['samples']
 
-        data_ids = []
-        for sample in samples:
-            sample_id = sample.get('id')
-            version = sample.get('version')
+        sample_data, errors = self.resolve_samples(samples)
+        logging.info('sample cache stats: {}'.format(self.get_cache_stats()))
 
-            sample_data = self.get_sample(sample_id, version=version)
+        if errors:
+            failed_samples = ['{} ({})'.format(samples[idx].get('id'), error)
+                              for idx, error in sorted(errors.items())]
+            raise RuntimeError('Failed to retrieve {} of {} samples: {}'.format(
+                                len(errors), len(samples),
+                                failed_samples[:FAILED_SAMPLE_REPORT_SIZE]))
 
-            data_id = sample_data['name']
-            data_ids.append(data_id)
+        data_ids = [sample['name'] for sample in sample_data]
 
         return data_ids
@@ -0,0 +1,73 @@
+import json
+import logging
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+
+# ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage.ru_utime + usage.ru_stime +
+            children_usage.ru_utime + children_usage.ru_stime)
+
+
+class StageTimer:
+    """
+    Records timings of the stages of an import
+
+    each span records wall time, CPU time of this process and its finished child processes
+    (e.g. parse workers), growth of the peak resident set size and optionally the bytes the
+    stage read and produced. Peak RSS is a high-water mark, a stage that stays below an earlier
+    peak reports 0.
+    """
+
+    def __init__(self):
+        self.spans = list()
+
+    @contextmanager
+    def span(self, stage, bytes_in=None):
+        """
+        span: time the enclosed block as stage
+
+        yields the span record, set its 'bytes_in'/'bytes_out' once they are known
+        """
+        record = {'stage': stage}
+        if bytes_in is not None:
+            record['bytes_in'] = bytes_in
+
+        start_wall_time = time.perf_counter()
+        start_cpu_time = _cpu_time()
+        start_peak_rss = _peak_rss()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = time.perf_counter() - start_wall_time
+            record['cpu_time'] = _cpu_time() - start_cpu_time
+            record['peak_rss_delta'] = max(_peak_rss() - start_peak_rss, 0)
+            self.spans.append(record)
+            logging.info('stage {} took {:.3f}s wall, {:.3f}s CPU'.format(
+                                            stage, record['wall_time'], record['cpu_time']))
+
+    def summary(self):
+        return [dict(record) for record in self.spans]
+
+    def write_trace(self, trace_path):
+        """
+        write_trace: dump all spans into a JSON trace file
+        """
+        with open(trace_path, 'w') as trace_file:
+            json.dump({'stages': self.summary(),
+                       'total_wall_time': sum(record['wall_time'] for record in self.spans)},
+                      trace_file, indent=2)
+
+        return trace_path
@@ -8,9 +8,11 @@
 from __future__ import print_function
 
 import json as _json
+import gzip as _gzip
 import requests as _requests
 import random as _random
 import os as _os
+import threading as _threading
 import traceback as _traceback
 from requests.exceptions import ConnectionError
 from urllib3.exceptions import ProtocolError
@@ -30,6 +32,30 @@ _CT = 'content-type'
 _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
 _CHECK_JOB_RETRYS = 3
+_POOL_SIZE = int(_os.environ.get('KB_CLIENT_POOL_SIZE', 10))
+_GZIP_REQUESTS = _os.environ.get('KB_CLIENT_GZIP_REQUESTS', '').lower() in ('1', 'true')
+_GZIP_MIN_SIZE = 64 * 1024
+_JOB_CHECK_CEILING = int(_os.environ.get('KB_CLIENT_JOB_CHECK_CEILING_MS',
+                                         5000)) / 1000.0
+
+_sessions = dict()
+_sessions_lock = _threading.Lock()
+
+
+def _get_session(pool_size=_POOL_SIZE):
+    # one keep-alive session per process and pool size, shared by every client.
+    # sessions are not reused across fork since the pooled sockets would be shared
+    key = (_os.getpid(), pool_size)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _requests.Session()
+            adapter = _requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                     pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+    return session
 
 
 def _get_token(user_id, password, auth_svc):
@@ -97,6 +123,54 @@ class _JSONObjectEncoder(_json.JSONEncoder):
         return _json.JSONEncoder.default(self, obj)
 
 
+class BackoffWaitStrategy(object):
+    '''
+    Capped exponential backoff with jitter between asynchronous job checks.
+    initial_time - the first wait time in seconds.
+    scale_percent - each wait is scaled by this percentage.
+    max_time - the wait time ceiling in seconds.
+    jitter - fraction of each wait that is randomized, 0 disables jitter.
+    '''
+    def __init__(self, initial_time=0.1, scale_percent=150, max_time=5.0,
+                 jitter=0.2):
+        self.initial_time = initial_time
+        self.scale_percent = scale_percent
+        self.max_time = max_time
+        self.jitter = jitter
+
+    def _jittered(self, wait_time):
+        return wait_time * (1 - self.jitter * _random.random())
+
+    def wait_times(self):
+        wait_time = self.initial_time
+        while True:
+            yield self._jittered(min(wait_time, self.max_time))
+            wait_time = wait_time * self.scale_percent / 100.0
+
+
+class LongPollWaitStrategy(BackoffWaitStrategy):
+    '''
+    Checks the job at a short fixed interval for the first poll_window
+    seconds, then falls back to capped exponential backoff. The job service
+    has no blocking job check so this emulates long polling for jobs that
+    are expected to finish soon.
+    poll_interval - the wait time in seconds during the poll window.
+    poll_window - how long to poll at the fixed interval in seconds.
+    '''
+    def __init__(self, poll_interval=0.25, poll_window=60, **kwargs):
+        super(LongPollWaitStrategy, self).__init__(**kwargs)
+        self.poll_interval = poll_interval
+        self.poll_window = poll_window
+
+    def wait_times(self):
+        waited = 0
+        while waited < self.poll_window:
+            waited += self.poll_interval
+            yield self.poll_interval
+        for wait_time in super(LongPollWaitStrategy, self).wait_times():
+            yield wait_time
+
+
 class BaseClient(object):
     '''
     The KBase base client.
@@ -120,6 +194,16 @@ class BaseClient(object):
     lookup_url - set to true when contacting KBase dynamic services.
     async_job_check_time_ms - the wait time between checking job state for
         asynchronous jobs run with the run_job method.
+    async_job_check_max_time_ms - the maximum wait time between job checks,
+        further capped by the KB_CLIENT_JOB_CHECK_CEILING_MS environment
+        variable (default 5000).
+    wait_strategy - a BackoffWaitStrategy (or subclass) deciding the wait
+        times between job checks. Overrides the async_job_check settings.
+    pool_size - the size of the connection pool of the shared keep-alive
+        session. Default KB_CLIENT_POOL_SIZE environment variable or 10.
+    gzip_requests - gzip request bodies larger than 64KB. The server must
+        accept Content-Encoding: gzip. Default KB_CLIENT_GZIP_REQUESTS
+        environment variable or False.
     '''
     def __init__(
             self, url=None, timeout=30 * 60, user_id=None,
@@ -129,7 +213,10 @@ class BaseClient(object):
             lookup_url=False,
             async_job_check_time_ms=100,
             async_job_check_time_scale_percent=150,
-            async_job_check_max_time_ms=300000):
+            async_job_check_max_time_ms=300000,
+            pool_size=None,
+            gzip_requests=None,
+            wait_strategy=None):
         if url is None:
             raise ValueError('A url is required')
         scheme, _, _, _, _, _ = _urlparse(url)
@@ -144,6 +231,17 @@ class BaseClient(object):
         self.async_job_check_time_scale_percent = (
             async_job_check_time_scale_percent)
         self.async_job_check_max_time = async_job_check_max_time_ms / 1000.0
+        if wait_strategy is None:
+            wait_strategy = BackoffWaitStrategy(
+                initial_time=self.async_job_check_time,
+                scale_percent=self.async_job_check_time_scale_percent,
+                max_time=min(self.async_job_check_max_time,
+                             _JOB_CHECK_CEILING))
+        self.wait_strategy = wait_strategy
+        self.last_job_stats = None
+        self.pool_size = _POOL_SIZE if pool_size is None else int(pool_size)
+        self.gzip_requests = (_GZIP_REQUESTS if gzip_requests is None
+                              else gzip_requests)
         # token overrides user_id and password
         if token is not None:
             self._headers['AUTHORIZATION'] = token
@@ -175,10 +273,15 @@ class BaseClient(object):
                 raise ValueError('context is not type dict as required.')
             arg_hash['context'] = context
 
-        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder).encode('utf-8')
+        headers = self._headers
+        if self.gzip_requests and len(body) > _GZIP_MIN_SIZE:
+            body = _gzip.compress(body)
+            headers = dict(headers)
+            headers['Content-Encoding'] = 'gzip'
+        ret = _get_session(self.pool_size).post(
+            url, data=body, headers=headers, timeout=self.timeout,
+            verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
@@ -236,18 +339,20 @@ class BaseClient(object):
         service_ver - the version of the service to run, e.g. a git hash
             or dev/beta/release.
         context - the rpc context dict.
+        After the job finishes, last_job_stats holds the number of checks,
+        the elapsed time and an upper bound on the latency between the job
+        finishing and this client noticing.
         '''
         mod, _ = service_method.split('.')
         job_id = self._submit_job(service_method, args, service_ver, context)
-        async_job_check_time = self.async_job_check_time
+        submit_time = time.time()
+        # the job finished some time after the last check that saw it running
+        last_running_check = submit_time
+        check_count = 0
         check_job_failures = 0
+        wait_times = self.wait_strategy.wait_times()
         while check_job_failures < _CHECK_JOB_RETRYS:
-            time.sleep(async_job_check_time)
-            async_job_check_time = (async_job_check_time *
-                                    self.async_job_check_time_scale_percent /
-                                    100.0)
-            if async_job_check_time > self.async_job_check_max_time:
-                async_job_check_time = self.async_job_check_max_time
+            time.sleep(next(wait_times))
 
             try:
                 job_state = self._check_job(mod, job_id)
@@ -256,12 +361,20 @@ class BaseClient(object):
                 check_job_failures += 1
                 continue
 
+            check_count += 1
+            check_time = time.time()
             if job_state['finished']:
+                self.last_job_stats = {
+                    'job_id': job_id,
+                    'check_count': check_count,
+                    'elapsed_time': check_time - submit_time,
+                    'max_detection_latency': check_time - last_running_check}
                 if not job_state['result']:
                     return
                 if len(job_state['result']) == 1:
                     return job_state['result'][0]
                 return job_state['result']
+            last_running_check = check_time
         raise RuntimeError("_check_job failed {} times and exceeded limit".format(
             check_job_failures))
 
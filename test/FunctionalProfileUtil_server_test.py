@@ -4,16 +4,36 @@ import time
 import unittest
 from configparser import ConfigParser
 from mock import patch
+import itertools
 import json
+import re
+import shutil
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pandas as pd
 
 from FunctionalProfileUtil.FunctionalProfileUtilImpl import FunctionalProfileUtil
-from FunctionalProfileUtil.Utils.ProfileImporter import ProfileImporter
+from FunctionalProfileUtil.Utils.ProfileImporter import ProfileImporter, _parse_profile_data
+from FunctionalProfileUtil.Utils.ParseExecutor import ParseExecutor
+from FunctionalProfileUtil.Utils.FloatMatrix2D import FloatMatrix2D
+from FunctionalProfileUtil.Utils.HeatmapPreview import heatmap_preview
+from FunctionalProfileUtil.Utils.MatrixCache import MatrixCache
+from FunctionalProfileUtil.Utils.ProfileSummary import ProfileSummaryBuilder, summarize
+from FunctionalProfileUtil.Utils.QuantileSketch import QuantileSketches
+from FunctionalProfileUtil.Utils.StageTimer import StageTimer
 from FunctionalProfileUtil.FunctionalProfileUtilServer import MethodContext
 from FunctionalProfileUtil.authclient import KBaseAuth as _KBaseAuth
 
 from installed_clients.WorkspaceClient import Workspace
 from installed_clients.DataFileUtilClient import DataFileUtil
 from installed_clients.FakeObjectsForTestsClient import FakeObjectsForTests
+from installed_clients.kb_GenericsReportClient import kb_GenericsReport
+from installed_clients.baseclient import BackoffWaitStrategy, BaseClient, LongPollWaitStrategy
+from installed_clients.baseclient import ServerError
+from requests.exceptions import ConnectionError
 
 DATA_IDS = ['PB-Low-5', 'PB-High-5', 'PB-Low-6', 'PB-High-6',
             'PB-Low-7', 'PB-High-7', 'PB-Low-8', 'PB-High-8']
@@ -102,6 +122,384 @@ class FunctionalProfileUtilTest(unittest.TestCase):
                       'profile_category': 'fake profile_category'}
             self.serviceImpl.import_func_profile(self.ctx, params)
 
+    def test_startup_time(self):
+        # cold start of a service worker: load the server module, which builds the Impl, and
+        # answer status. profile import dependencies have to stay unloaded until first used
+        startup_script = """
+import json, sys, time
+start_time = time.perf_counter()
+from FunctionalProfileUtil.FunctionalProfileUtilServer import impl_FunctionalProfileUtil
+from FunctionalProfileUtil.FunctionalProfileUtilServer import MethodContext
+impl_FunctionalProfileUtil.status(MethodContext(None))
+print(json.dumps({'startup_time': time.perf_counter() - start_time,
+                  'modules': sorted(sys.modules)}))
+"""
+        startup = json.loads(subprocess.check_output([sys.executable, '-c', startup_script]))
+        print('service startup took {:.3f}s'.format(startup['startup_time']))
+
+        for module in ['pandas', 'numpy', 'xlrd', 'FunctionalProfileUtil.Utils.ProfileImporter']:
+            self.assertNotIn(module, startup['modules'])
+
+    def test_file_to_df(self):
+        profile_file_path = os.path.join('data', 'func_table.tsv')
+        self.assertEqual(self.profile_importer._detect_file_format(profile_file_path), 'text')
+        self.assertEqual(self.profile_importer._detect_delimiter(profile_file_path), '\t')
+        df = self.profile_importer._file_to_df(profile_file_path)
+        self.assertEqual(df.shape, (9, 8))
+        self.assertCountEqual(df.columns, DATA_IDS)
+
+        profile_file_path = os.path.join('data', 'func_table_trans.tsv')
+        self.assertEqual(self.profile_importer._detect_delimiter(profile_file_path), ',')
+        df = self.profile_importer._file_to_df(profile_file_path)
+        self.assertEqual(df.shape, (8, 9))
+        self.assertCountEqual(df.index, DATA_IDS)
+
+        fake_excel_path = os.path.join(self.scratch, 'fake_excel.xlsx')
+        shutil.copy(os.path.join('data', 'func_table.tsv'), fake_excel_path)
+        with self.assertRaisesRegex(ValueError, "is not a valid excel file"):
+            self.profile_importer._file_to_df(fake_excel_path)
+
+        # parser and decode errors keep the friendly message
+        ragged_path = os.path.join(self.scratch, 'ragged.tsv')
+        with open(ragged_path, 'w') as ragged_file:
+            ragged_file.write('id\ts_1\ts_2\nrow_1\t1\t2\nrow_2\t1\t2\t3\t4\n')
+        non_utf8_path = os.path.join(self.scratch, 'non_utf8.tsv')
+        with open(non_utf8_path, 'wb') as non_utf8_file:
+            non_utf8_file.write('id\ts_1\nrow_\xe9\t1\n'.encode('latin-1'))
+        for file_path in [ragged_path, non_utf8_path]:
+            with self.assertRaisesRegex(ValueError, "Cannot parse file"):
+                self.profile_importer._file_to_df(file_path)
+
+    def test_float_matrix_2d(self):
+        data = {'row_ids': ['row_1', 'row_2'],
+                'col_ids': ['col_1', 'col_2', 'col_3'],
+                'values': [[0.1, None, 3], [0, 0.0, -1.5]]}
+        matrix = FloatMatrix2D.from_dict(data)
+
+        self.assertEqual(matrix.shape, (2, 3))
+        self.assertEqual(matrix.null_mask.sum(), 1)
+        self.assertEqual(matrix.to_dict()['values'], [[0.1, None, 3.0], [0.0, 0.0, -1.5]])
+        self.assertEqual(''.join(matrix.iter_json(chunk_rows=1)), json.dumps(matrix.to_dict()))
+
+        with self.assertRaisesRegex(ValueError, "does not match"):
+            FloatMatrix2D(['row_1'], ['col_1'], [[1, 2]])
+
+    def test_sparse_float_matrix_2d(self):
+        matrix = FloatMatrix2D(['row_1', 'row_2', 'row_3'], ['col_1', 'col_2', 'col_3'],
+                               [[0, 0, 2], [0, 0, 0], [None, 1, 0]], sparse=True)
+
+        self.assertAlmostEqual(matrix.zero_fraction, 6 / 9)
+        self.assertEqual(matrix.to_dict()['sparse_values'], {'indptr': [0, 1, 1, 3],
+                                                             'indices': [2, 0, 1],
+                                                             'values': [2.0, None, 1.0]})
+        self.assertNotIn('values', matrix.to_dict())
+        matrix_json = ''.join(matrix.iter_json(chunk_rows=2))
+        self.assertEqual(matrix_json, json.dumps(matrix.to_dict()))
+        # indptr, indices and integral values are measured exactly
+        self.assertEqual(matrix.estimate_json_size(), (len(matrix_json),) * 3)
+
+        sparse_matrix = FloatMatrix2D.from_dict(json.loads(matrix_json))
+        self.assertTrue(sparse_matrix.sparse)
+        self.assertEqual(sparse_matrix.to_df().fillna(-1).values.tolist(),
+                         [[0, 0, 2], [0, 0, 0], [-1, 1, 0]])
+
+        # func_table.tsv is mostly zeros, sparse encoding is opt-in
+        profile_data = self.profile_importer._parse_profile_data(
+                                    os.path.join('data', 'func_table.tsv'), None, 'community')
+        self.assertFalse(self.profile_importer._choose_encoding(profile_data).sparse)
+        with patch.object(self.profile_importer, 'sparse_threshold', 0.75):
+            self.assertTrue(self.profile_importer._choose_encoding(profile_data).sparse)
+
+    def test_profile_summary(self):
+        df = self.profile_importer._file_to_df(os.path.join('data', 'func_table.tsv'))
+        df.iloc[0, 0] = None
+        profile_data = FloatMatrix2D.from_df(df)
+
+        summary = summarize(profile_data)
+        for axis, axis_df in [('cols', df), ('rows', df.T)]:
+            describe = axis_df.describe()
+            for field, label in [('count', 'count'), ('mean', 'mean'), ('std', 'std'),
+                                 ('min', 'min'), ('q1', '25%'), ('median', '50%'),
+                                 ('q3', '75%'), ('max', 'max')]:
+                self.assertTrue(np.allclose(summary[axis][field], describe.loc[label]))
+            self.assertTrue(np.allclose(summary[axis]['sum'], axis_df.sum()))
+            self.assertEqual(summary[axis]['nonzero_count'],
+                             ((axis_df != 0) & axis_df.notna()).sum().tolist())
+
+        # row chunks give the same statistics, column quantiles come from sketches which are
+        # exact for few values
+        summary_builder = ProfileSummaryBuilder(len(profile_data.col_ids))
+        for start in range(0, len(profile_data.row_ids), 2):
+            summary_builder.add(FloatMatrix2D(profile_data.row_ids[start:start + 2],
+                                              profile_data.col_ids,
+                                              profile_data.values[start:start + 2]))
+        chunked_summary = summary_builder.summary()
+        self.assertEqual(chunked_summary['rows'], summary['rows'])
+        self.assertNotIn('approximate_quantiles', chunked_summary['cols'])
+        for field, values in chunked_summary['cols'].items():
+            self.assertTrue(np.allclose(values, summary['cols'][field]))
+
+        # statistics without values are null
+        summary = summarize(FloatMatrix2D(['row_1'], ['col_1', 'col_2'], [[None, 1]]))
+        self.assertEqual(summary['cols']['mean'], [None, 1.0])
+        self.assertEqual(summary['rows']['std'], [None])
+
+    def test_quantile_sketches(self):
+        quantiles = [0.25, 0.5, 0.75]
+        values = np.random.RandomState(0).lognormal(size=(3, 20000))
+        values[0, ::10] = None
+        values[2] = None
+
+        sketches = QuantileSketches(3, capacity=100, seed=0)
+        for start in range(0, values.shape[1], 3000):
+            sketches.update(values[:, start:start + 3000])
+        self.assertFalse(sketches.exact)
+        # memory does not grow with the stream
+        self.assertLess(sum(level.shape[1] for level in sketches.levels), 4 * 100)
+
+        estimates = sketches.quantiles(quantiles)
+        self.assertTrue(np.isnan(estimates[:, 2]).all())
+        for stream in range(2):
+            stream_values = np.sort(values[stream][~np.isnan(values[stream])])
+            for quantile, estimate in zip(quantiles, estimates[:, stream]):
+                rank = np.searchsorted(stream_values, estimate) / len(stream_values)
+                self.assertLess(abs(rank - quantile), 0.05)
+
+        # profiles above sketch_cells are summarized in one pass with approximate quantiles
+        profile_data = FloatMatrix2D(list(map(str, range(20000))), ['col_1', 'col_2', 'col_3'],
+                                     values.T)
+        with patch('FunctionalProfileUtil.Utils.ProfileSummary.SUMMARY_BLOCK_CELLS', 3000):
+            summary = summarize(profile_data, sketch_cells=0)
+        self.assertEqual(summary['rows'], summarize(profile_data)['rows'])
+        self.assertEqual(summary['cols']['approximate_quantiles'], 1)
+        self.assertEqual(summary['cols']['count'], [18000, 20000, 0])
+
+    def test_heatmap_preview(self):
+        random = np.random.RandomState(0)
+        # 3 groups of rows around distinct centers, the later columns vary the most
+        centers = random.uniform(0, 100, size=(3, 40)) * np.linspace(0.1, 1, 40)
+        values = centers[np.arange(3000) % 3] + random.normal(scale=0.1, size=(3000, 40))
+        values[::7, 0] = None
+        profile_data = FloatMatrix2D(['row_{}'.format(idx) for idx in range(3000)],
+                                     ['col_{}'.format(idx) for idx in range(40)], values)
+        summary = summarize(profile_data)
+
+        # small profiles are drawn whole
+        preview, description = heatmap_preview(profile_data, summary, max_rows=3000, max_cols=40)
+        self.assertIsNone(description)
+        self.assertEqual(preview.shape, (3000, 40))
+        self.assertFalse(np.isnan(preview.values).any())
+
+        preview, description = heatmap_preview(profile_data, summary, max_rows=50, max_cols=10)
+        self.assertEqual(preview.shape, (50, 10))
+        col_std = np.nanstd(values, axis=0)
+        self.assertCountEqual(preview.col_ids,
+                              [profile_data.col_ids[col] for col in np.argsort(-col_std)[:10]])
+        row_std = np.nanstd(values, axis=1, ddof=1)
+        self.assertCountEqual(preview.row_ids,
+                              [profile_data.row_ids[row] for row in np.argsort(-row_std)[:50]])
+        self.assertIn('50 of 3000 rows', description)
+        self.assertIn('10 of 40 columns', description)
+
+        preview, description = heatmap_preview(profile_data, summary, max_rows=3, max_cols=10,
+                                               method='kmeans')
+        self.assertEqual(preview.shape, (3, 10))
+        self.assertEqual(preview.row_ids, ['cluster_{} (1000 rows)'.format(idx)
+                                           for idx in range(1, 4)])
+        cols = [profile_data.col_ids.index(col_id) for col_id in preview.col_ids]
+        self.assertTrue(np.allclose(np.sort(preview.values[:, -1]),
+                                    np.sort(centers[:, cols[-1]]), atol=0.1))
+        self.assertIn('3 k-means clusters of 3000 rows', description)
+
+        with self.assertRaisesRegex(ValueError, 'heatmap preview method'):
+            heatmap_preview(profile_data, summary, max_rows=3, method='fake_method')
+
+    def test_dump_func_profile(self):
+        profile_file_path = os.path.join('data', 'func_table.tsv')
+        func_profile_data = {'profile_category': 'community',
+                             'data': self.profile_importer._parse_profile_data(
+                                                    profile_file_path, None, 'community')}
+
+        data_path = os.path.join(self.scratch, 'func_profile_dump.json')
+        json_size = self.profile_importer._dump_func_profile(func_profile_data, data_path)
+
+        self.assertEqual(json_size, os.path.getsize(data_path))
+        self.assertEqual(json_size,
+                         len(json.dumps(self.profile_importer._to_obj_data(func_profile_data))))
+        with open(data_path) as data_file:
+            dumped_data = json.load(data_file)
+        self.assertEqual(dumped_data['data'], func_profile_data['data'].to_dict())
+
+    def test_estimate_object_size(self):
+        profile_file_path = os.path.join('data', 'func_table.tsv')
+        func_profile_data = {'profile_category': 'community',
+                             'data': self.profile_importer._parse_profile_data(
+                                                    profile_file_path, None, 'community')}
+
+        json_size = self.profile_importer._dump_func_profile(
+                                func_profile_data, os.path.join(self.scratch, 'estimate.json'))
+        estimate, lower_bound, upper_bound = self.profile_importer._estimate_object_size(
+                                                                            func_profile_data)
+        self.assertTrue(lower_bound <= json_size <= upper_bound)
+        self.assertTrue(lower_bound <= estimate <= upper_bound)
+
+        # integral and null values are measured exactly
+        matrix = FloatMatrix2D(['row_1', 'row_2'], ['col_1', 'col_2'], [[0, -0.0], [None, 123]])
+        self.assertEqual(matrix.estimate_json_size(), (len(json.dumps(matrix.to_dict())),) * 3)
+
+    def test_match_item_ids(self):
+        df = self.profile_importer._file_to_df(os.path.join('data', 'func_table.tsv'))
+        row_ids, col_ids = df.index, df.columns
+
+        match_report = self.profile_importer._match_item_ids(row_ids, col_ids, DATA_IDS,
+                                                             'community')
+        self.assertEqual(match_report['orientation'], 'original')
+        self.assertEqual(match_report['original']['match_rate'], 1)
+        self.assertEqual(match_report['transposed']['matched_count'], 0)
+
+        match_report = self.profile_importer._match_item_ids(row_ids, col_ids, DATA_IDS,
+                                                             'organism')
+        self.assertEqual(match_report['orientation'], 'transposed')
+        self.assertEqual(len(match_report['original']['unmatched_sample']), 9)
+
+        match_report = self.profile_importer._match_item_ids(row_ids, col_ids, DATA_IDS[:4],
+                                                             'community')
+        self.assertIsNone(match_report['orientation'])
+        self.assertEqual(match_report['original']['match_rate'], 0.5)
+        self.assertCountEqual(match_report['original']['unmatched_sample'], DATA_IDS[4:])
+
+    def test_generate_visualization_content_in_memory(self):
+        profile_data = self.profile_importer._parse_profile_data(
+                                    os.path.join('data', 'func_table.tsv'), DATA_IDS, 'community')
+
+        output_directory = os.path.join(self.scratch, 'visualization_in_memory')
+        heatmap_dir = os.path.join(self.scratch, 'fake_heatmap')
+        os.makedirs(output_directory, exist_ok=True)
+        os.makedirs(heatmap_dir, exist_ok=True)
+
+        with patch.object(kb_GenericsReport, "build_heatmap_html",
+                          return_value={'html_dir': heatmap_dir}), \
+                patch.object(DataFileUtil, "get_objects") as get_objects:
+            visualization_content = self.profile_importer._generate_visualization_content(
+                                                        'fake_ref', output_directory,
+                                                        profile_data=profile_data)
+
+        get_objects.assert_not_called()
+        self.assertIn('Profile Size: 9 x 8', visualization_content)
+
+    def test_parse_executor(self):
+        parse_executor = ParseExecutor(self.scratch, max_workers=2, split_min_size=0,
+                                       range_size=100)
+
+        profile_file_path = os.path.join('data', 'func_table.tsv')
+        matrix = parse_executor.parse_text_file(profile_file_path, '\t')
+        df = self.profile_importer._file_to_df(profile_file_path)
+
+        self.assertEqual(matrix.row_ids, df.index.tolist())
+        self.assertEqual(matrix.col_ids, df.columns.tolist())
+        self.assertTrue((matrix.values == df.values).all())
+
+        # numeric looking row ids parse the same in the split, whole file and streaming paths
+        numeric_ids_path = os.path.join(self.scratch, 'numeric_ids.tsv')
+        with open(numeric_ids_path, 'w') as numeric_ids_file:
+            numeric_ids_file.write('id\ts_1\ts_2\n001\t1\t2\n2.50\t3\t4\n')
+        row_ids = ['001', '2.50']
+        self.assertEqual(parse_executor.parse_text_file(numeric_ids_path, '\t').row_ids, row_ids)
+        self.assertEqual(self.profile_importer._file_to_df(numeric_ids_path).index.tolist(),
+                         row_ids)
+        self.assertEqual([row_id for chunk in self.profile_importer._iter_profile_chunks(
+                                                                    numeric_ids_path, '\t', 1)
+                          for row_id in chunk.row_ids], row_ids)
+
+        results = parse_executor.parse_files(
+                    _parse_profile_data,
+                    [(profile_file_path, DATA_IDS, 'organism'),
+                     (os.path.join('data', 'func_table_extra_col.tsv'), DATA_IDS, 'community')])
+        self.assertEqual(results[0][0].shape, (8, 9))
+        self.assertIsNone(results[0][1])
+        self.assertIsNone(results[1][0])
+        self.assertRegex(results[1][1], 'Matrix column does not')
+
+        # a few workers by default, fewer within a small memory budget, more only by config
+        with patch('os.sched_getaffinity', return_value=set(range(64))):
+            self.assertEqual(ProfileImporter(self.cfg).parse_workers, 4)
+            self.assertEqual(ProfileImporter(dict(self.cfg, **{
+                                'import-memory-budget': 2 * 8 * 64 * 1024 * 1024})).parse_workers,
+                             2)
+            self.assertEqual(ProfileImporter(dict(self.cfg, **{
+                                'import-memory-budget': 1024})).parse_workers, 1)
+        with patch('os.sched_getaffinity', return_value={0}):
+            self.assertEqual(ProfileImporter(self.cfg).parse_workers, 1)
+        self.assertEqual(ProfileImporter(dict(self.cfg, **{'parse-workers': '16'})).parse_workers,
+                         16)
+
+    def test_job_wait_strategies(self):
+        def take(wait_strategy, count):
+            wait_times = wait_strategy.wait_times()
+            return [next(wait_times) for _ in range(count)]
+
+        # each wait is shortened by up to jitter of itself
+        with patch('installed_clients.baseclient._random.random', return_value=0.5):
+            self.assertEqual(take(BackoffWaitStrategy(initial_time=1, scale_percent=200,
+                                                      max_time=5, jitter=0.2), 5),
+                             [0.9, 1.8, 3.6, 4.5, 4.5])
+        self.assertEqual(take(BackoffWaitStrategy(initial_time=1, scale_percent=200,
+                                                  max_time=5, jitter=0), 5),
+                         [1, 2, 4, 5, 5])
+
+        # fixed interval during the poll window, then backoff
+        self.assertEqual(take(LongPollWaitStrategy(poll_interval=0.25, poll_window=1,
+                                                   initial_time=1, scale_percent=200,
+                                                   max_time=3, jitter=0), 8),
+                         [0.25] * 4 + [1, 2, 3, 3])
+
+        # the job check ceiling caps the configured maximum wait
+        with patch('installed_clients.baseclient._JOB_CHECK_CEILING', 5.0):
+            client = BaseClient('http://localhost', token='fake_token')
+            self.assertEqual(client.wait_strategy.max_time, 5.0)
+            client = BaseClient('http://localhost', token='fake_token',
+                                async_job_check_max_time_ms=2000)
+            self.assertEqual(client.wait_strategy.max_time, 2.0)
+
+    def test_run_job_stats(self):
+        clock = [100.0]
+        sleep_times = list()
+
+        def fake_sleep(wait_time):
+            sleep_times.append(wait_time)
+            clock[0] += wait_time
+
+        client = BaseClient('http://localhost', token='fake_token',
+                            wait_strategy=LongPollWaitStrategy(poll_interval=0.5, poll_window=1,
+                                                               initial_time=2, jitter=0))
+        job_states = [{'finished': 0}, {'finished': 0}, ConnectionError('reset'),
+                      {'finished': 1, 'result': ['fake_result']}]
+        with patch.object(client, '_submit_job', return_value='fake_job_id') as submit_job, \
+                patch.object(client, '_check_job', side_effect=job_states) as check_job, \
+                patch('installed_clients.baseclient.time.sleep', side_effect=fake_sleep), \
+                patch('installed_clients.baseclient.time.time', side_effect=lambda: clock[0]), \
+                patch('installed_clients.baseclient._traceback.print_exc'):
+            result = client.run_job('FakeService.fake_method', [{}])
+
+        self.assertEqual(result, 'fake_result')
+        submit_job.assert_called_once_with('FakeService.fake_method', [{}], None, None)
+        self.assertEqual(check_job.call_count, 4)
+        self.assertEqual(sleep_times, [0.5, 0.5, 2, 3.0])
+        # failed checks are not counted, the job may have finished right after the last
+        # check that saw it running
+        self.assertEqual(client.last_job_stats, {'job_id': 'fake_job_id',
+                                                 'check_count': 3,
+                                                 'elapsed_time': 6.0,
+                                                 'max_detection_latency': 5.0})
+
+        # repeated check failures give up
+        with patch.object(client, '_submit_job', return_value='fake_job_id'), \
+                patch.object(client, '_check_job', side_effect=ConnectionError('reset')), \
+                patch('installed_clients.baseclient.time.sleep'), \
+                patch('installed_clients.baseclient._traceback.print_exc'):
+            with self.assertRaisesRegex(RuntimeError, '_check_job failed 3 times'):
+                client.run_job('FakeService.fake_method', [{}])
+
     def mock_save_objects(params):
         print('Mocking DataFileUtilClient.save_objects')
 
@@ -122,8 +520,33 @@ class FunctionalProfileUtilTest(unittest.TestCase):
 
         return {'data': [{'data': obj_data}]}
 
+    def mock_get_objects2(params):
+        print('Mocking WorkspaceClient.get_objects2')
+
+        fake_object_ref = params['objects'][0]['ref']
+
+        obj_data = {'col_attributemapping_ref': fake_object_ref,
+                    'row_attributemapping_ref': fake_object_ref,
+                    'data': {'row_ids': DATA_IDS,
+                             'col_ids': DATA_IDS}}
+
+        return {'data': [{'data': obj_data}]}
+
+    @patch.object(Workspace, "get_objects2",
+                  side_effect=ServerError('JSONRPCError', -32500, 'Unknown method'))
+    def test_get_base_object_data_fallback(self, get_objects2):
+        fake_object_ref = self.createAnObject()
+
+        with patch.object(DataFileUtil, "get_objects", side_effect=self.mock_get_objects):
+            base_object_data = self.profile_importer._get_base_object_data(fake_object_ref)
+
+        get_objects2.assert_called_once()
+        self.assertEqual(base_object_data['sample_set_ref'], fake_object_ref)
+        self.assertCountEqual(base_object_data['data']['col_ids'], DATA_IDS)
+
+    @patch.object(Workspace, "get_objects2", side_effect=mock_get_objects2)
     @patch.object(DataFileUtil, "save_objects", side_effect=mock_save_objects)
-    def test_import_func_profile(self, save_objects):
+    def test_import_func_profile(self, save_objects, get_objects2):
 
         data_ids = ['PB-Low-5', 'PB-High-5', 'PB-Low-6', 'PB-High-6',
                     'PB-Low-7', 'PB-High-7', 'PB-Low-8', 'PB-High-8']
@@ -148,12 +571,15 @@ class FunctionalProfileUtilTest(unittest.TestCase):
 
         expected_keys = ['profile_category', 'profile_type',
                          'data_epistemology', 'epistemology_method',
-                         'base_object_ref', 'data', 'col_attributemapping_ref']
+                         'base_object_ref', 'data', 'summary',
+                         'col_attributemapping_ref']
         self.assertCountEqual(func_profile_data.keys(), expected_keys)
 
         self.assertEqual(func_profile_data['profile_category'], 'community')
         self.assertEqual(func_profile_data['profile_type'], 'Amplicon')
         self.assertCountEqual(data_ids, func_profile_data['data']['col_ids'])
+        self.assert_profile_summary(func_profile_data,
+                                    self.profile_importer._file_to_df(profile_file_path))
 
         # import organism profile
         params = {'workspace_id': self.wsId,
@@ -173,12 +599,15 @@ class FunctionalProfileUtilTest(unittest.TestCase):
 
         expected_keys = ['profile_category', 'profile_type',
                          'data_epistemology', 'epistemology_method',
-                         'base_object_ref', 'data', 'row_attributemapping_ref']
+                         'base_object_ref', 'data', 'summary',
+                         'row_attributemapping_ref']
         self.assertCountEqual(func_profile_data.keys(), expected_keys)
 
         self.assertEqual(func_profile_data['profile_category'], 'organism')
         self.assertEqual(func_profile_data['profile_type'], 'Amplicon')
         self.assertCountEqual(data_ids, func_profile_data['data']['row_ids'])
+        self.assert_profile_summary(func_profile_data,
+                                    self.profile_importer._file_to_df(profile_file_path).T)
 
         self.assertEqual(func_profile_data['data_epistemology'], 'predicted')
         self.assertEqual(func_profile_data['epistemology_method'], 'FAPROTAX')
@@ -208,7 +637,479 @@ class FunctionalProfileUtilTest(unittest.TestCase):
             with patch.object(DataFileUtil, "get_objects", side_effect=self.mock_get_objects):
                 self.serviceImpl.import_func_profile(self.ctx, params)
 
-    def test_import_func_profile_real_test(self):
+    @patch.object(Workspace, "get_objects2", side_effect=mock_get_objects2)
+    @patch.object(DataFileUtil, "save_objects", side_effect=mock_save_objects)
+    def test_import_func_profiles(self, save_objects, get_objects2):
+        fake_object_ref = self.createAnObject()
+
+        profile = {'base_object_ref': fake_object_ref,
+                   'profile_type': 'Amplicon',
+                   'data_epistemology': 'predicted',
+                   'epistemology_method': 'FAPROTAX'}
+        params = {'workspace_id': self.wsId,
+                  'profiles': [dict(profile,
+                                    func_profile_obj_name='test_func_profile_community',
+                                    profile_file_path=os.path.join('data', 'func_table.tsv'),
+                                    profile_category='community'),
+                               dict(profile,
+                                    func_profile_obj_name='test_func_profile_extra_col',
+                                    profile_file_path=os.path.join('data',
+                                                                   'func_table_extra_col.tsv'),
+                                    profile_category='organism')]}
+        results = self.serviceImpl.import_func_profiles(self.ctx, params)[0]['results']
+
+        # base object is fetched once for both profiles
+        get_objects2.assert_called_once()
+        save_objects.assert_called_once()
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['func_profile_obj_name'], 'test_func_profile_community')
+        self.assertIn('func_profile_ref', results[0])
+        self.assertNotIn('error', results[0])
+        self.assertNotIn('func_profile_ref', results[1])
+        self.assertRegex(results[1]['error'], 'Matrix row does not')
+
+    def test_stage_timer(self):
+        timer = StageTimer()
+        with timer.span('parse', bytes_in=10) as span:
+            values = [0.0] * 1000000
+            span['bytes_out'] = len(values)
+
+        with self.assertRaises(ValueError):
+            with timer.span('save'):
+                raise ValueError('failed save')
+
+        timings = timer.summary()
+        self.assertEqual([timing['stage'] for timing in timings], ['parse', 'save'])
+        self.assertEqual(timings[0]['bytes_in'], 10)
+        self.assertEqual(timings[0]['bytes_out'], 1000000)
+        for timing in timings:
+            self.assertGreaterEqual(timing['wall_time'], 0)
+            self.assertGreaterEqual(timing['cpu_time'], 0)
+            self.assertGreaterEqual(timing['peak_rss_delta'], 0)
+
+        trace_path = timer.write_trace(os.path.join(self.scratch, 'import_trace.json'))
+        with open(trace_path) as trace_file:
+            self.assertEqual(json.load(trace_file)['stages'], timings)
+
+    @patch.object(Workspace, "get_objects2", side_effect=mock_get_objects2)
+    @patch.object(DataFileUtil, "save_objects")
+    def test_import_func_profile_timings(self, save_objects, get_objects2):
+        save_objects.return_value = [[1, 'test_func_profile', None, None, 1, None, self.wsId]]
+        params = {'workspace_id': self.wsId,
+                  'func_profile_obj_name': 'test_func_profile',
+                  'base_object_ref': self.createAnObject(),
+                  'profile_file_path': os.path.join('data', 'func_table.tsv'),
+                  'profile_type': 'Amplicon',
+                  'profile_category': 'organism',
+                  'include_timings': 1}
+        returnVal = self.serviceImpl.import_func_profile(self.ctx, params)[0]
+
+        self.assertEqual([timing['stage'] for timing in returnVal['timings']],
+                         ['fetch_base_object', 'download', 'parse', 'check_ids', 'transpose',
+                          'summarize', 'estimate_size', 'save'])
+
+        params.pop('include_timings')
+        returnVal = self.serviceImpl.import_func_profile(self.ctx, params)[0]
+        self.assertNotIn('timings', returnVal)
+
+    @patch.object(Workspace, "get_objects2", side_effect=mock_get_objects2)
+    @patch.object(DataFileUtil, "save_objects")
+    def test_import_func_profile_columnar(self, save_objects, get_objects2):
+        save_objects.return_value = [[1, 'test_func_profile', None, None, 1, None, self.wsId]]
+        profile_file_path = os.path.join('data', 'func_table.tsv')
+        params = {'workspace_id': self.wsId,
+                  'func_profile_obj_name': 'test_func_profile',
+                  'base_object_ref': self.createAnObject(),
+                  'profile_file_path': profile_file_path,
+                  'profile_type': 'Amplicon',
+                  'profile_category': 'community',
+                  'storage_mode': 'columnar'}
+        self.serviceImpl.import_func_profile(self.ctx, params)
+
+        matrix_data = save_objects.call_args[0][0]['objects'][0]['data']['data']
+        self.assertNotIn('values', matrix_data)
+        self.assertEqual(matrix_data['columnar_values']['file_format'], 'parquet')
+
+        df = self.profile_importer._file_to_df(profile_file_path)
+        profile_data = self.profile_importer._load_profile_data(matrix_data)
+        self.assertEqual(profile_data.row_ids, df.index.tolist())
+        self.assertEqual(profile_data.values.tolist(), df.values.tolist())
+
+        with self.assertRaisesRegex(ValueError, "as storage mode"):
+            self.serviceImpl.import_func_profile(self.ctx, dict(params, storage_mode='csv'))
+
+    @patch.object(DataFileUtil, "save_objects")
+    def test_save_func_profile_columnar_fallback(self, save_objects):
+        save_objects.return_value = [[1, 'test_func_profile', None, None, 1, None, self.wsId]]
+        np.random.seed(0)
+        df = pd.DataFrame(np.random.rand(100, 100),
+                          index=['row_{}'.format(i) for i in range(100)],
+                          columns=['col_{}'.format(i) for i in range(100)])
+        profile_file_path = os.path.join(self.scratch, 'random_profile.tsv')
+        df.to_csv(profile_file_path, sep='\t')
+
+        def save_columnar_values(col_ids, matrices, func_profile_obj_name, timer=None):
+            row_ids = [row_id for matrix in matrices for row_id in matrix.row_ids]
+            return row_ids, {'values_handle': 'KBH_1', 'file_format': 'parquet',
+                             'compression': 'zstd'}
+
+        importer_module = 'FunctionalProfileUtil.Utils.ProfileImporter.'
+        with patch(importer_module + 'MAX_OBJECT_SIZE', 100000), \
+                patch(importer_module + 'DFU_SAVE_SIZE_LIMIT', 50000), \
+                patch(importer_module + 'columnar_available', return_value=True), \
+                patch.object(self.profile_importer, '_save_columnar_values',
+                             side_effect=save_columnar_values) as save_columnar:
+            # estimate is above the limit while the lower bound is not
+            func_profile_data = {'data': FloatMatrix2D.from_df(df)}
+            estimate, lower_bound, _ = self.profile_importer._estimate_object_size(
+                                                                        func_profile_data)
+            self.assertTrue(lower_bound < 100000 < estimate)
+            self.profile_importer._save_func_profile(self.wsId, func_profile_data,
+                                                     'columnar_fallback')
+            self.assertEqual(save_columnar.call_count, 1)
+            matrix_data = save_objects.call_args[0][0]['objects'][0]['data']['data']
+            self.assertEqual(matrix_data['row_ids'], df.index.tolist())
+            self.assertIn('columnar_values', matrix_data)
+
+            # estimate below the limit, exact JSON size above it
+            with patch.object(self.profile_importer, '_estimate_object_size',
+                              return_value=(50000, 40000, 60000)):
+                self.profile_importer._save_func_profile(self.wsId, func_profile_data,
+                                                         'columnar_fallback')
+            self.assertEqual(save_columnar.call_count, 2)
+            matrix_data = save_objects.call_args[0][0]['objects'][0]['data']['data']
+            self.assertIn('columnar_values', matrix_data)
+
+            # streamed JSON turns out larger than the file size suggests
+            with patch(importer_module + 'JSON_SIZE_FACTOR', 0), \
+                    patch.object(self.profile_importer, 'memory_budget', 10 * 100 * 64):
+                self.profile_importer._stream_func_profile(self.wsId, {}, profile_file_path,
+                                                           None, 'community',
+                                                           'columnar_fallback')
+            self.assertEqual(save_columnar.call_count, 3)
+            obj_data = save_objects.call_args[0][0]['objects'][0]['data']
+            self.assertEqual(obj_data['data']['row_ids'], df.index.tolist())
+            self.assertIn('columnar_values', obj_data['data'])
+            self.assertEqual(obj_data['summary']['rows']['count'], [100] * 100)
+
+        self.assertFalse([file_name for file_name in os.listdir(self.scratch)
+                          if file_name.startswith('columnar_fallback_')])
+
+    @patch.object(DataFileUtil, "save_objects")
+    def test_stream_func_profile(self, save_objects):
+        save_objects.return_value = [[1, 'test_func_profile', None, None, 1, None, self.wsId]]
+        profile_file_path = os.path.join('data', 'func_table_trans.tsv')
+
+        # budget for 2 rows per chunk
+        with patch.object(self.profile_importer, 'memory_budget', 2 * 9 * 64), \
+                patch.object(self.profile_importer, 'heatmap_max_rows', 3), \
+                patch.object(self.profile_importer, 'heatmap_max_cols', 4):
+            self.assertTrue(self.profile_importer._should_stream(profile_file_path))
+            func_profile_ref, summary, preview_builder = \
+                self.profile_importer._stream_func_profile(self.wsId,
+                                                           {'profile_category': 'organism'},
+                                                           profile_file_path, DATA_IDS,
+                                                           'organism', 'test_func_profile',
+                                                           build_report=True)
+
+        self.assertEqual(func_profile_ref, '{}/1/1'.format(self.wsId))
+        obj_data = save_objects.call_args[0][0]['objects'][0]['data']
+        self.assertEqual(obj_data['profile_category'], 'organism')
+
+        profile_data = FloatMatrix2D.from_dict(obj_data['data'])
+        expected_data = self.profile_importer._parse_profile_data(profile_file_path, DATA_IDS,
+                                                                  'organism')
+        self.assertEqual(profile_data.row_ids, expected_data.row_ids)
+        self.assertEqual(profile_data.col_ids, expected_data.col_ids)
+        self.assertTrue((profile_data.values == expected_data.values).all())
+        self.assertEqual(obj_data['summary']['rows'], summarize(expected_data)['rows'])
+        self.assertEqual(summary, obj_data['summary'])
+
+        # the report preview is collected while streaming, the object is not read back
+        preview, description = preview_builder.preview(summary)
+        expected_preview, expected_description = heatmap_preview(expected_data, summary,
+                                                                 max_rows=3, max_cols=4)
+        self.assertEqual(preview.row_ids, expected_preview.row_ids)
+        self.assertEqual(preview.col_ids, expected_preview.col_ids)
+        self.assertEqual(preview.values.tolist(), expected_preview.values.tolist())
+        self.assertEqual(description, expected_description)
+
+        output_directory = os.path.join(self.scratch, 'visualization_streamed')
+        heatmap_dir = os.path.join(self.scratch, 'fake_heatmap')
+        os.makedirs(output_directory, exist_ok=True)
+        os.makedirs(heatmap_dir, exist_ok=True)
+        with patch.object(kb_GenericsReport, "build_heatmap_html",
+                          return_value={'html_dir': heatmap_dir}), \
+                patch.object(DataFileUtil, "get_objects") as get_objects:
+            visualization_content = self.profile_importer._generate_visualization_content(
+                                                        func_profile_ref, output_directory,
+                                                        summary=summary,
+                                                        preview_builder=preview_builder)
+        get_objects.assert_not_called()
+        self.assertIn('Profile Size: 8 x 9', visualization_content)
+
+        # transposed profile is transposed in the matrix cache
+        with patch.object(self.profile_importer, 'memory_budget', 2 * 9 * 64):
+            _, _, preview_builder = self.profile_importer._stream_func_profile(
+                                                    self.wsId, {},
+                                                    os.path.join('data', 'func_table.tsv'),
+                                                    DATA_IDS, 'organism', 'test_func_profile')
+        self.assertIsNone(preview_builder)
+
+        obj_data = save_objects.call_args[0][0]['objects'][0]['data']
+        profile_data = FloatMatrix2D.from_dict(obj_data['data'])
+        self.assertEqual(profile_data.row_ids, expected_data.row_ids)
+        # both files hold the same values up to float rounding
+        self.assertTrue(np.allclose(profile_data.values, expected_data.values))
+
+        # rows and columns both match, organism profiles keep rows like the in-memory import
+        square_df = pd.DataFrame(np.arange(16, dtype=float).reshape(4, 4),
+                                 index=DATA_IDS[:4], columns=DATA_IDS[4:8])
+        square_path = os.path.join(self.scratch, 'square_profile.tsv')
+        square_df.to_csv(square_path, sep='\t')
+        expected_data = self.profile_importer._parse_profile_data(square_path, DATA_IDS,
+                                                                  'organism')
+        with patch.object(self.profile_importer, 'memory_budget', 2 * 4 * 64):
+            self.profile_importer._stream_func_profile(self.wsId, {}, square_path, DATA_IDS,
+                                                       'organism', 'test_func_profile')
+        obj_data = save_objects.call_args[0][0]['objects'][0]['data']
+        self.assertEqual(obj_data['data']['row_ids'], DATA_IDS[:4])
+        self.assertEqual(obj_data['data']['row_ids'], expected_data.row_ids)
+        self.assertEqual(obj_data['data']['values'], expected_data.values.tolist())
+
+        with self.assertRaisesRegex(ValueError, 'Matrix row does not contain all data ids'):
+            self.profile_importer._stream_func_profile(self.wsId, {}, square_path, DATA_IDS[:2],
+                                                       'organism', 'test_func_profile')
+
+    def test_export_func_profile(self):
+        df = self.profile_importer._file_to_df(os.path.join('data', 'func_table.tsv'))
+        profile_data = FloatMatrix2D.from_df(df)
+        exported_dir = os.path.join(self.scratch, 'exported_profiles')
+        os.makedirs(exported_dir, exist_ok=True)
+
+        def mock_file_to_shock(params):
+            shutil.copy2(params['file_path'], exported_dir)
+            return {'shock_id': 'fake_shock_id'}
+
+        profile_exporter = self.serviceImpl.profile_exporter
+        biom_axes = list()
+        for sparse, ws_url in itertools.product([False, True],
+                                               [self.cfg['workspace-url'], None]):
+            profile_data.sparse = sparse
+            func_profile = {'info': [1, 'test_func_profile'],
+                            'data': {'profile_category': 'community',
+                                     'data': profile_data.to_dict()}}
+            included_paths = list()
+
+            def get_profile_subset(params):
+                included = params['objects'][0]['included']
+                included_paths.append(included)
+                return {'data': [{'info': func_profile['info'],
+                                  'data': self.apply_included_paths(func_profile['data'],
+                                                                    included)}]}
+
+            # 2 rows per chunk, the whole matrix is never built
+            with patch.object(profile_exporter, 'ws_url', ws_url), \
+                    patch.object(profile_exporter, '_ws', None), \
+                    patch.object(Workspace, "get_objects2", side_effect=get_profile_subset), \
+                    patch.object(DataFileUtil, "get_objects",
+                                 return_value={'data': [func_profile]}) as get_objects, \
+                    patch.object(DataFileUtil, "file_to_shock", side_effect=mock_file_to_shock), \
+                    patch('FunctionalProfileUtil.Utils.ProfileExporter.EXPORT_CHUNK_CELLS', 16), \
+                    patch.object(FloatMatrix2D, 'from_dict', side_effect=AssertionError):
+                tsv_output = self.serviceImpl.export_func_profile(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'file_format': 'tsv'})[0]
+                gzip_output = self.serviceImpl.export_func_profile(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'file_format': 'tsv', 'gzip': 1})[0]
+                parquet_output = self.serviceImpl.export_func_profile(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'file_format': 'parquet'})[0]
+                biom_output = self.serviceImpl.export_func_profile(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'file_format': 'biom'})[0]
+
+            # with a workspace-url values are fetched in row blocks by included paths
+            self.assertEqual(get_objects.called, ws_url is None)
+            self.assertEqual(bool(included_paths), ws_url is not None)
+            for included in included_paths:
+                if 'data/row_ids' in included:
+                    continue
+                if not sparse:
+                    self.assertTrue(len(included) <= 2)
+                    self.assertTrue(all(re.match(r'^data/values/\d+$', path)
+                                        for path in included))
+                elif included != ['data/sparse_values/indices', 'data/sparse_values/values']:
+                    self.assertTrue(all(re.match(r'^data/sparse_values/(indices|values)/\d+$',
+                                                 path) for path in included))
+
+            self.assertEqual(tsv_output['file_name'], 'test_func_profile.tsv')
+            self.assertEqual(gzip_output['file_name'], 'test_func_profile.tsv.gz')
+            for output in [tsv_output, gzip_output]:
+                exported_df = pd.read_csv(os.path.join(exported_dir, output['file_name']),
+                                          sep='\t', index_col=0)
+                self.assertEqual(exported_df.index.tolist(), df.index.tolist())
+                self.assertEqual(exported_df.values.tolist(), df.values.tolist())
+
+            exported_df = pd.read_parquet(os.path.join(exported_dir,
+                                                       parquet_output['file_name']))
+            self.assertEqual(exported_df['row_id'].tolist(), df.index.tolist())
+            self.assertEqual(exported_df[df.columns].values.tolist(), df.values.tolist())
+
+            with h5py.File(os.path.join(exported_dir, biom_output['file_name']), 'r') as biom:
+                self.assertEqual(biom.attrs['shape'].tolist(), list(df.shape))
+                self.assertEqual(biom.attrs['nnz'], (df.values != 0).sum())
+                self.assertEqual(biom['observation/matrix/indptr'][-1], biom.attrs['nnz'])
+                self.assertEqual(biom['sample/matrix/indptr'][-1], biom.attrs['nnz'])
+                biom_axes.append({'{}/{}'.format(axis, name): biom[axis][name][:].tolist()
+                                  for axis in ['observation', 'sample']
+                                  for name in ['ids', 'matrix/data', 'matrix/indices',
+                                               'matrix/indptr']})
+
+        # sparse values are written straight from their CSR arrays, with the same content
+        for axes in biom_axes[1:]:
+            self.assertEqual(axes, biom_axes[0])
+
+        with self.assertRaisesRegex(ValueError, "as file format"):
+            self.serviceImpl.export_func_profile(self.ctx, {'func_profile_ref': '1/2/3',
+                                                            'file_format': 'xlsx'})
+
+    def assert_profile_summary(self, func_profile_data, df):
+        # the stored summary matches pandas statistics of the imported matrix
+        df = df.loc[func_profile_data['data']['row_ids'], func_profile_data['data']['col_ids']]
+        for axis, axis_df in [('rows', df), ('cols', df.T)]:
+            axis_summary = func_profile_data['summary'][axis]
+            self.assertEqual(axis_summary['count'], axis_df.notna().sum(axis=1).tolist())
+            for field, expected in [('min', axis_df.min(axis=1)),
+                                    ('max', axis_df.max(axis=1)),
+                                    ('mean', axis_df.mean(axis=1)),
+                                    ('q1', axis_df.quantile(0.25, axis=1)),
+                                    ('median', axis_df.median(axis=1)),
+                                    ('q3', axis_df.quantile(0.75, axis=1))]:
+                self.assertTrue(np.allclose(np.array(axis_summary[field], dtype=np.float64),
+                                            expected.values, equal_nan=True))
+
+    @staticmethod
+    def apply_included_paths(data, included):
+        # what the workspace returns for included paths, selected array elements are compacted
+        tree = dict()
+        for path in included:
+            node = tree
+            keys = path.split('/')
+            for key in keys[:-1]:
+                node = node.setdefault(key, dict())
+            node[keys[-1]] = True
+
+        def select(value, node):
+            if node is True:
+                return value
+            if isinstance(value, list):
+                return [select(value[int(key)], node[key])
+                        for key in sorted(node, key=int) if int(key) < len(value)]
+            return {key: select(value[key], node[key]) for key in node if key in value}
+
+        return select(data, tree)
+
+    def test_get_func_profile_subset(self):
+        df = self.profile_importer._file_to_df(os.path.join('data', 'func_table.tsv'))
+        profile_data = FloatMatrix2D.from_df(df)
+        row_ids = df.index.tolist()
+        col_ids = df.columns.tolist()
+        included_paths = list()
+
+        for sparse in [False, True]:
+            profile_data.sparse = sparse
+            func_profile = {'profile_category': 'community', 'data': profile_data.to_dict()}
+
+            def mock_get_objects2(params):
+                included = params['objects'][0]['included']
+                included_paths.append(included)
+                return {'data': [{'data': self.apply_included_paths(func_profile, included)}]}
+
+            self.serviceImpl.profile_subsetter._id_indexes.clear()
+            with patch.object(Workspace, "get_objects2", side_effect=mock_get_objects2):
+                subset = self.serviceImpl.get_func_profile_subset(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'row_ids': [row_ids[2], row_ids[0], row_ids[2]],
+                                               'col_ids': [col_ids[1]]})[0]
+                self.assertEqual(subset['row_ids'], [row_ids[2], row_ids[0]])
+                self.assertEqual(subset['col_ids'], [col_ids[1]])
+                self.assertEqual(subset['row_indices'], [2, 0])
+                self.assertEqual(subset['col_indices'], [1])
+                self.assertEqual(subset['values'], df.iloc[[2, 0], [1]].values.tolist())
+                # ids first, then only the selected values
+                self.assertIn('data/row_ids', included_paths[0])
+                self.assertTrue(all(path.startswith('data/values/') or
+                                    path.startswith('data/sparse_values/')
+                                    for included in included_paths[1:] for path in included))
+
+                subset = self.serviceImpl.get_func_profile_subset(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'row_range': [1, 3],
+                                               'col_regex': '^{}$'.format(col_ids[0])})[0]
+                self.assertEqual(subset['row_ids'], row_ids[1:3])
+                self.assertEqual(subset['col_ids'], [col_ids[0]])
+                self.assertEqual(subset['values'], df.iloc[1:3, [0]].values.tolist())
+                # the id index of versioned refs is cached
+                self.assertEqual(sum('data/row_ids' in included for included in included_paths),
+                                 1)
+
+                with self.assertRaisesRegex(ValueError, "Unknown row ids"):
+                    self.serviceImpl.get_func_profile_subset(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'row_ids': ['fake_row_id']})
+                with self.assertRaisesRegex(ValueError, "only one of col_ids"):
+                    self.serviceImpl.get_func_profile_subset(
+                                    self.ctx, {'func_profile_ref': '1/2/3',
+                                               'col_ids': [col_ids[0]], 'col_range': [0, 1]})
+            del included_paths[:]
+
+    def test_matrix_cache(self):
+        matrix_cache = MatrixCache(self.scratch)
+        matrix = FloatMatrix2D(['row_1', 'row_2', 'row_3'], ['col_1', 'col_2'],
+                               [[0, 1], [None, 2], [3, 0]])
+
+        cached_matrix = matrix_cache.cache(matrix)
+        self.assertFalse(cached_matrix.values.flags.writeable)
+        self.assertEqual(cached_matrix.to_dict(), matrix.to_dict())
+
+        transposed_matrix = matrix_cache.transpose(cached_matrix)
+        self.assertEqual(transposed_matrix.to_dict(), matrix.transpose().to_dict())
+
+        name, writer = matrix_cache.writer(matrix.col_ids)
+        writer.append(FloatMatrix2D(['row_1'], ['col_1', 'col_2'], [[0, 1]]))
+        writer.append(FloatMatrix2D(['row_2', 'row_3'], ['col_1', 'col_2'], [[None, 2], [3, 0]]))
+        writer.close()
+        self.assertEqual(matrix_cache.get(name).to_dict(), matrix.to_dict())
+
+        # text files are parsed into the cache in chunks of 2 rows, never as a whole DataFrame
+        profile_file_path = os.path.join('data', 'func_table.tsv')
+        df = self.profile_importer._file_to_df(profile_file_path)
+        with patch('FunctionalProfileUtil.Utils.ProfileImporter.PARSE_CHUNK_CELLS',
+                   2 * len(df.columns)), \
+                patch.object(ProfileImporter, '_file_to_df') as file_to_df:
+            cached_matrix = ProfileImporter._parse_profile_data(profile_file_path, None, None,
+                                                                matrix_cache=matrix_cache)
+            file_to_df.assert_not_called()
+
+            ragged_path = os.path.join(self.scratch, 'ragged_cache.tsv')
+            with open(ragged_path, 'w') as f:
+                f.write('id\tcol_1\tcol_2\nrow_1\t1\t2\nrow_2\t3\t4\nrow_3\t1\t2\t3\n')
+            with self.assertRaisesRegex(ValueError, 'Cannot parse file'):
+                ProfileImporter._parse_profile_data(ragged_path, None, None,
+                                                    matrix_cache=matrix_cache)
+        self.assertFalse(cached_matrix.values.flags.writeable)
+        self.assertEqual(cached_matrix.row_ids, df.index.tolist())
+        self.assertEqual(cached_matrix.col_ids, df.columns.tolist())
+        self.assertTrue(np.array_equal(cached_matrix.values, df.values, equal_nan=True))
+
+        # entries are removed from disk once mapped
+        self.assertEqual(os.listdir(matrix_cache.cache_dir), [])
+
+    @patch.object(Workspace, "get_objects2", side_effect=mock_get_objects2)
+    def test_import_func_profile_real_test(self, get_objects2):
 
         data_ids = ['PB-Low-5', 'PB-High-5', 'PB-Low-6', 'PB-High-6',
                     'PB-Low-7', 'PB-High-7', 'PB-Low-8', 'PB-High-8']
@@ -234,20 +1135,22 @@ class FunctionalProfileUtilTest(unittest.TestCase):
 
         expected_keys = ['profile_category', 'profile_type',
                          'data_epistemology', 'epistemology_method',
-                         'base_object_ref', 'data', 'row_attributemapping_ref']
+                         'base_object_ref', 'data', 'summary',
+                         'row_attributemapping_ref']
         self.assertCountEqual(func_profile_data.keys(), expected_keys)
 
         self.assertEqual(func_profile_data['profile_category'], 'organism')
         self.assertEqual(func_profile_data['profile_type'], 'Amplicon')
         self.assertCountEqual(data_ids, func_profile_data['data']['row_ids'])
+        self.assert_profile_summary(func_profile_data,
+                                    self.profile_importer._file_to_df(profile_file_path))
 
         self.assertEqual(func_profile_data['data_epistemology'], 'predicted')
         self.assertEqual(func_profile_data['epistemology_method'], 'FAPROTAX')
 
         # import profile large size
-        MB_300 = 300 * 1024 * 1024
         with patch.object(DataFileUtil, "get_objects", side_effect=self.mock_get_objects):
-            with patch.object(ProfileImporter, "_calculate_object_size", return_value=MB_300):
+            with patch('FunctionalProfileUtil.Utils.ProfileImporter.DFU_SAVE_SIZE_LIMIT', 0):
                 func_profile_ref = self.serviceImpl.import_func_profile(
                                                                     self.ctx,
                                                                     params)[0]['func_profile_ref']
@@ -257,12 +1160,15 @@ class FunctionalProfileUtilTest(unittest.TestCase):
 
         expected_keys = ['profile_category', 'profile_type',
                          'data_epistemology', 'epistemology_method',
-                         'base_object_ref', 'data', 'row_attributemapping_ref']
+                         'base_object_ref', 'data', 'summary',
+                         'row_attributemapping_ref']
         self.assertCountEqual(func_profile_data.keys(), expected_keys)
 
         self.assertEqual(func_profile_data['profile_category'], 'organism')
         self.assertEqual(func_profile_data['profile_type'], 'Amplicon')
         self.assertCountEqual(data_ids, func_profile_data['data']['row_ids'])
+        self.assert_profile_summary(func_profile_data,
+                                    self.profile_importer._file_to_df(profile_file_path))
 
         self.assertEqual(func_profile_data['data_epistemology'], 'predicted')
         self.assertEqual(func_profile_data['epistemology_method'], 'FAPROTAX')
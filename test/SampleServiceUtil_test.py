@@ -4,6 +4,7 @@ import time
 import unittest
 from configparser import ConfigParser
 import shutil
+from mock import patch
 
 from FunctionalProfileUtil.FunctionalProfileUtilImpl import FunctionalProfileUtil
 from FunctionalProfileUtil.FunctionalProfileUtilServer import MethodContext
@@ -12,6 +13,7 @@ from FunctionalProfileUtil.authclient import KBaseAuth as _KBaseAuth
 from installed_clients.WorkspaceClient import Workspace
 from installed_clients.DataFileUtilClient import DataFileUtil
 from FunctionalProfileUtil.Utils.SampleServiceUtil import SampleServiceUtil
+from FunctionalProfileUtil.Utils.SampleCache import SampleCache
 from installed_clients.sample_uploaderClient import sample_uploader
 
 
@@ -128,3 +130,49 @@ class SampleServiceTest(unittest.TestCase):
                                  'PB-High-7', 'PB-Low-8', 'PB-High-8']
 
         self.assertCountEqual(data_ids, sample_names_expected)
+
+    def test_resolve_samples(self):
+        sampleservice_util = self.getSampleServiceUtil()
+
+        samples = [{'id': 'sample_{}'.format(i), 'version': 1} for i in range(250)]
+
+        def mock_fetch_sample(sample_id, version=None):
+            if sample_id == 'sample_42':
+                raise RuntimeError('Error from SampleService - no such sample')
+            return {'id': sample_id, 'version': version, 'name': sample_id + '_name'}
+
+        with patch.object(SampleServiceUtil, 'get_samples',
+                          side_effect=RuntimeError('no batch endpoint')), \
+                patch.object(SampleServiceUtil, '_fetch_sample', side_effect=mock_fetch_sample):
+            sample_data, errors = sampleservice_util.resolve_samples(samples)
+
+        self.assertEqual(len(sample_data), 250)
+        self.assertEqual(list(errors.keys()), [42])
+        self.assertIsNone(sample_data[42])
+        self.assertEqual(sample_data[249]['name'], 'sample_249_name')
+        self.assertEqual([sample['id'] for sample in sample_data if sample],
+                         [sample['id'] for sample in samples if sample['id'] != 'sample_42'])
+
+    def test_sample_cache(self):
+        db_path = os.path.join(self.scratch, 'test_sample_cache.sqlite')
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        sample_cache = SampleCache(max_size=2, ttl=0, db_path=db_path)
+        sample = {'id': 'sample_1', 'version': 3, 'name': 'sample_1_name'}
+
+        self.assertIsNone(sample_cache.get('sample_1', version=3))
+        sample_cache.put('sample_1', None, sample)
+
+        # unversioned lookups expire immediately with ttl=0, resolved version never expires
+        time.sleep(0.01)
+        self.assertIsNone(sample_cache.get('sample_1'))
+        self.assertEqual(sample_cache.get('sample_1', version=3), sample)
+
+        # evicted from LRU but still on disk
+        sample_cache.put('sample_2', 1, {'id': 'sample_2', 'version': 1})
+        sample_cache.put('sample_3', 1, {'id': 'sample_3', 'version': 1})
+        self.assertEqual(sample_cache.get('sample_1', version=3), sample)
+
+        self.assertEqual(sample_cache.stats()['memory_hits'], 1)
+        self.assertEqual(sample_cache.stats()['disk_hits'], 1)
+        self.assertEqual(sample_cache.stats()['misses'], 2)
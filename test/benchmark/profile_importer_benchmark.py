@@ -0,0 +1,344 @@
+"""
+Benchmark ProfileImporter stages on synthetic functional profiles
+
+Every case (shape, sparsity, file format, profile category) generates a profile file in a
+scratch directory and runs the stages import_func_profile runs, the streaming import of text
+files as well as parse, validation, summary, size estimate, save and report of the in-memory
+import, in a fresh process against stubbed DataFileUtil, WsLargeDataIO and kb_GenericsReport
+clients, so no KBase services are needed. Results are written as JSON.
+
+usage:
+    python test/benchmark/profile_importer_benchmark.py --output results.json
+    python test/benchmark/profile_importer_benchmark.py --rows 1000 --cols 100 1000 \
+        --sparsity 0.9 --formats tsv --baseline results.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from FunctionalProfileUtil.Utils.ProfileImporter import ProfileImporter  # noqa: E402
+from FunctionalProfileUtil.Utils.ProfileSummary import summarize  # noqa: E402
+from FunctionalProfileUtil.Utils.StageTimer import StageTimer  # noqa: E402
+
+
+DEFAULT_SHAPES = [100, 1000, 10000, 100000]
+DEFAULT_SPARSITY = [0.0, 0.9, 0.99]
+DEFAULT_FORMATS = ['tsv', 'csv', 'xlsx']
+DEFAULT_CATEGORIES = ['community', 'organism']
+# cases above these sizes are skipped, 1e5 x 1e5 cells do not fit on a workstation
+DEFAULT_MAX_CELLS = 10 ** 7
+DEFAULT_MAX_XLSX_CELLS = 10 ** 6
+# excel sheet limits
+XLSX_MAX_ROWS = 1048576
+XLSX_MAX_COLS = 16384
+
+DEFAULT_REGRESSION_THRESHOLD = 1.2
+
+FORMAT_DELIMITERS = {'tsv': '\t', 'csv': ','}
+
+
+class StubDataFileUtil:
+    """
+    DataFileUtil stand-in, save_objects serializes the objects like the real client does
+    """
+
+    def __init__(self):
+        self.saved_bytes = 0
+
+    def save_objects(self, params):
+        infos = list()
+        for obj in params['objects']:
+            self.saved_bytes += len(json.dumps(obj['data']))
+            infos.append([1, obj['name'], obj['type'], None, 1, None, params['id'], None, None,
+                          None, None])
+        return infos
+
+    def file_to_shock(self, params):
+        shock_id = str(uuid.uuid4())
+        return {'shock_id': shock_id, 'handle': {'hid': 'KBH_{}'.format(shock_id)}}
+
+    def download_staging_file(self, params):
+        return {'copy_file_path': params['staging_file_subdir_path']}
+
+
+class StubWsLargeDataIO:
+
+    def __init__(self):
+        self.saved_bytes = 0
+
+    def save_objects(self, params):
+        infos = list()
+        for obj in params['objects']:
+            self.saved_bytes += os.path.getsize(obj['data_json_file'])
+            infos.append([1, obj['name'], obj['type'], None, 1, None, params['id'], None, None,
+                          None, None])
+        return infos
+
+
+class StubReportUtil:
+    """
+    kb_GenericsReport stand-in, build_heatmap_html reads the matrix TSV but renders no heatmap
+    """
+
+    def __init__(self, scratch):
+        self.scratch = scratch
+
+    def build_heatmap_html(self, params):
+        html_dir = os.path.join(self.scratch, 'heatmap_{}'.format(uuid.uuid4()))
+        os.makedirs(html_dir)
+        with open(params['tsv_file_path']) as tsv_file:
+            line_count = sum(1 for _ in tsv_file)
+        with open(os.path.join(html_dir, 'index.html'), 'w') as html_file:
+            html_file.write('<html><body>{} lines</body></html>'.format(line_count))
+        return {'html_dir': html_dir}
+
+
+def generate_profile(n_rows, n_cols, sparsity, profile_category, seed=0):
+    """
+    generate_profile: synthetic functional profile with item ids on the expected axis
+
+    community profiles have sample ids as columns, organism profiles have organism ids as rows.
+    a fraction sparsity of the cells is 0, the rest are abundances with 4 decimals
+
+    returns (profile_df, item_ids)
+    """
+    rng = np.random.RandomState(seed)
+    values = np.round(rng.gamma(0.5, 10.0, size=(n_rows, n_cols)), 4)
+    values[rng.random_sample((n_rows, n_cols)) < sparsity] = 0
+
+    if profile_category == 'community':
+        row_ids = ['function_{}'.format(idx) for idx in range(n_rows)]
+        col_ids = ['sample_{}'.format(idx) for idx in range(n_cols)]
+        item_ids = col_ids
+    else:
+        row_ids = ['organism_{}'.format(idx) for idx in range(n_rows)]
+        col_ids = ['function_{}'.format(idx) for idx in range(n_cols)]
+        item_ids = row_ids
+
+    return pd.DataFrame(values, index=row_ids, columns=col_ids), item_ids
+
+
+def write_profile(profile_df, file_format, output_dir):
+    file_path = os.path.join(output_dir, 'profile.{}'.format(file_format))
+    if file_format == 'xlsx':
+        profile_df.to_excel(file_path, sheet_name='data')
+    else:
+        profile_df.to_csv(file_path, sep=FORMAT_DELIMITERS[file_format])
+
+    return file_path
+
+
+def build_importer(scratch):
+    config = {'SDK_CALLBACK_URL': 'http://localhost',
+              'KB_AUTH_TOKEN': 'benchmark',
+              'scratch': scratch}
+    importer = ProfileImporter(config)
+    importer.dfu = StubDataFileUtil()
+    importer.ws_large_data = StubWsLargeDataIO()
+    importer.report_util = StubReportUtil(scratch)
+
+    return importer
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_case(case, scratch):
+    """
+    run_case: run all stages of one benchmark case, meant to run in a fresh process
+    """
+    case_dir = tempfile.mkdtemp(dir=scratch)
+    try:
+        profile_df, item_ids = generate_profile(case['rows'], case['cols'], case['sparsity'],
+                                                case['category'])
+        try:
+            profile_file_path = write_profile(profile_df, case['format'], case_dir)
+        except ImportError as err:
+            return dict(case, skipped='cannot write {}: {}'.format(case['format'], err))
+        del profile_df
+
+        file_size = os.path.getsize(profile_file_path)
+        cells = case['rows'] * case['cols']
+        importer = build_importer(case_dir)
+        timer = StageTimer()
+        stage_peak_rss = dict()
+
+        # peak RSS only grows, the streaming import runs first so its peak is its own
+        if case['format'] != 'xlsx':
+            with timer.span('_stream_func_profile', bytes_in=file_size) as span:
+                importer._stream_func_profile(1, {'profile_category': case['category']},
+                                              profile_file_path, item_ids, case['category'],
+                                              'benchmark_streamed_profile', build_report=True)
+                span['bytes_out'] = importer.dfu.saved_bytes + importer.ws_large_data.saved_bytes
+            stage_peak_rss['_stream_func_profile'] = _peak_rss()
+            importer.dfu.saved_bytes = importer.ws_large_data.saved_bytes = 0
+
+        with timer.span('_parse_profile_data', bytes_in=file_size):
+            profile_data = importer._parse_profile_data(profile_file_path, item_ids,
+                                                        case['category'],
+                                                        parse_executor=importer.parse_executor,
+                                                        matrix_cache=importer.matrix_cache)
+            profile_data = importer._choose_encoding(profile_data)
+        stage_peak_rss['_parse_profile_data'] = _peak_rss()
+
+        with timer.span('summarize'):
+            summary = summarize(profile_data, sketch_cells=importer.summary_sketch_cells)
+        stage_peak_rss['summarize'] = _peak_rss()
+
+        func_profile_data = {'profile_category': case['category'], 'data': profile_data,
+                             'summary': summary}
+        with timer.span('_estimate_object_size') as span:
+            span['bytes_out'] = importer._estimate_object_size(func_profile_data)[0]
+        stage_peak_rss['_estimate_object_size'] = _peak_rss()
+
+        with timer.span('save') as span:
+            importer._save_func_profile(1, func_profile_data, 'benchmark_profile')
+            span['bytes_out'] = importer.dfu.saved_bytes + importer.ws_large_data.saved_bytes
+        stage_peak_rss['save'] = _peak_rss()
+
+        with timer.span('report'):
+            importer._generate_html_report('1/1/1', profile_data=profile_data,
+                                           summary=summary)
+        stage_peak_rss['report'] = _peak_rss()
+
+        stages = dict()
+        for record in timer.summary():
+            stage = record.pop('stage')
+            wall_time = record['wall_time'] or float('nan')
+            record['cells_per_second'] = cells / wall_time
+            if 'bytes_in' in record:
+                record['mb_per_second'] = record['bytes_in'] / wall_time / 1024 / 1024
+            record['peak_rss'] = stage_peak_rss[stage]
+            stages[stage] = record
+
+        return dict(case, file_size=file_size, sparse=profile_data.sparse, stages=stages)
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+
+
+def build_cases(args):
+    cases = list()
+    for n_rows, n_cols, sparsity, file_format, category in itertools.product(
+                            args.rows, args.cols, args.sparsity, args.formats, args.categories):
+        case = {'rows': n_rows, 'cols': n_cols, 'sparsity': sparsity, 'format': file_format,
+                'category': category}
+        cells = n_rows * n_cols
+        if cells > args.max_cells:
+            case['skipped'] = 'more than {} cells'.format(args.max_cells)
+        elif file_format == 'xlsx' and (cells > args.max_xlsx_cells or
+                                        n_rows >= XLSX_MAX_ROWS or n_cols >= XLSX_MAX_COLS):
+            case['skipped'] = 'too large for xlsx'
+        cases.append(case)
+
+    return cases
+
+
+def find_regressions(results, baseline_results, threshold):
+    """
+    find_regressions: stages whose wall time grew more than threshold times the baseline
+    """
+    def case_key(case):
+        return tuple(case[key] for key in ['rows', 'cols', 'sparsity', 'format', 'category'])
+
+    baseline = {case_key(case): case for case in baseline_results if 'stages' in case}
+    regressions = list()
+    for case in results:
+        baseline_case = baseline.get(case_key(case))
+        if 'stages' not in case or baseline_case is None:
+            continue
+        for stage, record in case['stages'].items():
+            baseline_record = baseline_case['stages'].get(stage)
+            if baseline_record and record['wall_time'] > threshold * baseline_record['wall_time']:
+                regressions.append({'case': case_key(case), 'stage': stage,
+                                    'wall_time': record['wall_time'],
+                                    'baseline_wall_time': baseline_record['wall_time']})
+
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ProfileImporter stages on '
+                                                 'synthetic functional profiles')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SHAPES)
+    parser.add_argument('--cols', type=int, nargs='+', default=DEFAULT_SHAPES)
+    parser.add_argument('--sparsity', type=float, nargs='+', default=DEFAULT_SPARSITY,
+                        help='fraction of zero cells')
+    parser.add_argument('--formats', nargs='+', default=DEFAULT_FORMATS,
+                        choices=DEFAULT_FORMATS)
+    parser.add_argument('--categories', nargs='+', default=DEFAULT_CATEGORIES,
+                        choices=DEFAULT_CATEGORIES)
+    parser.add_argument('--max-cells', type=int, default=DEFAULT_MAX_CELLS)
+    parser.add_argument('--max-xlsx-cells', type=int, default=DEFAULT_MAX_XLSX_CELLS)
+    parser.add_argument('--scratch', default=None, help='directory for generated files')
+    parser.add_argument('--output', default=None, help='JSON result file, default: stdout')
+    parser.add_argument('--baseline', default=None,
+                        help='earlier JSON result file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='wall time ratio to the baseline reported as regression')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scratch = args.scratch or tempfile.mkdtemp(prefix='profile_importer_benchmark_')
+    os.makedirs(scratch, exist_ok=True)
+
+    # fresh interpreter per case so peak RSS is not inherited from earlier cases
+    mp_context = multiprocessing.get_context('spawn')
+    results = list()
+    for case in build_cases(args):
+        if 'skipped' not in case:
+            start_time = time.time()
+            with mp_context.Pool(1) as pool:
+                case = pool.apply(run_case, (case, scratch))
+            print('{rows} x {cols} {format} {category} sparsity {sparsity}: {time:.2f}s'.format(
+                            time=time.time() - start_time, **case), file=sys.stderr)
+        results.append(case)
+
+    report = {'environment': {'python': platform.python_version(),
+                              'numpy': np.__version__,
+                              'pandas': pd.__version__,
+                              'platform': platform.platform(),
+                              'cpu_count': os.cpu_count()},
+              'results': results}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline_results = json.load(baseline_file)['results']
+        report['regressions'] = find_regressions(results, baseline_results, args.threshold)
+        for regression in report['regressions']:
+            print('regression in {case} {stage}: {wall_time:.3f}s, baseline '
+                  '{baseline_wall_time:.3f}s'.format(**regression), file=sys.stderr)
+        exit_code = 1 if report['regressions'] else 0
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if not args.scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())